@@ -1,5 +1,5 @@
-from data_processing.anonymization import (
-    anonymize,
+from data_processing.anonymization.anonymize import (
+    anonymize_dataset,
 )
 
 import hydra
@@ -7,7 +7,7 @@ import hydra
 
 @hydra.main(version_base=None, config_path="./config", config_name="blind_pdpa")
 def main(cfg):
-    anonymize(cfg.train_dataset, cfg.blind_config)
+    anonymize_dataset(cfg.train_dataset, cfg.blind_config)
 
 
 if __name__ == "__main__":
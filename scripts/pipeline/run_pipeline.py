@@ -0,0 +1,23 @@
+from data_processing.pipeline import clean_text, run_pipeline
+
+import hydra
+
+
+@hydra.main(version_base=None, config_path="./config", config_name="pipeline")
+def main(cfg):
+    run_pipeline(
+        clean_text,
+        cfg.train_dataset,
+        cfg.processing,
+        cfg.minhash,
+        cfg.deduplication,
+        cfg.output,
+        cfg.global_config,
+        dataset_groups=cfg.datasets if cfg.processing.decontaminate else None,
+        decontaminate_args=cfg.decontaminate if cfg.processing.decontaminate else None,
+        blind_config=cfg.blind_config if cfg.processing.anonymize else None,
+    )
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
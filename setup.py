@@ -8,5 +8,5 @@ setup(
     install_requires=[
         'numpy==1.24.3', 'pandas==2.0.3', 'tqdm', 'datasets', 'datasketch==1.6.5', 'nlpo3==1.3.0',
         'pytest', 'jsonlines', 'kenlm', 'scipy==1.10.1', 'sentencepiece==0.2.0', 'scikit-learn==1.2.2', 'gdown==5.2.0',
-        "pythainlp>=4.0.0", "python-crfsuite==0.9.10", "hydra-core==1.3.2"],
+        "pythainlp>=4.0.0", "python-crfsuite==0.9.10", "hydra-core==1.3.2", 'orjson', 'zstandard'],
 )
@@ -5,6 +5,11 @@ from pythainlp.tag import NER
 from transformers import AutoTokenizer
 from transformers import AutoModelForTokenClassification
 from pythainlp.tokenize import word_tokenize  # pip install pythainlp
+from datasets import load_dataset, load_from_disk
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from functools import lru_cache
+from typing import List, Optional, Tuple
 import torch
 import argparse
 
@@ -18,37 +23,44 @@ NUMBER_SUB = "<phone_number>"
 EMAIL_SUB = "<email>"
 THAI_ID_SUB = "<id no.>"
 NER_TAG_TRANSFORMER_MODEL = None
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_LENGTH = 512
+DEFAULT_WINDOW_OVERLAP = 128
 
+# Declare regex patterns for sensitive information, compiled once at import
+# ประกาศรูปแบบ regex สำหรับข้อมูลที่เป็นความลับ ซึ่งถูก compile เพียงครั้งเดียว
+PERSON_TAG = re.compile(r'\(*<PERSON>.*?</PERSON>\)*')
+ORG_TAG = re.compile(r'\(*<ORG>.*?</ORG>\)*')
+OTHERS_TAG = re.compile(
+    r'<(?!\/?(?:'+re.escape(PERSON_SUB[1:-1])+r')\b)[^>]*>')
+ID_PATTERN = re.compile(
+    r'\b\d{13}\b|\b\d-\d{4}-\d{5}-\d{2}-\d\b|\b\d\s\d{4}\s\d{5}\s\d{2}\s\d\b')
+NUMBER_PATTERN = re.compile(
+    r'\b\d{10}\b|\b\d-\d{2}-\d{3}-\d{4}-\d\b|\b\d-\d{3}-\d{3}-\d{4}-\d\b|\b\d\s\d{2}\s\d{3}\s\d{4}\s\d\b|\b\d\s\d{3}\s\d{3}\s\d{4}\s\d\b')
+EMAIL_PATTERN = re.compile(
+    "(?:[a-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\\.[a-z0-9!#$%&'*+/=?^_`{|}~-]+)*|\"(?:[\\x01-\\x08\\x0b\\x0c\\x0e-\\x1f\\x21\\x23-\\x5b\\x5d-\\x7f]|\\\\[\\x01-\\x09\\x0b\\x0c\\x0e-\\x7f])*\")@(?:(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\\.)+[a-z0-9](?:[a-z0-9-]*[a-z0-9])?|\\[(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?|[a-z0-9-]*[a-z0-9]:(?:[\\x01-\\x08\\x0b\\x0c\\x0e-\\x1f\\x21-\\x5a\\x53-\\x7f]|\\\\[\\x01-\\x09\\x0b\\x0c\\x0e-\\x7f])+)\\])")
+THAI_ID_PATTERN = re.compile(
+    r"[0–9]-[0–9]{4}-[0–9]{5}-[0–9]{2}-[0–9]")
 
-def anonymize(src_text, ner_corpus=NER_CORPUS, NER_TAG=False):
-    
-    # Declare regex patterns for sensitive information
-    # ประกาศรูปแบบ regex สำหรับข้อมูลที่เป็นความลับ
-    PERSON_TAG = re.compile(r'\(*<PERSON>.*?</PERSON>\)*')
-    ORG_TAG = re.compile(r'\(*<ORG>.*?</ORG>\)*')
-    OTHERS_TAG = re.compile(
-        r'<(?!\/?(?:'+re.escape(PERSON_SUB[1:-1])+r')\b)[^>]*>')
-    ID_PATTERN = re.compile(
-        r'\b\d{13}\b|\b\d-\d{4}-\d{5}-\d{2}-\d\b|\b\d\s\d{4}\s\d{5}\s\d{2}\s\d\b')
-    NUMBER_PATTERN = re.compile(
-        r'\b\d{10}\b|\b\d-\d{2}-\d{3}-\d{4}-\d\b|\b\d-\d{3}-\d{3}-\d{4}-\d\b|\b\d\s\d{2}\s\d{3}\s\d{4}\s\d\b|\b\d\s\d{3}\s\d{3}\s\d{4}\s\d\b')
-    EMAIL_PATTERN = re.compile(
-        "(?:[a-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\\.[a-z0-9!#$%&'*+/=?^_`{|}~-]+)*|\"(?:[\\x01-\\x08\\x0b\\x0c\\x0e-\\x1f\\x21\\x23-\\x5b\\x5d-\\x7f]|\\\\[\\x01-\\x09\\x0b\\x0c\\x0e-\\x7f])*\")@(?:(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\\.)+[a-z0-9](?:[a-z0-9-]*[a-z0-9])?|\\[(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?|[a-z0-9-]*[a-z0-9]:(?:[\\x01-\\x08\\x0b\\x0c\\x0e-\\x1f\\x21-\\x5a\\x53-\\x7f]|\\\\[\\x01-\\x09\\x0b\\x0c\\x0e-\\x7f])+)\\])")
-    THAI_ID_PATTERN = re.compile(
-        r"[0–9]-[0–9]{4}-[0–9]{5}-[0–9]{2}-[0–9]")
+# Cheap signals of likely personal information, documents without any of them skip the NER model
+# สัญญาณของข้อมูลส่วนบุคคล เอกสารที่ไม่พบสัญญาณใดเลยจะไม่ผ่านโมเดล NER
+PRESCREEN_WORDS = (
+    # Person titles
+    "นาย", "นาง", "คุณ", "ด.ช.", "ด.ญ.", "ดร.", "รศ.", "ผศ.", "นพ.", "พญ.", "สมเด็จ", "หม่อม",
+    "พล.", "พ.ต.", "ร.ต.", "Mr.", "Mrs.", "Ms.", "Dr.", "Prof.",
+    # Organization prefixes and suffixes
+    "บริษัท", "จำกัด", "มหาชน", "ห้างหุ้นส่วน", "มหาวิทยาลัย", "โรงเรียน", "โรงพยาบาล", "ธนาคาร",
+    "กระทรวง", "กรม", "สำนักงาน", "สมาคม", "มูลนิธิ", "Co.", "Ltd", "Inc", "Corp",
+)
+# Signals that are patterns rather than words
+PRESCREEN_PATTERN = re.compile(
+    r"\d{4,}"  # digit runs
+    r"|@"
+    r"|[A-Z][a-z]+\s+[A-Z][a-z]+"  # capitalized names
+)
 
-    # If transformer-based NER tagging is enabled, use that
-    # ถ้าใช้ NER ที่ใช้โมเดล transformer ให้เรียกใช้ฟังก์ชันแท็ก NER แบบ transformer
-    if NER_TAG_TRANSFORMER_MODEL is not None or NER_TAG:
-        print("-----NER_TAG")
-        result = ner_tag_transformer(src_text, ner_corpus)
-    else:
-        print("-----Default")
-        # Use default NER tagger
-        # ใช้การแท็ก NER แบบทั่วไป
-        ner = NER(ner_corpus)
-        result = ner.tag(src_text, tag=True, pos=True)
 
+def replace_sensitive_information(result):
     # Replace identified entities and sensitive information with placeholders
     # แทนที่เอนทิตีและข้อมูลที่เป็นความลับที่ระบุด้วยข้อมูลแทนที่
     result = PERSON_TAG.sub(PERSON_SUB, result)
@@ -58,59 +70,10 @@ def anonymize(src_text, ner_corpus=NER_CORPUS, NER_TAG=False):
     result = NUMBER_PATTERN.sub(NUMBER_SUB, result)
     result = EMAIL_PATTERN.sub(EMAIL_SUB, result)
     result = THAI_ID_PATTERN.sub(THAI_ID_SUB, result)
-
-    # Return the anonymized text
-    # ส่งคืนข้อความที่ปกปิดข้อมูลแล้ว
     return result
 
-def ner_tag_transformer(sentence, ner_corpus=NER_TAG_TRANSFORMER_MODEL):
-    # Load the pre-trained tokenizer and model from the specified corpus
-    # โหลด tokenizer และโมเดลที่ฝึกมาแล้วจาก ner_corpus
-    tokenizer = AutoTokenizer.from_pretrained(ner_corpus)
-    model = AutoModelForTokenClassification.from_pretrained(ner_corpus)
-
-    # Tokenize the input sentence while replacing spaces with a placeholder
-    # ทำการแยกคำในประโยคและแทนที่ช่องว่างด้วย "<_>"
-    cut = word_tokenize(sentence.replace(" ", "<_>"))
-    inputs = tokenizer(cut, is_split_into_words=True, return_tensors="pt")
-
-    # Extract input ids and attention mask
-    # ดึงข้อมูล ids และ attention mask จาก input ที่เตรียมไว้
-    ids = inputs["input_ids"]
-    mask = inputs["attention_mask"]
-
-    # Pass inputs through the model (forward pass)
-    # ส่ง input ผ่านโมเดลเพื่อคำนวณ logits
-    outputs = model(ids, attention_mask=mask)
-    logits = outputs[0]
-
-    # Get the predicted token classes (NER labels)
-    # คำนวณค่าการจำแนกประเภทเอนทิตีจาก logits
-    predictions = torch.argmax(logits, dim=2)
-    predicted_token_class = [model.config.id2label[t.item()] for t in predictions[0]]
-
-    # Fix span errors in the NER output
-    # ฟังก์ชันนี้แก้ไขข้อผิดพลาดของช่วงเอนทิตีในผลลัพธ์
-    def fix_span_error(words, ner):
-        _ner = ner
-        _new_tag = []
-        for i, j in zip(words, _ner):
-            # Decode the tokens into human-readable text
-            # แปลงคำที่ถูกแยกออกมาเป็นข้อความที่มนุษย์อ่านได้
-            i = tokenizer.decode(i)
-            if i.isspace() and j.startswith("B-"):
-                j = "O"  # Correct labeling for space tokens
-            if i == '' or i == '<s>' or i == '</s>':
-                continue
-            if i == "<_>":
-                i = " "
-            _new_tag.append((i, j))
-        return _new_tag
-
-    # Fix entity tagging for the sentence
-    # แก้ไขแท็กเอนทิตีสำหรับประโยคที่จำแนกได้
-    sent_ner = fix_span_error(inputs['input_ids'][0], predicted_token_class)
 
+def build_tagged_sentence(sent_ner):
     # Build the final sentence with entity tags
     # สร้างประโยคสุดท้ายที่มีแท็กเอนทิตี
     temp = ""
@@ -130,12 +93,407 @@ def ner_tag_transformer(sentence, ner_corpus=NER_TAG_TRANSFORMER_MODEL):
 
         if idx == len(sent_ner) - 1 and temp != "":
             sent += "</" + temp + ">"
-
-    # Return the sentence with the NER tags inserted
-    # ส่งคืนประโยคที่มีการเพิ่มแท็กเอนทิตี
     return sent
 
 
+def plan_windows(word_starts: List[int], num_tokens: int, window_length: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    This function splits the tokens of a document into overlapping windows of at most `window_length`
+    tokens. Windows are cut on word boundaries, a window is only cut inside a word when the word alone
+    does not fit in it.
+
+    ฟังก์ชันนี้แบ่ง token ของเอกสารเป็นหน้าต่างที่ซ้อนทับกัน ยาวไม่เกิน `window_length` token
+    โดยตัดที่ขอบของคำ ยกเว้นเมื่อคำเดียวยาวเกินหน้าต่าง
+
+    Parameters:
+    word_starts (List[int]): The offset of the first token of each word, in increasing order.
+                             ตำแหน่งของ token แรกของแต่ละคำ เรียงจากน้อยไปมาก
+    num_tokens (int): The number of tokens of the document.
+                      จำนวน token ของเอกสาร
+    window_length (int): The maximum number of tokens of a window.
+                         จำนวน token สูงสุดของหน้าต่าง
+    overlap (int): The number of tokens shared by consecutive windows, at most half a window.
+                   จำนวน token ที่หน้าต่างที่ติดกันใช้ร่วมกัน ไม่เกินครึ่งหนึ่งของหน้าต่าง
+
+    Returns:
+    List[Tuple[int, int]]: The token range [start, end) of each window.
+                           ช่วง token [start, end) ของแต่ละหน้าต่าง
+    """
+    overlap = min(overlap, window_length // 2)
+    windows = []
+    start = 0
+    covered = 0
+    while start < num_tokens:
+        end = min(start + window_length, num_tokens)
+        if end < num_tokens:
+            # Cut before the first word that does not fit, unless no new word would be covered
+            boundary = word_starts[bisect_right(word_starts, end) - 1]
+            if boundary > covered:
+                end = boundary
+        windows.append((start, end))
+        if end == num_tokens:
+            break
+        covered = end
+
+        # The next window starts on the first word boundary inside the overlap
+        next_start = max(end - overlap, start + 1)
+        i = bisect_left(word_starts, next_start)
+        start = word_starts[i] if i < len(word_starts) and word_starts[i] <= end else next_start
+    return windows
+
+
+def window_owners(windows: List[Tuple[int, int]], word_starts: List[int]) -> List[Tuple[int, int]]:
+    """
+    This function assigns every token to exactly one window, so the tags of overlapping windows never
+    conflict. Inside an overlap, the tokens before the word boundary nearest to its middle belong to the
+    earlier window and the others to the later one, so every token is tagged with context on both sides.
+
+    ฟังก์ชันนี้กำหนดให้ทุก token เป็นของหน้าต่างเดียว ในช่วงที่ซ้อนทับกัน token ก่อนขอบของคำที่ใกล้กึ่งกลาง
+    เป็นของหน้าต่างก่อนหน้า และ token ที่เหลือเป็นของหน้าต่างถัดไป
+
+    Returns:
+    List[Tuple[int, int]]: The token range [start, end) owned by each window.
+                           ช่วง token [start, end) ที่เป็นของแต่ละหน้าต่าง
+    """
+    owned = []
+    low = 0
+    for (_, end), (next_start, _) in zip(windows, windows[1:]):
+        middle = (next_start + end) // 2
+        i = bisect_right(word_starts, middle) - 1
+        cut = word_starts[i] if i >= 0 and word_starts[i] >= next_start else middle
+        cut = max(cut, low)
+        owned.append((low, cut))
+        low = cut
+    if windows:
+        owned.append((low, windows[-1][1]))
+    return owned
+
+
+class Anonymizer:
+    """
+    This class loads the NER model once and anonymizes documents in batches. With a transformer
+    model, documents are split into overlapping windows of at most `max_length` tokens, and the windows
+    of a batch are padded into one forward pass under `torch.inference_mode()`, so documents of any
+    length are tagged in full. Use `get_anonymizer` to keep one instance per process.
+
+    คลาสนี้โหลดโมเดล NER เพียงครั้งเดียวและปกปิดข้อมูลของเอกสารทีละชุด หากใช้โมเดล transformer
+    เอกสารจะถูกแบ่งเป็นหน้าต่างที่ซ้อนทับกันยาวไม่เกิน `max_length` token และหน้าต่างในชุดเดียวกันจะถูก pad
+    และส่งผ่านโมเดลในครั้งเดียว ทำให้แท็กเอกสารได้ครบทุกความยาว ใช้ `get_anonymizer` เพื่อเก็บวัตถุไว้หนึ่งชุดต่อ process
+
+    Parameters:
+    ner_corpus (str): The pythainlp NER corpus, or the transformer model name when `transformer` is True.
+                      ชื่อ corpus ของ NER ใน pythainlp หรือชื่อโมเดล transformer
+    transformer (bool): Use a transformer token classification model. (default is False)
+                        ใช้โมเดล transformer ในการแท็ก NER
+    batch_size (int): The number of windows per forward pass. (default is 32)
+                      จำนวนหน้าต่างต่อการส่งผ่านโมเดลหนึ่งครั้ง
+    max_length (int): The maximum number of tokens of a window, including the special tokens.
+                      (default is the max length of the tokenizer, at most 512)
+                      จำนวน token สูงสุดของหน้าต่าง รวม token พิเศษ
+    window_overlap (int): The number of tokens shared by consecutive windows. (default is 128)
+                          จำนวน token ที่หน้าต่างที่ติดกันใช้ร่วมกัน
+    prescreen (bool): Skip the NER model for documents without any signal of personal information, they
+                      only get the regex substitutions. Names without a title, such as "สมชาย ใจดี", and
+                      all-caps organization names are missed by the pre-screen, so it trades recall for
+                      speed. (default is False)
+                      ข้ามโมเดล NER สำหรับเอกสารที่ไม่พบสัญญาณของข้อมูลส่วนบุคคล โดยใช้เพียงการแทนที่ด้วย regex
+                      ชื่อที่ไม่มีคำนำหน้าและชื่อองค์กรตัวพิมพ์ใหญ่จะไม่ถูกตรวจพบ จึงแลกความครบถ้วนกับความเร็ว
+    prescreen_words (Sequence[str]): The literal signals of the pre-screen. (default is `PRESCREEN_WORDS`)
+                                     คำที่ใช้เป็นสัญญาณในการคัดกรอง
+    """
+
+    def __init__(
+        self,
+        ner_corpus=NER_CORPUS,
+        transformer=False,
+        batch_size=DEFAULT_BATCH_SIZE,
+        max_length=None,
+        window_overlap=DEFAULT_WINDOW_OVERLAP,
+        prescreen=False,
+        prescreen_words=None,
+    ):
+        self.ner_corpus = ner_corpus
+        self.transformer = transformer
+        self.batch_size = batch_size
+        self.window_overlap = window_overlap
+        self.prescreen = prescreen
+        self.prescreen_words = tuple(PRESCREEN_WORDS if prescreen_words is None else prescreen_words)
+        # Number of documents that went through the NER model ("ner") or only the regexes ("regex")
+        self.counts = Counter()
+
+        if transformer:
+            # Load the pre-trained tokenizer and model from the specified corpus
+            # โหลด tokenizer และโมเดลที่ฝึกมาแล้วจาก ner_corpus
+            self.tokenizer = AutoTokenizer.from_pretrained(ner_corpus)
+            self.model = AutoModelForTokenClassification.from_pretrained(ner_corpus)
+            self.model.eval()
+            # Decoded text of each token id, the vocabulary is small and fixed
+            self.decoded_tokens = {}
+
+            # Room for the document tokens in a window once the special tokens are added
+            max_length = max_length or min(self.tokenizer.model_max_length, DEFAULT_MAX_LENGTH)
+            self.window_length = max_length - self.tokenizer.num_special_tokens_to_add()
+            # Offset of the first document token in a window, e.g. 1 for <s> ... </s>
+            marker = next(i for i in range(len(self.tokenizer)) if i not in self.tokenizer.all_special_ids)
+            self.content_offset = self.tokenizer.build_inputs_with_special_tokens([marker]).index(marker)
+        else:
+            # Use default NER tagger
+            # ใช้การแท็ก NER แบบทั่วไป
+            self.ner = NER(ner_corpus)
+
+    def decode(self, token_id):
+        if token_id not in self.decoded_tokens:
+            self.decoded_tokens[token_id] = self.tokenizer.decode(token_id)
+        return self.decoded_tokens[token_id]
+
+    def fix_span_error(self, token_ids, ner_tags):
+        # Fix span errors in the NER output
+        # ฟังก์ชันนี้แก้ไขข้อผิดพลาดของช่วงเอนทิตีในผลลัพธ์
+        new_tags = []
+        for token_id, tag in zip(token_ids, ner_tags):
+            # Decode the tokens into human-readable text
+            # แปลงคำที่ถูกแยกออกมาเป็นข้อความที่มนุษย์อ่านได้
+            word = self.decode(token_id)
+            if word.isspace() and tag.startswith("B-"):
+                tag = "O"  # Correct labeling for space tokens
+            if word == '' or word == '<s>' or word == '</s>':
+                continue
+            if word == "<_>":
+                word = " "
+            new_tags.append((word, tag))
+        return new_tags
+
+    def encode_words(self, words: List[str]) -> Tuple[List[int], List[int]]:
+        # Token ids of the words without special tokens, and the offset of the first token of each word
+        encoding = self.tokenizer(words, is_split_into_words=True, add_special_tokens=False, verbose=False)
+        word_ids = encoding.word_ids()
+        word_starts = [i for i, word_id in enumerate(word_ids) if i == 0 or word_id != word_ids[i - 1]]
+        return encoding["input_ids"], word_starts
+
+    def predict_windows(self, windows: List[List[int]]) -> List[List[str]]:
+        """
+        Predict the NER tag of every token of each window, windows of similar length are batched together
+        to keep the padding small.
+        ทำนายแท็ก NER ของทุก token ในแต่ละหน้าต่าง โดยจัดหน้าต่างที่มีความยาวใกล้กันไว้ในชุดเดียวกัน
+        """
+        order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+        tags = [None] * len(windows)
+
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start : start + self.batch_size]
+            inputs = [self.tokenizer.build_inputs_with_special_tokens(windows[i]) for i in batch]
+            width = max(len(ids) for ids in inputs)
+            input_ids = torch.full((len(batch), width), self.tokenizer.pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+            for row, ids in enumerate(inputs):
+                input_ids[row, : len(ids)] = torch.tensor(ids, dtype=torch.long)
+                attention_mask[row, : len(ids)] = 1
+
+            # Pass inputs through the model (forward pass)
+            # ส่ง input ผ่านโมเดลเพื่อคำนวณ logits
+            with torch.inference_mode():
+                logits = self.model(input_ids, attention_mask=attention_mask)[0]
+
+            # Get the predicted token classes (NER labels) of the document tokens
+            # คำนวณค่าการจำแนกประเภทเอนทิตีจาก logits เฉพาะ token ของเอกสาร
+            predictions = torch.argmax(logits, dim=2).tolist()
+            for row, i in enumerate(batch):
+                content = predictions[row][self.content_offset : self.content_offset + len(windows[i])]
+                tags[i] = [self.model.config.id2label[t] for t in content]
+
+        return tags
+
+    def tag_transformer(self, sentences: List[str]) -> List[str]:
+        """
+        Tag the entities of each sentence with the transformer model. Long sentences are split into
+        overlapping windows on word boundaries, the windows of all sentences are tagged in batches and
+        each token keeps the tag of the one window that owns it (see `window_owners`).
+
+        แท็กเอนทิตีของแต่ละประโยคด้วยโมเดล transformer ประโยคที่ยาวจะถูกแบ่งเป็นหน้าต่างที่ซ้อนทับกันตามขอบของคำ
+        และแต่ละ token จะใช้แท็กจากหน้าต่างที่เป็นเจ้าของเพียงหน้าต่างเดียว
+        """
+        # Tokenize the input sentences while replacing spaces with a placeholder
+        # ทำการแยกคำในประโยคและแทนที่ช่องว่างด้วย "<_>"
+        cuts = [word_tokenize(sentence.replace(" ", "<_>")) for sentence in sentences]
+        encodings = [self.encode_words(words) if words else ([], []) for words in cuts]
+        plans = [
+            plan_windows(word_starts, len(token_ids), self.window_length, self.window_overlap)
+            for token_ids, word_starts in encodings
+        ]
+        window_tags = self.predict_windows(
+            [token_ids[start:end] for (token_ids, _), plan in zip(encodings, plans) for start, end in plan]
+        )
+
+        # Stitch the tags of the windows of each sentence back together
+        # รวมแท็กของหน้าต่างของแต่ละประโยคกลับเป็นประโยคเดียว
+        results = []
+        first = 0
+        for (token_ids, word_starts), plan in zip(encodings, plans):
+            ner_tags = [None] * len(token_ids)
+            for k, ((start, _), (low, high)) in enumerate(zip(plan, window_owners(plan, word_starts))):
+                ner_tags[low:high] = window_tags[first + k][low - start : high - start]
+            first += len(plan)
+            results.append(build_tagged_sentence(self.fix_span_error(token_ids, ner_tags)))
+
+        return results
+
+    def tag(self, texts: List[str]) -> List[str]:
+        # Tag the entities of each text with the configured NER model
+        # แท็กเอนทิตีของแต่ละข้อความด้วยโมเดล NER ที่กำหนด
+        if self.transformer:
+            return self.tag_transformer(texts)
+        return [self.ner.tag(text, tag=True, pos=True) for text in texts]
+
+    def screen(self, texts: List[str]) -> List[bool]:
+        # Whether each text shows a signal of personal information and needs the NER model
+        # ตรวจสอบว่าแต่ละข้อความมีสัญญาณของข้อมูลส่วนบุคคลและต้องผ่านโมเดล NER หรือไม่
+        if not self.prescreen:
+            return [True] * len(texts)
+        # A substring search per word is cheaper than one alternation of all the words
+        return [
+            any(word in text for word in self.prescreen_words) or PRESCREEN_PATTERN.search(text) is not None
+            for text in texts
+        ]
+
+    def anonymize_batch(self, texts: List[str], use_ner: Optional[List[bool]] = None) -> List[str]:
+        """
+        Anonymize a batch of documents. Only the documents that pass the pre-screen are tagged by the
+        NER model, the others get the regex substitutions alone, the same result as NER finding no entity.
+        ปกปิดข้อมูลที่เป็นความลับของเอกสารทั้งชุด เฉพาะเอกสารที่ผ่านการคัดกรองเท่านั้นที่ถูกแท็กด้วยโมเดล NER
+
+        Parameters:
+        texts (List[str]): The documents to anonymize.
+                           เอกสารที่ต้องการปกปิดข้อมูล
+        use_ner (List[bool]): The result of `screen` for the documents, computed when not given.
+                              ผลการคัดกรองของเอกสาร หากไม่กำหนดจะคำนวณใหม่
+
+        Returns:
+        List[str]: The anonymized documents.
+                   เอกสารที่ปกปิดข้อมูลแล้ว
+        """
+        if use_ner is None:
+            use_ner = self.screen(texts)
+        tagged = iter(self.tag([text for text, flag in zip(texts, use_ner) if flag]))
+        results = [replace_sensitive_information(next(tagged) if flag else text) for text, flag in zip(texts, use_ner)]
+
+        num_ner = sum(use_ner)
+        self.counts["ner"] += num_ner
+        self.counts["regex"] += len(texts) - num_ner
+        return results
+
+    def anonymize(self, text: str) -> str:
+        return self.anonymize_batch([text])[0]
+
+
+@lru_cache(maxsize=None)
+def get_anonymizer(
+    ner_corpus=NER_CORPUS,
+    transformer=False,
+    batch_size=DEFAULT_BATCH_SIZE,
+    max_length=None,
+    window_overlap=DEFAULT_WINDOW_OVERLAP,
+    prescreen=False,
+    prescreen_words=None,
+) -> Anonymizer:
+    # One anonymizer per process and configuration, the model is loaded on first use
+    return Anonymizer(ner_corpus, transformer, batch_size, max_length, window_overlap, prescreen, prescreen_words)
+
+
+def anonymize(src_text, ner_corpus=NER_CORPUS, NER_TAG=False, prescreen=False):
+    # If transformer-based NER tagging is enabled, use that
+    # ถ้าใช้ NER ที่ใช้โมเดล transformer ให้เรียกใช้ฟังก์ชันแท็ก NER แบบ transformer
+    transformer = NER_TAG_TRANSFORMER_MODEL is not None or NER_TAG
+
+    # Return the anonymized text
+    # ส่งคืนข้อความที่ปกปิดข้อมูลแล้ว
+    return get_anonymizer(ner_corpus, transformer=transformer, prescreen=prescreen).anonymize(src_text)
+
+def ner_tag_transformer(sentence, ner_corpus=NER_TAG_TRANSFORMER_MODEL):
+    # Return the sentence with the NER tags inserted, using the cached model
+    # ส่งคืนประโยคที่มีการเพิ่มแท็กเอนทิตี โดยใช้โมเดลที่โหลดไว้แล้ว
+    return get_anonymizer(ner_corpus, transformer=True).tag_transformer([sentence])[0]
+
+
+def load_pretrain_dataset(dataset_args):
+    if dataset_args.available_on_hub:
+        # โหลดชุดข้อมูลจาก hub
+        return load_dataset(dataset_args.path_name, dataset_args.subset, split="train")
+    # โหลดชุดข้อมูลจาก disk
+    return load_from_disk(dataset_args.path_name)
+
+
+def get_anonymizer_args(blind_config):
+    # The arguments of `get_anonymizer` from the anonymization settings, the defaults fill the missing ones
+    ner_tag_transformer_model = getattr(blind_config, "ner_tag_transformer", None)
+    transformer = bool(ner_tag_transformer_model)
+    ner_corpus = ner_tag_transformer_model if transformer else getattr(blind_config, "ner_corpus", None) or NER_CORPUS
+    batch_size = getattr(blind_config, "batch_size", None) or DEFAULT_BATCH_SIZE
+    max_length = getattr(blind_config, "max_length", None)
+    window_overlap = getattr(blind_config, "window_overlap", None)
+    if window_overlap is None:
+        window_overlap = DEFAULT_WINDOW_OVERLAP
+    prescreen = getattr(blind_config, "prescreen", None)
+    prescreen_words = getattr(blind_config, "prescreen_words", None)
+
+    return {
+        "ner_corpus": ner_corpus,
+        "transformer": transformer,
+        "batch_size": batch_size,
+        "max_length": max_length,
+        "window_overlap": window_overlap,
+        # Off unless enabled, the pre-screen misses names without a title
+        "prescreen": bool(prescreen),
+        # A tuple, the arguments are the cache key of `get_anonymizer`
+        "prescreen_words": None if prescreen_words is None else tuple(prescreen_words),
+    }
+
+
+def anonymize_batch_hf(batch, anonymizer_args):
+    # Expects a batch from `Dataset.map(batched=True)`, `__ner__` records the path taken by each document
+    anonymizer = get_anonymizer(**anonymizer_args)
+    use_ner = anonymizer.screen(batch["text"])
+    return {"text": anonymizer.anonymize_batch(batch["text"], use_ner), "__ner__": use_ner}
+
+
+def anonymize_dataset(dataset_args, blind_config):
+    """
+    This function anonymizes the text column of a whole dataset with `num_proc` worker processes,
+    each loading the NER model once, and saves the result to `blind_config.save_path`.
+
+    ฟังก์ชันนี้ปกปิดข้อมูลในคอลัมน์ข้อความของชุดข้อมูลทั้งหมดด้วย worker จำนวน `num_proc`
+    โดยแต่ละ worker โหลดโมเดล NER เพียงครั้งเดียว และบันทึกผลลัพธ์ที่ `blind_config.save_path`
+
+    Parameters:
+    dataset_args (Namespace): The dataset to anonymize, e.g. its path and whether it is on the hub.
+                              ชุดข้อมูลที่ต้องการปกปิดข้อมูล
+    blind_config (Namespace): The anonymization settings, including the NER model, batch size, window size and number of processes.
+                              การตั้งค่าการปกปิดข้อมูล เช่น โมเดล NER ขนาดชุดเอกสาร และจำนวน process
+
+    Returns:
+    Dataset: The anonymized dataset.
+             ชุดข้อมูลที่ปกปิดข้อมูลแล้ว
+    """
+    anonymizer_args = get_anonymizer_args(blind_config)
+
+    dataset = load_pretrain_dataset(dataset_args)
+    dataset = dataset.map(
+        anonymize_batch_hf,
+        fn_kwargs={"anonymizer_args": anonymizer_args},
+        batched=True,
+        batch_size=anonymizer_args["batch_size"],
+        num_proc=blind_config.num_proc,
+        desc="Anonymizing...",
+    )
+
+    # Report how many documents took each path, the workers' counters do not reach this process
+    num_ner = sum(dataset["__ner__"])
+    print(f"Anonymized {len(dataset)} documents: {num_ner} with NER, {len(dataset) - num_ner} with regex only")
+    dataset = dataset.remove_columns("__ner__")
+
+    dataset.save_to_disk(blind_config.save_path)
+    return dataset
+
+
 def main():
     parser = argparse.ArgumentParser(description='Process anonymization')
 
@@ -150,6 +508,8 @@ def main():
 
     args = parser.parse_args()
 
+    global NER_TAG_TRANSFORMER_MODEL
+
     # Arg parse
     if args.ner_tag_transformer is not None:
         NER_TAG_TRANSFORMER_MODEL = args.ner_tag_transformer
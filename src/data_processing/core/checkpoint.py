@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import shutil
+
+from datasets import load_from_disk, DatasetDict
+
+# Bump whenever the checkpoint layout changes, older checkpoints are then recomputed
+CHECKPOINT_VERSION = 1
+
+CHECKPOINT_META_FILE = "meta.json"
+CHECKPOINT_DATA_DIR = "data"
+CHECKPOINT_SHARDS_DIR = "shards"
+
+
+def stage_key(*parts):
+    # Content hash of the inputs and settings of a stage, any change gives a new key
+    payload = json.dumps([CHECKPOINT_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def dataset_fingerprint(dataset):
+    """
+    Return the fingerprint of a Dataset, or of every split of a DatasetDict. A dataset loaded with
+    `load_from_disk` keeps the fingerprint it was saved with, so it is the same in every job.
+    ส่งคืน fingerprint ของชุดข้อมูล ซึ่งคงที่ทุกครั้งที่โหลดชุดข้อมูลเดิมจากดิสก์
+    """
+    if isinstance(dataset, DatasetDict):
+        return {split: dataset[split]._fingerprint for split in dataset}
+    return dataset._fingerprint
+
+
+class StageCheckpoint:
+    """
+    The checkpoint of one pipeline stage, keyed by the fingerprint of its input and its settings.
+    The output of a completed stage is saved with `save_to_disk`, and meta.json is written last,
+    so a stage interrupted by a pre-empted or timed-out job is never reused. While the stage runs,
+    its `Dataset.map` calls keep one cache file per process under `shards`, and a restarted job only
+    processes the shards that were not complete.
+
+    จุดบันทึกของขั้นตอนหนึ่งใน pipeline โดยใช้ fingerprint ของข้อมูลนำเข้าและการตั้งค่าเป็นคีย์
+    ผลลัพธ์ของขั้นตอนที่เสร็จแล้วจะถูกบันทึก และเขียน meta.json เป็นไฟล์สุดท้าย
+    ระหว่างการประมวลผล `Dataset.map` จะเก็บไฟล์แคชแยกตาม process ทำให้งานที่เริ่มใหม่ประมวลผลเฉพาะส่วนที่ยังไม่เสร็จ
+
+    Parameters:
+    checkpoint_path (str): The directory of the checkpoints of a job.
+                           ไดเรกทอรีของจุดบันทึกทั้งหมดของงาน
+    stage (str): The name of the stage.
+                 ชื่อของขั้นตอน
+    key (str): The key of the stage, from `stage_key`.
+               คีย์ของขั้นตอน
+    data_path (str): Where the output is saved. (default is `<checkpoint_path>/<stage>/data`)
+                     ไดเรกทอรีที่ใช้บันทึกผลลัพธ์
+    """
+
+    def __init__(self, checkpoint_path, stage, key, data_path=None):
+        self.stage = stage
+        self.key = key
+        self.path = os.path.join(checkpoint_path, stage)
+        self.data_path = data_path or os.path.join(self.path, CHECKPOINT_DATA_DIR)
+
+    def load_meta(self):
+        meta_path = os.path.join(self.path, CHECKPOINT_META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as file:
+            return json.load(file)
+
+    def is_done(self):
+        meta = self.load_meta()
+        return (
+            meta is not None
+            and meta.get("version") == CHECKPOINT_VERSION
+            and meta.get("key") == self.key
+            and meta.get("data_path") == self.data_path
+            and os.path.exists(self.data_path)
+        )
+
+    def map_kwargs(self, name, **kwargs):
+        """
+        Keyword arguments of a `Dataset.map` or `Dataset.filter` of the stage. With `num_proc`, every process
+        writes its own cache file, renamed into place once complete, and complete files are loaded again.
+        อาร์กิวเมนต์ของ `Dataset.map` ที่เก็บไฟล์แคชของแต่ละ process ไว้ในจุดบันทึก
+        """
+        shards_path = os.path.join(self.path, CHECKPOINT_SHARDS_DIR, self.key)
+        os.makedirs(shards_path, exist_ok=True)
+        return {
+            **kwargs,
+            "cache_file_name": os.path.join(shards_path, f"{name}.arrow"),
+            "load_from_cache_file": True,
+            "new_fingerprint": f"{self.key}-{name}",
+        }
+
+    def load(self):
+        return load_from_disk(self.data_path)
+
+    def save(self, dataset, num_proc=None):
+        """
+        Save the output of the stage and mark the stage as done.
+        บันทึกผลลัพธ์ของขั้นตอนและระบุว่าขั้นตอนนี้เสร็จแล้ว
+
+        Returns:
+        Dataset: The saved output, memory-mapped from `data_path`.
+                 ผลลัพธ์ที่บันทึกแล้ว เปิดผ่าน mmap
+        """
+        os.makedirs(self.path, exist_ok=True)
+        meta_path = os.path.join(self.path, CHECKPOINT_META_FILE)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        if os.path.exists(self.data_path):
+            shutil.rmtree(self.data_path)
+
+        # save_to_disk writes one shard per process, a shard cannot be empty
+        if num_proc is not None:
+            num_proc = max(1, min(num_proc, len(dataset)))
+        dataset.save_to_disk(self.data_path, num_proc=num_proc)
+
+        # meta.json is written last, a partially saved output is never reused
+        with open(meta_path, "w") as file:
+            json.dump(
+                {
+                    "version": CHECKPOINT_VERSION,
+                    "stage": self.stage,
+                    "key": self.key,
+                    "data_path": self.data_path,
+                    "num_rows": len(dataset),
+                },
+                file,
+            )
+
+        # The per-process cache files are copied into the output, they are not needed any more
+        shutil.rmtree(os.path.join(self.path, CHECKPOINT_SHARDS_DIR), ignore_errors=True)
+
+        return self.load()
+
+
+def get_stage_checkpoint(global_config, stage, key, data_path=None):
+    """
+    Return the checkpoint of a stage under `global_config.checkpoint_path`, or None when checkpoints
+    are not configured.
+    ส่งคืนจุดบันทึกของขั้นตอน หรือ None หากไม่ได้กำหนด `checkpoint_path`
+    """
+    checkpoint_path = getattr(global_config, "checkpoint_path", None)
+    if not checkpoint_path:
+        return None
+    return StageCheckpoint(checkpoint_path, stage, key, data_path)
+
+
+def stage_map_kwargs(checkpoint, name, load_from_cache_file=False, **kwargs):
+    # Keyword arguments of a `Dataset.map` of a stage, the cache setting is unchanged without checkpoint
+    if checkpoint is None:
+        return {**kwargs, "load_from_cache_file": load_from_cache_file}
+    return checkpoint.map_kwargs(name, **kwargs)
+
+
+def run_stage(checkpoint, compute, num_proc=None):
+    """
+    This function returns the output of a stage. A stage completed by an earlier job with the same key is
+    loaded from its checkpoint, otherwise `compute(checkpoint)` runs and its output is saved. Without
+    checkpoint, `compute(None)` runs as before.
+
+    ฟังก์ชันนี้ส่งคืนผลลัพธ์ของขั้นตอน หากงานก่อนหน้าทำขั้นตอนนี้เสร็จแล้วด้วยคีย์เดียวกัน จะโหลดผลลัพธ์จากจุดบันทึก
+    มิฉะนั้นจะเรียก `compute(checkpoint)` และบันทึกผลลัพธ์
+
+    Parameters:
+    checkpoint (StageCheckpoint): The checkpoint of the stage, or None.
+                                  จุดบันทึกของขั้นตอน หรือ None
+    compute (Callable[[StageCheckpoint], Dataset]): The function computing the output of the stage.
+                                                    ฟังก์ชันที่คำนวณผลลัพธ์ของขั้นตอน
+    num_proc (int): The number of processes used to save the output.
+                    จำนวน process ที่ใช้บันทึกผลลัพธ์
+
+    Returns:
+    Dataset: The output of the stage.
+             ผลลัพธ์ของขั้นตอน
+    """
+    if checkpoint is None:
+        return compute(None)
+    if checkpoint.is_done():
+        print(f"Stage {checkpoint.stage} is already done, loading {checkpoint.data_path}")
+        return checkpoint.load()
+    return checkpoint.save(compute(checkpoint), num_proc)
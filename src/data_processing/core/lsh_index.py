@@ -0,0 +1,288 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from tqdm.auto import tqdm
+from datasketch import MinHashLSH
+
+# FNV-1a style constants used to fold each band of a signature into one key
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+INDEX_META_FILE = "meta.json"
+INDEX_KEYS_FILE = "keys.npy"
+INDEX_IDS_FILE = "ids.npy"
+
+# Signature matrices of the datasets in use, opened once per worker process
+SIGNATURE_MATRIX_CACHE = {}
+
+
+def get_hashranges(threshold, num_perm):
+    # Use the same (bands, rows) split that MinHashLSH picks for this threshold
+    return MinHashLSH(threshold=threshold, num_perm=num_perm).hashranges
+
+
+def hashvalues_matrix(hashvalues):
+    """
+    Convert a batch of signatures (list of lists or NumPy array) into a 2-D uint64 matrix.
+    แปลงลายเซ็น MinHash ทั้งชุดให้เป็นเมทริกซ์ uint64 สองมิติ
+    """
+    if isinstance(hashvalues, np.ndarray) and hashvalues.ndim == 2:
+        return hashvalues.astype(np.uint64, copy=False)
+    if len(hashvalues) == 0:
+        return np.empty((0, 0), dtype=np.uint64)
+    return np.vstack([np.asarray(h, dtype=np.uint64) for h in hashvalues])
+
+
+def compute_band_keys(hashvalues, hashranges):
+    """
+    This function folds every LSH band of each signature into a single uint64 key.
+    Two signatures with an identical band always get the same key for that band.
+
+    ฟังก์ชันนี้มีไว้เพื่อย่อแต่ละ band ของลายเซ็น MinHash ให้เป็นคีย์ uint64 เพียงค่าเดียว
+
+    Parameters:
+    hashvalues (np.ndarray): A (n, num_perm) uint64 matrix of MinHash signatures.
+                             เมทริกซ์ลายเซ็น MinHash ขนาด (n, num_perm)
+    hashranges (list of tuple): The (start, end) column range of each band.
+                                ช่วงคอลัมน์ (start, end) ของแต่ละ band
+
+    Returns:
+    np.ndarray: A (n, num_bands) uint64 matrix of band keys.
+                เมทริกซ์คีย์ของแต่ละ band ขนาด (n, num_bands)
+    """
+    hashvalues = hashvalues_matrix(hashvalues)
+    keys = np.empty((len(hashvalues), len(hashranges)), dtype=np.uint64)
+
+    with np.errstate(over="ignore"):
+        for band, (start, end) in enumerate(hashranges):
+            key = np.full(len(hashvalues), FNV_OFFSET, dtype=np.uint64)
+            for column in range(start, end):
+                key = (key ^ hashvalues[:, column]) * FNV_PRIME
+            keys[:, band] = key
+
+    return keys
+
+
+def build_band_index(dataset, threshold, num_perm, index_path, batch_size, key=None):
+    """
+    This function builds a read-only LSH band table from the `hashvalues` column of a dataset.
+    Each band is stored as a sorted key array and the matching row ids in .npy files,
+    so query workers can memory-map the same pages instead of copying a MinHashLSH.
+
+    ฟังก์ชันนี้มีไว้เพื่อสร้างตาราง band ของ LSH แบบอ่านอย่างเดียวจากคอลัมน์ `hashvalues`
+    โดยเก็บคีย์ที่เรียงลำดับแล้วและดัชนีของแถวเป็นไฟล์ .npy เพื่อให้ทุก process ใช้หน่วยความจำร่วมกันผ่าน mmap
+
+    Parameters:
+    dataset (Dataset): A dataset containing MinHash signatures for each document.
+                       ชุดข้อมูลที่มีลายเซ็น MinHash สำหรับแต่ละเอกสาร
+    threshold (float): The Jaccard threshold used to choose the number of bands.
+                       เกณฑ์ Jaccard ที่ใช้เลือกจำนวน band
+    num_perm (int): The number of permutations of the signatures.
+                    จำนวน permutations ของลายเซ็น
+    index_path (str): The directory where the index files are written.
+                      ไดเรกทอรีที่ใช้บันทึกไฟล์ดัชนี
+    batch_size (int): The number of signatures read per batch.
+                      จำนวนลายเซ็นที่อ่านในแต่ละชุด
+    key (str): The key of the indexed signatures, checked by `is_band_index_current`. (default is None)
+               คีย์ของลายเซ็นที่ใช้สร้างดัชนี
+
+    Returns:
+    str: The index directory, ready to be opened with `load_band_index`.
+         ไดเรกทอรีของดัชนีที่พร้อมเปิดด้วย `load_band_index`
+    """
+    hashranges = get_hashranges(threshold, num_perm)
+    num_rows = len(dataset)
+    os.makedirs(index_path, exist_ok=True)
+
+    # meta.json is written last, drop the one of a previous index while the files are rewritten
+    meta_path = os.path.join(index_path, INDEX_META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    keys = np.lib.format.open_memmap(
+        os.path.join(index_path, INDEX_KEYS_FILE),
+        mode="w+",
+        dtype=np.uint64,
+        shape=(len(hashranges), num_rows),
+    )
+    signatures = dataset.with_format("numpy", columns=["hashvalues"])
+
+    for i in tqdm(
+        range(0, num_rows, batch_size),
+        dynamic_ncols=True,
+        desc="Building LSH band index...",
+    ):
+        batch = signatures[i : i + batch_size]["hashvalues"]
+        keys[:, i : i + len(batch)] = compute_band_keys(batch, hashranges).T
+
+    ids = np.lib.format.open_memmap(
+        os.path.join(index_path, INDEX_IDS_FILE),
+        mode="w+",
+        dtype=np.int64,
+        shape=(len(hashranges), num_rows),
+    )
+
+    # Sort every band by key so a lookup is a binary search
+    for band in range(len(hashranges)):
+        order = np.argsort(keys[band], kind="stable")
+        ids[band] = order
+        keys[band] = keys[band][order]
+
+    keys.flush()
+    ids.flush()
+    del keys, ids
+
+    with open(meta_path, "w") as file:
+        json.dump(
+            {
+                "threshold": threshold,
+                "num_perm": num_perm,
+                "num_rows": num_rows,
+                "hashranges": [list(r) for r in hashranges],
+                "key": key,
+            },
+            file,
+        )
+
+    # Drop any stale handle to a previous index at the same path
+    load_band_index.cache_clear()
+
+    return index_path
+
+
+def is_band_index_current(index_path, key):
+    """
+    Check whether the index at `index_path` was completely built with the given key, so a restarted
+    job can query it instead of building it again.
+    ตรวจสอบว่าดัชนีถูกสร้างเสร็จแล้วด้วยคีย์เดียวกัน เพื่อให้งานที่เริ่มใหม่ใช้ดัชนีเดิมได้
+    """
+    meta_path = os.path.join(index_path, INDEX_META_FILE)
+    if key is None or not os.path.exists(meta_path):
+        return False
+    with open(meta_path, "r") as file:
+        return json.load(file).get("key") == key
+
+
+class BandIndex:
+    """
+    A read-only LSH band table opened with mmap, shared by every process on the node.
+    ตาราง band ของ LSH แบบอ่านอย่างเดียวที่เปิดด้วย mmap และใช้ร่วมกันได้ทุก process
+    """
+
+    def __init__(self, index_path):
+        with open(os.path.join(index_path, INDEX_META_FILE), "r") as file:
+            meta = json.load(file)
+
+        self.num_perm = meta["num_perm"]
+        self.threshold = meta["threshold"]
+        self.hashranges = [tuple(r) for r in meta["hashranges"]]
+        self.keys = np.load(os.path.join(index_path, INDEX_KEYS_FILE), mmap_mode="r")
+        self.ids = np.load(os.path.join(index_path, INDEX_IDS_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return self.keys.shape[1]
+
+    def query(self, hashvalues):
+        """
+        Find the candidate row ids sharing at least one band with each query signature.
+        ค้นหาดัชนีของเอกสารที่มี band ตรงกับลายเซ็นที่ต้องการค้นหาอย่างน้อยหนึ่ง band
+
+        Parameters:
+        hashvalues (np.ndarray): A (m, num_perm) matrix of query signatures.
+                                 เมทริกซ์ลายเซ็นที่ต้องการค้นหา
+
+        Returns:
+        list of np.ndarray: The sorted, unique candidate ids for each query.
+                            รายการดัชนีที่ไม่ซ้ำกันของแต่ละลายเซ็น
+        """
+        query_keys = compute_band_keys(hashvalues, self.hashranges)
+        candidates = [[] for _ in range(len(query_keys))]
+
+        for band in range(len(self.hashranges)):
+            band_keys = self.keys[band]
+            left = np.searchsorted(band_keys, query_keys[:, band], side="left")
+            right = np.searchsorted(band_keys, query_keys[:, band], side="right")
+            for j in np.flatnonzero(right > left):
+                candidates[j].append(self.ids[band, left[j] : right[j]])
+
+        return [
+            np.unique(np.concatenate(c)) if c else np.empty(0, dtype=np.int64)
+            for c in candidates
+        ]
+
+
+@lru_cache(maxsize=None)
+def load_band_index(index_path):
+    # One mmap handle per process, the pages themselves live in the shared page cache
+    return BandIndex(index_path)
+
+
+class SignatureMatrix:
+    """
+    A zero-copy (n, num_perm) uint64 view of the `hashvalues` column of a dataset.
+    Each Arrow chunk is exposed as a NumPy matrix over the memory-mapped buffers,
+    so rows can be gathered in batches without building a MinHash per row.
+
+    มุมมองเมทริกซ์ uint64 ของคอลัมน์ `hashvalues` โดยไม่คัดลอกข้อมูลจากไฟล์ Arrow ที่เปิดด้วย mmap
+    """
+
+    def __init__(self, dataset, column="hashvalues"):
+        self.chunks = []
+        for chunk in dataset.data.column(column).chunks:
+            if len(chunk) == 0:
+                continue
+            values = chunk.flatten().to_numpy(zero_copy_only=True)
+            self.chunks.append(values.reshape(len(chunk), -1))
+
+        self.offsets = np.cumsum([0] + [len(chunk) for chunk in self.chunks])
+
+        # Rows of a dataset after select/filter go through an indices mapping
+        self.indices = None
+        if dataset._indices is not None:
+            self.indices = dataset._indices.column(0).to_numpy()
+
+    def __len__(self):
+        if self.indices is not None:
+            return len(self.indices)
+        return int(self.offsets[-1])
+
+    def take(self, row_ids):
+        """
+        Gather the signatures of the given rows into a (len(row_ids), num_perm) matrix.
+        ดึงลายเซ็นของแถวที่ระบุออกมาเป็นเมทริกซ์
+        """
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        if self.indices is not None:
+            row_ids = self.indices[row_ids].astype(np.int64)
+
+        if len(self.chunks) == 1:
+            return self.chunks[0][row_ids]
+
+        num_perm = self.chunks[0].shape[1] if self.chunks else 0
+        result = np.empty((len(row_ids), num_perm), dtype=np.uint64)
+        chunk_ids = np.searchsorted(self.offsets, row_ids, side="right") - 1
+        for chunk_id in np.unique(chunk_ids):
+            rows = chunk_ids == chunk_id
+            result[rows] = self.chunks[chunk_id][row_ids[rows] - self.offsets[chunk_id]]
+        return result
+
+
+def get_signature_matrix(dataset):
+    """
+    Return the `hashvalues` column of a dataset as a SignatureMatrix, built once per process.
+    ส่งคืนคอลัมน์ `hashvalues` เป็น SignatureMatrix โดยสร้างเพียงครั้งเดียวต่อ process
+    """
+    key = dataset._fingerprint
+    if key not in SIGNATURE_MATRIX_CACHE:
+        SIGNATURE_MATRIX_CACHE[key] = SignatureMatrix(dataset)
+    return SIGNATURE_MATRIX_CACHE[key]
+
+
+def jaccard_scores(hashvalues, references):
+    """
+    Estimate the Jaccard similarity of each pair of rows, same as `LeanMinHash.jaccard`.
+    ประมาณค่า Jaccard ของแต่ละคู่ลายเซ็น ให้ผลเหมือน `LeanMinHash.jaccard`
+    """
+    return np.count_nonzero(hashvalues == references, axis=1) / hashvalues.shape[1]
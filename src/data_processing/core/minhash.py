@@ -1,4 +1,9 @@
+from functools import lru_cache
+import hashlib
+
+import numpy as np
 from data_processing.core.constants import MINHASH_SEED
+from data_processing.core.token_cache import segment_texts
 from nlpo3 import segment
 from datasketch import MinHash
 
@@ -6,22 +11,106 @@ DEFAULT_MINHASH_COL_NAME = "text"
 DEFAULT_NUM_PERMUTATION = 128
 N_GRAM = 5
 
+# Same universal hashing constants as datasketch.MinHash
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
 
-def generate_minhash_signature(text, num_perm):
-    minhash = MinHash(seed=MINHASH_SEED, num_perm=num_perm)
-    tokens = segment(text, "newmm")
-    n_gram = N_GRAM
+# Number of shingles permuted at once, bounds the (block, num_perm) buffer
+SHINGLE_BLOCK_SIZE = 8192
+
+
+@lru_cache(maxsize=None)
+def get_permutations(num_perm):
+    # Reuse datasketch's parameter generation so signatures stay bit-identical
+    return MinHash(seed=MINHASH_SEED, num_perm=num_perm).permutations
+
+
+def generate_shingles(tokens, n_gram=N_GRAM):
+    return ["".join(tokens[i : i + n_gram]) for i in range(len(tokens) - n_gram + 1)]
+
+
+def hash_shingles(shingles):
+    # 32-bit SHA1 hash, equivalent to datasketch.hashfunc.sha1_hash32
+    return np.fromiter(
+        (
+            int.from_bytes(hashlib.sha1(s.encode("utf-8")).digest()[:4], "little")
+            for s in shingles
+        ),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+
+def generate_minhash_signatures_batch(texts, num_perm, tokens=None):
+    """
+    Compute MinHash signatures for a batch of texts in one vectorized pass.
+    The result matches `MinHash.hashvalues` built with MINHASH_SEED and num_perm.
 
-    for i in range(len(tokens) - n_gram + 1):
-        token_gram = "".join(tokens[i : i + n_gram])
+    Parameters:
+    texts (List[str]): Texts to sign.
+    num_perm (int): Number of permutations.
+    tokens (List[List[str]], optional): Pre-segmented newmm tokens per text.
 
-        minhash.update(token_gram.encode("utf-8"))
+    Returns:
+    np.ndarray: uint64 matrix of shape (len(texts), num_perm).
+    """
+    if tokens is None:
+        tokens = [segment(text, "newmm") for text in texts]
 
-    return minhash
+    signatures = np.full((len(texts), num_perm), MAX_HASH, dtype=np.uint64)
+
+    # Hash every shingle of the batch into one flat array, remembering the owner
+    counts = np.zeros(len(texts), dtype=np.int64)
+    hashes = []
+    for i, doc_tokens in enumerate(tokens):
+        shingles = generate_shingles(doc_tokens)
+        counts[i] = len(shingles)
+        hashes.append(hash_shingles(shingles))
+
+    if counts.sum() == 0:
+        return signatures
+
+    hashvalues = np.concatenate(hashes)
+    doc_ids = np.repeat(np.arange(len(texts)), counts)
+    a, b = get_permutations(num_perm)
+
+    for start in range(0, len(hashvalues), SHINGLE_BLOCK_SIZE):
+        block_hashes = hashvalues[start : start + SHINGLE_BLOCK_SIZE]
+        block_docs = doc_ids[start : start + SHINGLE_BLOCK_SIZE]
+
+        permuted = np.bitwise_and(
+            (block_hashes[:, None] * a + b) % MERSENNE_PRIME, MAX_HASH
+        )
+
+        # doc_ids is sorted, so each document is a contiguous run in the block
+        boundaries = np.flatnonzero(np.diff(block_docs)) + 1
+        segment_starts = np.concatenate(([0], boundaries))
+        docs = block_docs[segment_starts]
+        signatures[docs] = np.minimum(
+            signatures[docs], np.minimum.reduceat(permuted, segment_starts, axis=0)
+        )
+
+    return signatures
+
+
+def generate_minhash_signature(text, num_perm):
+    hashvalues = generate_minhash_signatures_batch([text], num_perm)[0]
+    return MinHash(
+        seed=MINHASH_SEED,
+        hashvalues=hashvalues,
+        permutations=get_permutations(num_perm),
+    )
 
 
 def generate_minhash_signature_hf(
-    doc, num_perm=DEFAULT_NUM_PERMUTATION, col_name=DEFAULT_MINHASH_COL_NAME
+    batch,
+    num_perm=DEFAULT_NUM_PERMUTATION,
+    col_name=DEFAULT_MINHASH_COL_NAME,
+    token_cache_path=None,
 ):
-    minhash = generate_minhash_signature(doc[col_name], num_perm)
-    return {"hashvalues": minhash.hashvalues}
+    # Expects a batch from `Dataset.map(batched=True)`
+    tokens = None
+    if token_cache_path is not None:
+        tokens = segment_texts(batch[col_name], token_cache_path)
+    signatures = generate_minhash_signatures_batch(batch[col_name], num_perm, tokens)
+    return {"hashvalues": list(signatures)}
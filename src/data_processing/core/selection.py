@@ -0,0 +1,70 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from tqdm.auto import tqdm
+
+
+def build_keep_mask(num_rows, remove_ids):
+    """
+    Build a boolean keep-mask over the integer row ids of a dataset.
+    สร้างอาเรย์ boolean ที่ระบุว่าแถวใดของชุดข้อมูลจะถูกเก็บไว้
+
+    Parameters:
+    num_rows (int): The number of rows in the dataset.
+                    จำนวนแถวของชุดข้อมูล
+    remove_ids (array-like of int): The row ids to remove.
+                                    ดัชนีของแถวที่ต้องการลบ
+
+    Returns:
+    np.ndarray: A boolean array, False for the removed rows.
+                อาเรย์ boolean ซึ่งเป็น False สำหรับแถวที่ถูกลบ
+    """
+    keep_mask = np.ones(num_rows, dtype=bool)
+    keep_mask[np.asarray(remove_ids, dtype=np.int64)] = False
+    return keep_mask
+
+
+def select_rows(dataset, keep_mask):
+    # Dataset.select only records an indices mapping, rows are taken by Arrow on save
+    return dataset.select(np.flatnonzero(keep_mask))
+
+
+def read_id_column(dataset, column, batch_size, where=None):
+    """
+    Read a column of row ids (integer or numeric string) as an int64 array, batch by batch.
+    อ่านคอลัมน์ดัชนีของแถวเป็นอาเรย์ int64 ทีละชุด
+
+    Parameters:
+    dataset (Dataset): The dataset to read.
+                       ชุดข้อมูลที่ต้องการอ่าน
+    column (str): The column holding the row ids.
+                  คอลัมน์ที่เก็บดัชนีของแถว
+    batch_size (int): The number of rows read per batch.
+                      จำนวนแถวที่อ่านในแต่ละชุด
+    where (str, optional): A boolean column; only rows where it is False are returned.
+                           คอลัมน์ boolean ที่ใช้เลือกเฉพาะแถวที่มีค่าเป็น False
+
+    Returns:
+    np.ndarray: The row ids as int64.
+                ดัชนีของแถวในรูปแบบ int64
+    """
+    ids = [np.empty(0, dtype=np.int64)]
+    # An empty `Dataset.map` output has no columns, e.g. when nothing was found
+    if len(dataset) == 0 or column not in dataset.column_names:
+        return ids[0]
+
+    columns = [column] if where is None else [column, where]
+    table = dataset.with_format("arrow", columns=columns)
+
+    for i in tqdm(
+        range(0, len(dataset), batch_size),
+        dynamic_ncols=True,
+        desc="Collecting index to remove...",
+    ):
+        batch = table[i : i + batch_size]
+        values = batch[column]
+        if where is not None:
+            values = pc.filter(values, pc.invert(batch[where]))
+        ids.append(pc.cast(values, pa.int64()).to_numpy(zero_copy_only=False))
+
+    return np.concatenate(ids)
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import shutil
+from functools import lru_cache
+
+import numpy as np
+from datasets import load_from_disk, Features, Sequence, Value
+from nlpo3 import segment
+
+# Bump whenever the cache layout changes, older caches are then rebuilt
+TOKEN_CACHE_VERSION = 1
+
+TOKEN_CACHE_META_FILE = "meta.json"
+TOKEN_CACHE_DATA_DIR = "data"
+TOKEN_CACHE_HASHES_FILE = "hashes.npy"
+TOKEN_CACHE_ROWS_FILE = "rows.npy"
+
+
+def dictionary_version(dict_path):
+    # Content hash of the newmm dictionary, a new dictionary invalidates the cache
+    with open(dict_path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:16]
+
+
+def text_hashes(texts):
+    # 64-bit BLAKE2 hash of each text, the cache key of its token boundaries
+    return np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little")
+            for t in texts
+        ),
+        dtype=np.uint64,
+        count=len(texts),
+    )
+
+
+def token_offsets(tokens):
+    # End offset of every token; newmm tokens cover the text, so the offsets are enough to rebuild them
+    return np.cumsum([len(token) for token in tokens], dtype=np.int32)
+
+
+def tokens_from_offsets(text, offsets):
+    starts = [0, *offsets[:-1]]
+    return [text[start:end] for start, end in zip(starts, offsets)]
+
+
+def segment_offsets_hf(batch, col_name):
+    # Expects a batch from `Dataset.map(batched=True)`
+    texts = [text or "" for text in batch[col_name]]
+    return {
+        "text_hash": text_hashes(texts),
+        "token_offsets": [token_offsets(segment(text, "newmm")) for text in texts],
+    }
+
+
+def build_token_cache(dataset, col_name, cache_path, dict_version, num_proc):
+    """
+    This function segments every document of a dataset once with newmm and stores the token
+    boundaries as an int32 offsets column, keyed by the hash of the text. A sorted copy of the
+    hashes is saved as .npy so workers can look texts up through mmap.
+
+    ฟังก์ชันนี้ตัดคำทุกเอกสารด้วย newmm เพียงครั้งเดียว และเก็บขอบเขตของคำเป็นคอลัมน์ int32
+    โดยใช้ค่าแฮชของข้อความเป็นคีย์
+
+    Parameters:
+    dataset (Dataset): The dataset to segment.
+                       ชุดข้อมูลที่ต้องการตัดคำ
+    col_name (str): The text column.
+                    คอลัมน์ข้อความ
+    cache_path (str): The directory where the cache is written.
+                      ไดเรกทอรีที่ใช้บันทึกแคช
+    dict_version (str): The version of the newmm dictionary used for segmentation.
+                        เวอร์ชันของพจนานุกรม newmm ที่ใช้ตัดคำ
+    num_proc (int): The number of processes.
+                    จำนวน process
+
+    Returns:
+    str: The cache directory, ready to be opened with `load_token_cache`.
+         ไดเรกทอรีของแคชที่พร้อมเปิดด้วย `load_token_cache`
+    """
+    if os.path.exists(cache_path):
+        shutil.rmtree(cache_path)
+
+    cache = dataset.map(
+        lambda batch: segment_offsets_hf(batch, col_name),
+        batched=True,
+        num_proc=num_proc,
+        remove_columns=dataset.column_names,
+        features=Features(
+            {
+                "text_hash": Value("uint64"),
+                "token_offsets": Sequence(Value("int32")),
+            }
+        ),
+        desc="Segmenting...",
+    )
+    cache.save_to_disk(os.path.join(cache_path, TOKEN_CACHE_DATA_DIR), num_proc=num_proc)
+
+    # Sort the hashes once so a lookup is a binary search
+    hashes = np.asarray(cache.with_format("numpy")["text_hash"], dtype=np.uint64)
+    order = np.argsort(hashes, kind="stable")
+    np.save(os.path.join(cache_path, TOKEN_CACHE_HASHES_FILE), hashes[order])
+    np.save(os.path.join(cache_path, TOKEN_CACHE_ROWS_FILE), order.astype(np.int64))
+
+    # meta.json is written last, a partially written cache is never reused
+    with open(os.path.join(cache_path, TOKEN_CACHE_META_FILE), "w") as file:
+        json.dump(
+            {
+                "version": TOKEN_CACHE_VERSION,
+                "dictionary_version": dict_version,
+                "num_rows": len(cache),
+            },
+            file,
+        )
+
+    load_token_cache.cache_clear()
+
+    return cache_path
+
+
+def is_token_cache_current(cache_path, dict_version):
+    meta_path = os.path.join(cache_path, TOKEN_CACHE_META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, "r") as file:
+        meta = json.load(file)
+    return (
+        meta.get("version") == TOKEN_CACHE_VERSION
+        and meta.get("dictionary_version") == dict_version
+    )
+
+
+class TokenCache:
+    """
+    A read-only cache of newmm token boundaries, looked up by text hash through mmap.
+    แคชขอบเขตของคำจาก newmm แบบอ่านอย่างเดียว ค้นหาด้วยค่าแฮชของข้อความผ่าน mmap
+    """
+
+    def __init__(self, cache_path):
+        self.data = load_from_disk(os.path.join(cache_path, TOKEN_CACHE_DATA_DIR))
+        self.hashes = np.load(os.path.join(cache_path, TOKEN_CACHE_HASHES_FILE), mmap_mode="r")
+        self.rows = np.load(os.path.join(cache_path, TOKEN_CACHE_ROWS_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def lookup(self, hashes):
+        """
+        Find the cache row of each text hash, -1 when the text is not cached.
+        ค้นหาแถวในแคชของค่าแฮชแต่ละค่า หรือ -1 หากไม่มีในแคช
+        """
+        rows = np.full(len(hashes), -1, dtype=np.int64)
+        if len(self.hashes) == 0:
+            return rows
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        found = self.hashes[positions] == hashes
+        rows[found] = self.rows[positions[found]]
+        return rows
+
+    def segment(self, texts):
+        """
+        Return the newmm tokens of each text, segmenting only the texts missing from the cache.
+        ส่งคืนคำของแต่ละข้อความ โดยตัดคำใหม่เฉพาะข้อความที่ไม่มีในแคช
+        """
+        rows = self.lookup(text_hashes(texts))
+        hits = np.flatnonzero(rows >= 0)
+        offsets = self.data[rows[hits].tolist()]["token_offsets"] if len(hits) else []
+
+        tokens = [None] * len(texts)
+        for j, text_offsets in zip(hits, offsets):
+            # Guard against a hash collision, the offsets must end at the text length
+            if (text_offsets[-1] if text_offsets else 0) == len(texts[j]):
+                tokens[j] = tokens_from_offsets(texts[j], text_offsets)
+
+        for j, text in enumerate(texts):
+            if tokens[j] is None:
+                tokens[j] = segment(text, "newmm")
+        return tokens
+
+
+@lru_cache(maxsize=None)
+def load_token_cache(cache_path):
+    # One handle per process, the .npy pages live in the shared page cache
+    return TokenCache(cache_path)
+
+
+def segment_texts(texts, token_cache_path=None):
+    """
+    Segment a batch of texts with newmm, through the token cache when one is given.
+    ตัดคำข้อความทั้งชุดด้วย newmm โดยใช้แคชหากมีการกำหนด
+    """
+    if token_cache_path is None:
+        return [segment(text, "newmm") for text in texts]
+    return load_token_cache(token_cache_path).segment(texts)
+
+
+def prepare_token_cache(dataset, col_name, minhash_config, num_proc):
+    """
+    This function returns the token cache configured in `minhash_config.token_cache_path`, building it
+    when it is missing or was segmented with another dictionary. It returns None when no cache is configured.
+
+    ฟังก์ชันนี้ส่งคืนแคชการตัดคำที่กำหนดใน `token_cache_path` และสร้างแคชใหม่หากยังไม่มี
+    หรือถูกสร้างด้วยพจนานุกรมอื่น หากไม่ได้กำหนดไว้จะส่งคืน None
+    """
+    cache_path = getattr(minhash_config, "token_cache_path", None)
+    if not cache_path:
+        return None
+
+    dict_version = dictionary_version(minhash_config.newmm_dict)
+    if not is_token_cache_current(cache_path, dict_version):
+        build_token_cache(dataset, col_name, cache_path, dict_version, num_proc)
+    return cache_path
@@ -1,48 +1,98 @@
-import pickle
+import os
 
 import numpy as np
 from tqdm.auto import tqdm
-from datasets import load_from_disk, Features, Sequence, Value
-from datasketch import MinHashLSH, LeanMinHash
-import pandas as pd
-
-from data_processing.core.constants import MINHASH_SEED
+from datasets import load_from_disk, concatenate_datasets, Dataset, Features, Sequence, Value
+
+from data_processing.core.checkpoint import (
+    dataset_fingerprint,
+    get_stage_checkpoint,
+    run_stage,
+    stage_key,
+    stage_map_kwargs,
+)
 from data_processing.core.minhash import generate_minhash_signature
+from data_processing.core.lsh_index import (
+    build_band_index,
+    get_signature_matrix,
+    hashvalues_matrix,
+    jaccard_scores,
+    load_band_index,
+)
+from data_processing.core.selection import build_keep_mask, select_rows
+from data_processing.decontamination.ngram_overlap import (
+    build_ngram_index,
+    detect_ngram_overlap,
+)
+from data_processing.decontamination.signature_store import (
+    get_signature_path,
+    get_store_path,
+    load_signature_store,
+)
 from data_processing.decontamination.utils import (
     load_data,
 )
 
+# Sub-directory of the benchmark index holding the (benchmark, local id) payload of every signature
+BENCHMARK_DATASET_DIR = "benchmarks"
+
+# Number of signatures read per batch while building the benchmark index
+DEFAULT_INDEX_BATCH_SIZE = 10000
+
+# Number of candidate pairs scored at once during verification
+VERIFY_BLOCK_SIZE = 65536
+
+# Schema of the contaminated documents, also kept by an empty result
+CONTAMINATED_FEATURES = Features(
+    {
+        "duplicate_id": Value("int64"),
+        "duplicate_text": Value("string"),
+        "duplicate_dataset": Value("string"),
+        "original_dataset": Value("string"),
+        "original_text": Value("string"),
+        "original_id": Value("int64"),
+        "score": Value("float32"),
+    }
+)
+
 
-def query_func(item, idx, index):
+def query_func(batch, idx, index_path, empty_hashvalues):
     """
-    This function is designed to find similar text for a given document by utilizing MinHash signatures and a MinHashLSH index.
-    ฟังก์ชันนี้มีไว้เพื่อค้นหาข้อความที่คล้ายคลึงกันสำหรับเอกสารที่ได้รับมา โดยใช้ลายเซ็น MinHash และ MinHashLSH index
+    This function is designed to find similar benchmark documents for a batch of pretraining documents
+    by utilizing MinHash signatures and the combined LSH band index of every benchmark.
+    ฟังก์ชันนี้มีไว้เพื่อค้นหาเอกสารจากชุดข้อมูลประเมินผลที่คล้ายคลึงกันสำหรับเอกสารทั้งชุด
+    โดยใช้ลายเซ็น MinHash และดัชนี LSH ที่รวมทุกชุดข้อมูลประเมินผลไว้ด้วยกัน
 
     Parameters:
-    item (dict): The document to search for, which includes various information such as hashvalues.
-                 เอกสารที่ต้องการค้นหาข้อความ ประกอบด้วยข้อมูลต่าง ๆ รวมถึง hashvalues
-    idx (int): The index of the document in the dataset.
-               ดัชนีของเอกสารในชุดข้อมูล
-    index (MinHashLSH): The MinHashLSH index used to find similar documents.
-                        ดัชนี MinHashLSH ที่ใช้ในการค้นหาข้อความ
+    batch (dict): The batch of documents to search for, which includes various information such as hashvalues.
+                  ชุดเอกสารที่ต้องการค้นหาข้อความ ประกอบด้วยข้อมูลต่าง ๆ รวมถึง hashvalues
+    idx (list of int): The indices of the documents in the dataset.
+                       ดัชนีของเอกสารในชุดข้อมูล
+    index_path (str): The directory of the combined benchmark LSH index.
+                      ไดเรกทอรีของดัชนี LSH ที่รวมทุกชุดข้อมูลประเมินผล
+    empty_hashvalues (np.ndarray): The MinHash signature of an empty text, which is never queried.
+                                   ลายเซ็น MinHash ของข้อความว่าง ซึ่งจะไม่ถูกนำไปค้นหา
 
     Returns:
-    dict: A dictionary containing the list of similar documents found and the index of the document.
-          พจนานุกรมที่มีข้อความที่ค้นพบและดัชนีของเอกสาร
+    dict: A dictionary containing the lists of similar benchmark rows found and the indices of the documents.
+          พจนานุกรมที่มีดัชนีของเอกสารที่ค้นพบและดัชนีของเอกสาร
     """
 
-    # Search for similar documents using MinHash signatures and the MinHashLSH index.
-    # ค้นหาข้อความที่คล้ายคลึงกันโดยใช้ลายเซ็น MinHash และ MinHashLSH index
-    neighbors = [
-        str(dup_idx)  # Convert the index of the similar document to a string.
-        # แปลงดัชนีของข้อความเป็นสตริง
-        for dup_idx in index.query(
-            LeanMinHash(
-                seed=MINHASH_SEED, hashvalues=item["hashvalues"]
-            ),  # Create a LeanMinHash object using the document's hashvalues.
-            # สร้าง LeanMinHash จาก hashvalues ของเอกสาร
-        )
-    ]
+    # Open the index once per process; the mmap pages are shared instead of copied.
+    # เปิดดัชนีครั้งเดียวต่อ process โดยไม่คัดลอกข้อมูลในหน่วยความจำ
+    index = load_band_index(index_path)
+    hashvalues = hashvalues_matrix(batch["hashvalues"])
+
+    # Skip empty documents, they are filtered out afterwards anyway.
+    # ข้ามเอกสารที่ว่างเปล่า เพราะจะถูกกรองออกอยู่แล้ว
+    is_empty = np.all(hashvalues == empty_hashvalues, axis=1)
+    neighbors = [[] for _ in range(len(idx))]
+    query_rows = np.flatnonzero(~is_empty)
+
+    # Search for similar documents of every benchmark at once.
+    # ค้นหาข้อความที่คล้ายคลึงกันจากทุกชุดข้อมูลประเมินผลในครั้งเดียว
+    for j, candidates in zip(query_rows, index.query(hashvalues[query_rows])):
+        neighbors[j] = candidates.tolist()
 
     # Return a dictionary with the similar documents and the index of the document.
     # ส่งคืนพจนานุกรมที่มีข้อความที่ค้นพบและดัชนีของเอกสาร
@@ -83,147 +133,278 @@ def prepare_dataset(pretrain_data_args, decontaminate_args):
 
 def prepare_dataset_group(dataset_groups, dataset_key, decontaminate_args, global_config):
     """
-    This function prepares a group of datasets by loading MinHash signatures and the corresponding dataset,
-    and inserting the signatures into a MinHashLSH index for similarity searching.
+    This function loads the deduplicated texts and MinHash signatures of one benchmark from the signature store.
+    The Arrow files are memory-mapped, so nothing is unpickled or copied.
 
-    ฟังก์ชันนี้เตรียมกลุ่มชุดข้อมูลโดยการโหลดลายเซ็น MinHash และชุดข้อมูลที่เกี่ยวข้อง
-    และเพิ่มลายเซ็นเหล่านั้นลงในดัชนี MinHashLSH เพื่อการค้นหาความคล้ายคลึงกัน
+    ฟังก์ชันนี้โหลดข้อความและลายเซ็น MinHash ของชุดข้อมูลประเมินผลหนึ่งชุดจากที่เก็บลายเซ็น โดยเปิดไฟล์ผ่าน mmap
 
     Input:
     - dataset_groups (dict): A dictionary containing different dataset groups.
                              พจนานุกรมที่มีชุดข้อมูลหลายกลุ่ม
     - dataset_key (str): The key used to access a specific dataset group from dataset_groups.
                          คีย์ที่ใช้ในการเข้าถึงกลุ่มชุดข้อมูลเฉพาะจาก dataset_groups
-    - decontaminate_args (Namespace): Arguments related to decontamination, including threshold and paths.
-                                      อาร์กิวเมนต์ที่เกี่ยวข้องกับการกำจัดการปนเปื้อน รวมถึงเกณฑ์และเส้นทางต่างๆ
+    - decontaminate_args (Namespace): Arguments related to decontamination, including `signature_path`.
+                                      อาร์กิวเมนต์ที่เกี่ยวข้องกับการกำจัดการปนเปื้อน รวมถึงเส้นทางของลายเซ็น
     - global_config (Namespace): Configuration settings such as number of permutations for MinHash.
                                  การตั้งค่าการกำหนดค่าทั่วไป เช่น จำนวน permutations สำหรับ MinHash
 
     Output:
-    - tuple: A tuple containing:
-        1. data: The dataset loaded from the temporary file.
-                 ชุดข้อมูลที่โหลดจากไฟล์ชั่วคราว
-        2. signature: The MinHash signatures loaded from the temporary file.
-                      ลายเซ็น MinHash ที่โหลดจากไฟล์ชั่วคราว
+    - Dataset: The `text` and `hashvalues` of the benchmark.
+               ข้อความและลายเซ็น MinHash ของชุดข้อมูลประเมินผล
     """
+    dataset_arg = dataset_groups[dataset_key]
+    store_path = get_store_path(
+        get_signature_path(decontaminate_args),
+        dataset_key,
+        dataset_arg.split,
+        global_config.num_perm,
+    )
+    return load_signature_store(store_path)
 
-    # Define the number of permutations to be used in MinHash creation.
-    # กำหนดจำนวน permutations ที่จะใช้ในการสร้าง MinHash
-    num_perm = global_config.num_perm
 
-    dataset_arg = dataset_groups[dataset_key]
+def get_index_path(decontaminate_args, global_config):
+    """
+    This function returns where the combined benchmark LSH index is stored. It defaults to a directory
+    under ./temp, next to the benchmark signatures, when `index_path` is not configured.
+
+    ฟังก์ชันนี้ส่งคืนเส้นทางที่ใช้เก็บดัชนี LSH ของทุกชุดข้อมูลประเมินผล โดยค่าเริ่มต้นจะอยู่ใน ./temp
+    """
+    index_path = getattr(decontaminate_args, "index_path", None)
+    if index_path:
+        return index_path
+    return f"./temp/benchmark_lsh_index_{global_config.num_perm}"
+
+
+def build_benchmark_index(dataset_groups, decontaminate_args, global_config):
+    """
+    This function puts the MinHash signatures of every benchmark into one LSH band index.
+    Each row of the index carries a (benchmark, local id) payload, so a single pass over the
+    pretraining dataset reports contamination against all benchmarks at once.
+
+    ฟังก์ชันนี้รวมลายเซ็น MinHash ของทุกชุดข้อมูลประเมินผลไว้ในดัชนี LSH เดียว
+    โดยแต่ละแถวเก็บชื่อชุดข้อมูลและดัชนีภายในชุดข้อมูลนั้น เพื่อให้ตรวจสอบชุดข้อมูลการฝึกเพียงรอบเดียว
 
-    # Paths to temporary signature and data files.
-    # เส้นทางไปยังไฟล์ลายเซ็นและไฟล์ข้อมูลที่เก็บไว้ชั่วคราว
-    signature_path = (
-        f"./temp/{dataset_key}_{dataset_arg.split}_signature_{num_perm}.pickle"
+    Parameters:
+    dataset_groups (dict): A collection of dataset groups to be processed.
+                           กลุ่มของชุดข้อมูลที่ต้องการประมวลผล
+    decontaminate_args (Namespace): Arguments used for decontaminating the data, including the threshold.
+                                    อาร์กิวเมนต์ที่ใช้ในการกำจัดข้อมูลปนเปื้อน รวมถึงเกณฑ์
+    global_config (Namespace): General settings like the number of permutations.
+                               การตั้งค่าทั่วไป เช่น จำนวน permutations
+
+    Returns:
+    tuple: The index directory and the benchmark dataset with `benchmark`, `local_id`, `text` and `hashvalues`.
+           ไดเรกทอรีของดัชนี และชุดข้อมูลประเมินผลที่รวมกันแล้ว
+    """
+    num_perm = global_config.num_perm
+    index_path = get_index_path(decontaminate_args, global_config)
+    features = Features(
+        {
+            "benchmark": Value("string"),
+            "local_id": Value("int64"),
+            "text": Value("string"),
+            "hashvalues": Sequence(Value("uint64")),
+        }
     )
-    file_path = f"./temp/{dataset_key}_{dataset_arg.split}_file_{num_perm}.pickle"
 
-    # Load data and signatures from temporary files.
-    # โหลดข้อมูลและลายเซ็นจากไฟล์ที่เก็บไว้ชั่วคราว
-    with open(file_path, "rb") as file:
-        data = pickle.load(file)
+    # Collect the signatures of every benchmark with their (benchmark, local id) payload.
+    # รวบรวมลายเซ็นของทุกชุดข้อมูลประเมินผล พร้อมชื่อชุดข้อมูลและดัชนีภายใน
+    benchmarks = []
+    for dataset_key in tqdm(dataset_groups.keys(), desc="Loading benchmarks..."):
+        signatures = prepare_dataset_group(
+            dataset_groups, dataset_key, decontaminate_args, global_config)
+        benchmarks.append(
+            signatures.add_column("benchmark", [dataset_key] * len(signatures))
+            .add_column("local_id", np.arange(len(signatures), dtype=np.int64))
+            .cast(features)
+        )
 
-    with open(signature_path, "rb") as file:
-        signature = pickle.load(file)
+    # Store the payload next to the index so every worker memory-maps the same file.
+    # บันทึกข้อมูลไว้ข้างดัชนี เพื่อให้ทุก process เปิดไฟล์เดียวกันผ่าน mmap
+    benchmark_path = os.path.join(index_path, BENCHMARK_DATASET_DIR)
+    concatenate_datasets(benchmarks).flatten_indices().save_to_disk(benchmark_path)
+    benchmark_dataset = load_from_disk(benchmark_path)
 
-    # Create a MinHashLSH index for similarity searching.
-    # สร้าง MinHashLSH index สำหรับการค้นหาความคล้ายคลึงกัน
-    globals()[dataset_key] = MinHashLSH(
+    build_band_index(
+        benchmark_dataset,
         threshold=decontaminate_args.thresold,
         num_perm=num_perm,
+        index_path=index_path,
+        batch_size=getattr(decontaminate_args, "batch_size", None) or DEFAULT_INDEX_BATCH_SIZE,
     )
 
-    # Add MinHash signatures to the MinHashLSH index.
-    # เพิ่มลายเซ็น MinHash เข้าไปใน MinHashLSH index
-    with globals()[dataset_key].insertion_session() as session:
-        for i, item in enumerate(signature):
-            session.insert(i, item)
+    return index_path, benchmark_dataset
 
-    return data, signature
 
-
-def generate_minhash_pretrain_dataset(pretrain_dataset_minhash, empty_hashvalues, dataset_key, global_config):
+def generate_minhash_pretrain_dataset(pretrain_dataset_minhash, empty_hashvalues, index_path, global_config, checkpoint=None):
     """
-    This function generates a pretraining dataset by identifying and filtering similar documents
-    using a MinHashLSH index. It returns the resulting dataset after filtering.
+    This function queries the combined benchmark LSH index with every document of the pretraining dataset
+    and keeps only the documents with at least one candidate.
 
-    ฟังก์ชันนี้สร้างชุดข้อมูลการฝึกโดยการระบุและกรองเอกสารที่คล้ายกัน
-    โดยใช้ดัชนี MinHashLSH และส่งคืนชุดข้อมูลที่ได้หลังจากการกรอง
+    ฟังก์ชันนี้ค้นหาเอกสารทุกรายการของชุดข้อมูลการฝึกในดัชนี LSH ที่รวมทุกชุดข้อมูลประเมินผล
+    และเก็บเฉพาะเอกสารที่มีเอกสารที่คล้ายกันอย่างน้อยหนึ่งรายการ
 
     Input:
     - pretrain_dataset_minhash (Dataset): The dataset containing MinHash signatures to process.
                                           ชุดข้อมูลที่มีลายเซ็น MinHash สำหรับการประมวลผล
     - empty_hashvalues (ndarray): The empty hashvalues used for comparison to filter out incomplete entries.
                                   ลายเซ็น MinHash ว่างที่ใช้เปรียบเทียบเพื่อกรองข้อมูลที่ไม่สมบูรณ์
-    - dataset_key (str): The key used to access the MinHashLSH index in the global variables.
-                         คีย์ที่ใช้ในการเข้าถึงดัชนี MinHashLSH ในตัวแปร global
+    - index_path (str): The directory of the combined benchmark LSH index.
+                        ไดเรกทอรีของดัชนี LSH ที่รวมทุกชุดข้อมูลประเมินผล
     - global_config (Namespace): Configuration settings including number of processes to use for parallel execution.
                                  การตั้งค่าการกำหนดค่า รวมถึงจำนวน process สำหรับการประมวลผลขนาน
+    - checkpoint (StageCheckpoint): The checkpoint of the stage, to resume its map. (default is None)
+                                    จุดบันทึกของขั้นตอน
 
     Output:
-    - pretrain_dataset_minhash_result (Dataset): The filtered dataset containing documents with non-empty hashvalues 
-                                                 and identified neighbors from the MinHashLSH index.
-                                                 ชุดข้อมูลที่ผ่านการกรอง ซึ่งมีเอกสารที่มีลายเซ็นไม่ว่างเปล่าและมีเพื่อนบ้านที่ระบุจากดัชนี MinHashLSH
+    - pretrain_dataset_minhash_result (Dataset): The filtered dataset containing documents with non-empty hashvalues
+                                                 and their candidate rows in the benchmark index.
+                                                 ชุดข้อมูลที่ผ่านการกรอง ซึ่งมีเอกสารที่มีลายเซ็นไม่ว่างเปล่าและมีเพื่อนบ้านที่ระบุจากดัชนี
     """
 
-    # Search for similar text in the MinHashLSH index.
-    # ค้นหาข้อความที่คล้ายคลึงกันใน MinHashLSH index
+    # Search for similar text of every benchmark in a single pass.
+    # ค้นหาข้อความที่คล้ายคลึงกันจากทุกชุดข้อมูลประเมินผลในรอบเดียว
     pretrain_dataset_minhash_result = pretrain_dataset_minhash.map(
-        lambda doc, idx: query_func(doc, idx, index=globals()[dataset_key]),
+        lambda batch, idx: query_func(batch, idx, index_path, empty_hashvalues),
         desc="Querying...",
         num_proc=global_config.num_process,
         features=Features(
             {
                 **pretrain_dataset_minhash.features,
-                "__neighbors__": Sequence(Value("string")),
-                "idx": Value("int32"),
+                "__neighbors__": Sequence(Value("int64")),
+                "idx": Value("int64"),
             }
         ),
-        load_from_cache_file=False,
+        batched=True,
         with_indices=True,
+        **stage_map_kwargs(checkpoint, "query"),
     ).filter(
-        # Filter out documents that have text and non-empty signatures.
-        # กรองข้อมูลที่มีข้อความและไม่ใช่ลายเซ็นที่ว่างเปล่า
+        # Keep documents that have candidates and non-empty signatures.
+        # เก็บข้อมูลที่มีเอกสารที่คล้ายกันและไม่ใช่ลายเซ็นที่ว่างเปล่า
         lambda x: len(x["__neighbors__"]) > 0
         and not np.array_equal(x["hashvalues"], empty_hashvalues),
         desc="Filtering...",
         num_proc=global_config.num_process,
+        **stage_map_kwargs(checkpoint, "filter", load_from_cache_file=None),
     )
 
     return pretrain_dataset_minhash_result
 
 
-def contaminated_pretrain_dataset(pretrain_dataset_minhash_result, data, signature, dataset_key, pretrain_data_args, decontaminate_args):
+def process_data(batch, benchmark_dataset, threshold, col_name):
+    """
+    This function verifies the benchmark candidates of a batch and keeps, for each document and benchmark,
+    the reference with the highest Jaccard score above the threshold.
+
+    ฟังก์ชันนี้ตรวจสอบเอกสารที่คล้ายกันจากชุดข้อมูลประเมินผลทั้งชุด และเก็บเอกสารอ้างอิงที่มีคะแนน Jaccard
+    สูงสุดที่เกินเกณฑ์สำหรับแต่ละคู่ (เอกสาร, ชุดข้อมูลประเมินผล)
+
+    Parameters:
+    batch (dict): A batch of query results, including `idx`, MinHash signatures and `__neighbors__`.
+                  ข้อมูลผลการค้นหาที่ถูกแบ่งเป็นชุดย่อย
+    benchmark_dataset (Dataset): The combined benchmark dataset of the index.
+                                 ชุดข้อมูลประเมินผลที่รวมกันแล้วของดัชนี
+    threshold (float): The Jaccard threshold above which a document is contaminated.
+                       เกณฑ์ Jaccard ที่ใช้ตัดสินว่าเอกสารปนเปื้อน
+    col_name (str): The text column of the pretraining dataset.
+                    คอลัมน์ข้อความของชุดข้อมูลการฝึก
 
-    contaminated_results = []
+    Returns:
+    dict: The detected contaminations.
+          ข้อมูลปนเปื้อนที่ตรวจพบ
+    """
+    hashvalues = hashvalues_matrix(batch["hashvalues"])
+
+    # Flatten the neighbors of the batch into (document, benchmark row) candidate pairs.
+    # แปลงรายการเอกสารที่คล้ายกันทั้งชุดให้เป็นคู่ (เอกสาร, แถวของชุดข้อมูลประเมินผล)
+    counts = [len(neighbors) for neighbors in batch["__neighbors__"]]
+    pair_rows = np.repeat(np.arange(len(counts)), counts)
+    pair_neighbors = np.concatenate(
+        [np.asarray(n, dtype=np.int64) for n in batch["__neighbors__"]] + [np.empty(0, dtype=np.int64)]
+    )
+
+    # Calculate the Jaccard score of every pair against the benchmark signature matrix.
+    # คำนวณคะแนน Jaccard ของทุกคู่จากเมทริกซ์ลายเซ็นของชุดข้อมูลประเมินผล
+    signatures = get_signature_matrix(benchmark_dataset)
+    scores = np.empty(len(pair_rows), dtype=np.float64)
+    for start in range(0, len(pair_rows), VERIFY_BLOCK_SIZE):
+        block = slice(start, start + VERIFY_BLOCK_SIZE)
+        scores[block] = jaccard_scores(
+            hashvalues[pair_rows[block]], signatures.take(pair_neighbors[block])
+        )
+
+    # Order the contaminated pairs by document, then by descending score and benchmark row.
+    # เรียงคู่ที่ปนเปื้อนตามเอกสาร คะแนนจากมากไปน้อย และแถวของชุดข้อมูลประเมินผล
+    is_contaminated = np.flatnonzero(scores > threshold)
+    order = np.lexsort(
+        (pair_neighbors[is_contaminated], -scores[is_contaminated], pair_rows[is_contaminated])
+    )
+    confirmed = is_contaminated[order]
+    references = benchmark_dataset.select_columns(["benchmark", "local_id", "text"])[
+        pair_neighbors[confirmed].tolist()
+    ]
+
+    # Keep the best reference of each (document, benchmark) pair.
+    # เก็บเอกสารอ้างอิงที่ดีที่สุดของแต่ละคู่ (เอกสาร, ชุดข้อมูลประเมินผล)
+    results = {
+        "duplicate_id": [],
+        "duplicate_text": [],
+        "duplicate_dataset": [],
+        "original_dataset": [],
+        "original_text": [],
+        "original_id": [],
+        "score": [],
+    }
+    seen = set()
+    for k, pair in enumerate(confirmed):
+        j = pair_rows[pair]
+        benchmark = references["benchmark"][k]
+        if (j, benchmark) in seen:
+            continue
+        seen.add((j, benchmark))
+        results["duplicate_id"].append(references["local_id"][k])
+        results["duplicate_text"].append(references["text"][k])
+        results["duplicate_dataset"].append(benchmark)
+        results["original_dataset"].append(batch["source"][j])
+        results["original_text"].append(batch[col_name][j])
+        results["original_id"].append(batch["idx"][j])
+        results["score"].append(scores[pair])
+
+    return results
+
+
+def contaminated_pretrain_dataset(pretrain_dataset_minhash_result, benchmark_dataset, pretrain_data_args, decontaminate_args, global_config, checkpoint=None):
+    """
+    This function calculates the Jaccard similarity between the pretraining documents and their benchmark
+    candidates and returns the contaminated documents.
+
+    ฟังก์ชันนี้คำนวณค่าความคล้ายคลึง Jaccard ระหว่างเอกสารของชุดข้อมูลการฝึกและเอกสารจากชุดข้อมูลประเมินผล
+    และส่งคืนเอกสารที่ปนเปื้อน
+
+    Returns:
+    Dataset: One row per contaminated (document, benchmark) pair.
+             ชุดข้อมูลที่มีหนึ่งแถวต่อคู่ (เอกสาร, ชุดข้อมูลประเมินผล) ที่ปนเปื้อน
+    """
 
     # Calculate Jaccard distance and identify contaminated data.
     # คำนวณระยะทาง Jaccard และระบุข้อมูลที่ปนเปื้อน
-    for doc in tqdm(
-        pretrain_dataset_minhash_result, desc="Calculation Jaccard Distance..."
-    ):
-        neighbors = set(doc["__neighbors__"])
-        minhash = LeanMinHash(seed=MINHASH_SEED, hashvalues=doc["hashvalues"])
-        for neighbor in neighbors:
-            reference = data[int(neighbor)]
-            reference_signature = signature[int(neighbor)]
-            score = minhash.jaccard(reference_signature)
-            if score > decontaminate_args.thresold:
-                contaminated_results.append(
-                    {
-                        "duplicate_id": neighbor,
-                        "duplicate_text": reference,
-                        "duplicate_dataset": dataset_key,
-                        "original_dataset": doc["source"],
-                        "original_text": doc[pretrain_data_args.col_name],
-                        "original_id": doc["idx"],
-                        "score": score,
-                    }
-                )
-                break
+    contaminated_results = pretrain_dataset_minhash_result.map(
+        lambda batch: process_data(
+            batch, benchmark_dataset, decontaminate_args.thresold, pretrain_data_args.col_name
+        ),
+        batched=True,
+        num_proc=global_config.num_process,
+        remove_columns=pretrain_dataset_minhash_result.column_names,
+        features=CONTAMINATED_FEATURES,
+        desc="Calculation Jaccard Distance...",
+        **stage_map_kwargs(checkpoint, "contaminated"),
+    )
 
+    # Without any LSH candidate the map output is empty and has no columns, an empty result keeps the schema.
+    # หากไม่พบเอกสารที่คล้ายกัน ผลลัพธ์จะว่างและไม่มีคอลัมน์ จึงสร้างผลลัพธ์ว่างที่มีคอลัมน์ครบ
+    if len(contaminated_results) == 0:
+        contaminated_results = Dataset.from_dict(
+            {name: [] for name in CONTAMINATED_FEATURES}, features=CONTAMINATED_FEATURES)
     return contaminated_results
 
 
@@ -246,103 +427,205 @@ def save_dataset_to_disk(dataset, save_path):
 
 def indentify_decontaminate_pretrain_dataset(contaminated_results, pretrain_dataset, pretrain_data_args, global_config):
 
-    # Identify the IDs to remove from the original dataset.
-    # ระบุ ID ที่ต้องการลบออกจากข้อมูลต้นฉบับ
-    original_ids_to_remove = set()
-    for item in contaminated_results:
-        original_ids_to_remove.add(item["original_id"])
-
-    # Filter out the contaminated data from the pretraining dataset.
-    # กรองข้อมูลปนเปื้อนออกจากชุดข้อมูลฝึก
-    pretrain_dataset[pretrain_data_args.split] = pretrain_dataset[
-        pretrain_data_args.split
-    ].filter(
-        lambda _, idx: idx not in original_ids_to_remove,
-        desc="Filtering...",
-        num_proc=global_config.num_process,
-        with_indices=True,
-    )
+    # Identify the integer row ids to remove from the original dataset.
+    # ระบุดัชนีของแถวที่ต้องการลบออกจากข้อมูลต้นฉบับ
+    # An empty result may have no columns, e.g. when no document has an LSH candidate
+    # ผลลัพธ์ที่ว่างอาจไม่มีคอลัมน์ เช่น เมื่อไม่มีเอกสารใดมีเอกสารที่คล้ายกัน
+    if len(contaminated_results) == 0 or "original_id" not in contaminated_results.column_names:
+        ids_to_remove = np.empty(0, dtype=np.int64)
+    else:
+        ids_to_remove = np.asarray(
+            contaminated_results.with_format("numpy")["original_id"], dtype=np.int64)
+
+    # Filter out the contaminated data with a boolean keep-mask, taken by Arrow without a per-row callback.
+    # กรองข้อมูลปนเปื้อนออกจากชุดข้อมูลฝึกด้วย boolean mask โดยไม่ต้องเรียกฟังก์ชันทีละแถว
+    split_dataset = pretrain_dataset[pretrain_data_args.split]
+    keep_mask = build_keep_mask(len(split_dataset), ids_to_remove)
+    pretrain_dataset[pretrain_data_args.split] = select_rows(split_dataset, keep_mask)
 
     return pretrain_dataset
 
 
-def decontaminate(
-    dataset_groups, pretrain_data_args, decontaminate_args, global_config
+def find_contamination(
+    dataset_groups,
+    pretrain_split_dataset,
+    pretrain_dataset_minhash,
+    pretrain_data_args,
+    decontaminate_args,
+    global_config,
+    stage_prefix="",
 ):
     """
-    This function is used to remove contaminated data from a pretraining dataset by using MinHash and MinHashLSH techniques.
-    It identifies and removes similar text from the dataset to ensure data cleanliness.
+    This function finds the documents of a pretraining dataset that are similar to a benchmark, with the MinHash
+    signatures against the combined benchmark LSH index and, when `ngram_size` is set, with exact n-gram overlap.
 
-    ฟังก์ชันนี้มีไว้เพื่อกำจัดข้อมูลปนเปื้อนจากชุดข้อมูลการฝึก โดยใช้เทคนิค MinHash และ MinHashLSH
-    เพื่อค้นหาและระบุข้อความที่คล้ายคลึงกันและลบออกจากชุดข้อมูล
+    ฟังก์ชันนี้ค้นหาเอกสารในชุดข้อมูลการฝึกที่คล้ายกับชุดข้อมูลประเมินผล ด้วยลายเซ็น MinHash กับดัชนี LSH
+    ของทุกชุดข้อมูลประเมินผล และด้วย n-gram ที่ตรงกัน หากกำหนด `ngram_size`
 
     Parameters:
     dataset_groups (dict): A collection of dataset groups to be processed.
                            กลุ่มของชุดข้อมูลที่ต้องการประมวลผล
-    pretrain_data_args (Namespace): Arguments used to load the pretraining dataset.
+    pretrain_split_dataset (Dataset): The split of the pretraining dataset, for the n-gram overlap.
+                                      ชุดข้อมูลการฝึกที่ใช้ตรวจหา n-gram ที่ตรงกัน
+    pretrain_dataset_minhash (Dataset): The MinHash signatures of the same rows, with their `source`.
+                                        ลายเซ็น MinHash ของแถวเดียวกัน พร้อมแหล่งที่มา
+    pretrain_data_args (Namespace): Arguments used to load the pretraining dataset, including `col_name`.
                                     อาร์กิวเมนต์ที่ใช้ในการโหลดชุดข้อมูลการฝึก
     decontaminate_args (Namespace): Arguments used for decontaminating the data.
                                     อาร์กิวเมนต์ที่ใช้ในการกำจัดข้อมูลปนเปื้อน
     global_config (Namespace): General settings like the number of permutations and the number of processes.
                                การตั้งค่าทั่วไป เช่น จำนวน permutations และจำนวน process
+    stage_prefix (str): Prepended to the names of the checkpoint stages. (default is "")
+                        คำนำหน้าชื่อขั้นตอนของจุดบันทึก
 
     Returns:
-    None
-    ไม่มีค่าออกมา
+    Dataset: The contaminated documents, with their row id in `original_id`.
+             เอกสารที่ปนเปื้อน พร้อมดัชนีของแถวในคอลัมน์ `original_id`
     """
 
     # Get the number of permutations from global_config
     # ดึงจำนวนการแฮช MinHash จาก global_config
     num_perm = global_config.num_perm
 
-    # Initialize a list to store contaminated results
-    # สร้างรายการเพื่อเก็บข้อมูลที่ปนเปื้อน
-    contaminated_results = []
-
     # Generate an empty MinHash signature to compare with real signatures later
     # สร้างลายเซ็น MinHash ว่างเพื่อใช้ในการเปรียบเทียบกับลายเซ็นจริงในภายหลัง
     empty_hashvalues = generate_minhash_signature("", num_perm).hashvalues
 
-    # Load pretraining dataset and MinHash dataset from disk
-    # โหลดชุดข้อมูลการฝึกและชุดข้อมูล MinHash จากดิสก์
-    pretrain_dataset, pretrain_dataset_minhash = prepare_dataset(
-        pretrain_data_args, decontaminate_args)
+    # Put the signatures of every benchmark into one LSH index.
+    # รวมลายเซ็นของทุกชุดข้อมูลประเมินผลไว้ในดัชนี LSH เดียว
+    index_path, benchmark_dataset = build_benchmark_index(
+        dataset_groups, decontaminate_args, global_config)
+
+    # With `checkpoint_path`, each stage is keyed by its input and settings and skipped by a restarted job.
+    # หากกำหนด `checkpoint_path` แต่ละขั้นตอนที่เสร็จแล้วจะถูกข้ามเมื่อเริ่มงานใหม่
+    query_key = stage_key(
+        "query",
+        dataset_fingerprint(pretrain_dataset_minhash),
+        dataset_fingerprint(benchmark_dataset),
+        decontaminate_args.thresold,
+        num_perm,
+    )
 
-    # Iterate over each dataset group.
-    # วนลูปผ่านกลุ่มข้อมูลแต่ละกลุ่ม
-    for dataset_key in tqdm(dataset_groups.keys()):
-        print(dataset_key)
+    # Query the pretraining dataset against all benchmarks in a single pass.
+    # ค้นหาชุดข้อมูลการฝึกกับทุกชุดข้อมูลประเมินผลในรอบเดียว
+    pretrain_dataset_minhash_result = run_stage(
+        get_stage_checkpoint(global_config, f"{stage_prefix}query", query_key),
+        lambda checkpoint: generate_minhash_pretrain_dataset(
+            pretrain_dataset_minhash, empty_hashvalues, index_path, global_config, checkpoint),
+        global_config.num_process,
+    )
+    print(pretrain_dataset_minhash_result,
+          "pretrain_dataset_minhash_result")
 
-        # Prepare data and signatures for each dataset group
-        # เตรียมข้อมูลและลายเซ็นสำหรับแต่ละกลุ่มข้อมูล
-        data, signature = prepare_dataset_group(
-            dataset_groups, dataset_key, decontaminate_args, global_config)
+    # Calculate Jaccard distance and identify contaminated data.
+    # คำนวณระยะทาง Jaccard และระบุข้อมูลที่ปนเปื้อน
+    contaminated_results = run_stage(
+        get_stage_checkpoint(
+            global_config, f"{stage_prefix}contaminated", stage_key("contaminated", query_key, pretrain_data_args.col_name)),
+        lambda checkpoint: contaminated_pretrain_dataset(
+            pretrain_dataset_minhash_result, benchmark_dataset, pretrain_data_args, decontaminate_args, global_config, checkpoint),
+        global_config.num_process,
+    )
+    print(len(contaminated_results), "len(contaminated_results)")
+
+    # Save contaminated results to a CSV file.
+    # บันทึกผลลัพธ์ที่ปนเปื้อนไปยังไฟล์ CSV
+    df = contaminated_results.to_pandas()
+    df.to_csv(f"contaminated_results_{num_perm}.csv", index=False)
+
+    # Optionally flag documents sharing exact n-grams with a benchmark, which catches
+    # short benchmark items inside long documents that MinHash Jaccard misses.
+    # ตรวจหาเอกสารที่มี n-gram ตรงกับชุดข้อมูลประเมินผล (ถ้ากำหนด `ngram_size`)
+    # ซึ่งตรวจพบข้อความสั้น ๆ ที่อยู่ในเอกสารยาวที่ MinHash ตรวจไม่พบ
+    if getattr(decontaminate_args, "ngram_size", None):
+        ngram_key = stage_key(
+            "ngram",
+            dataset_fingerprint(pretrain_split_dataset),
+            dataset_fingerprint(benchmark_dataset),
+            pretrain_data_args.col_name,
+            decontaminate_args.ngram_size,
+            getattr(decontaminate_args, "min_ngram_overlap", None),
+        )
 
-        # Generate MinHash results for the pretraining dataset
-        # สร้างผลลัพธ์ MinHash สำหรับชุดข้อมูลการฝึก
-        pretrain_dataset_minhash_result = generate_minhash_pretrain_dataset(
-            pretrain_dataset_minhash, empty_hashvalues, dataset_key, global_config)
-        print(pretrain_dataset_minhash_result,
-              "pretrain_dataset_minhash_result")
+        def compute_ngram_results(checkpoint):
+            # The index is only needed, and only built when it is stale, while the stage runs
+            # ดัชนี n-gram ถูกสร้างเฉพาะเมื่อขั้นตอนนี้ยังไม่เสร็จ และดัชนีเดิมใช้ไม่ได้
+            ngram_index_path = build_ngram_index(
+                dataset_groups, decontaminate_args, global_config)
+            return detect_ngram_overlap(
+                pretrain_split_dataset,
+                ngram_index_path,
+                pretrain_data_args.col_name,
+                decontaminate_args,
+                global_config,
+                checkpoint,
+            )
+
+        ngram_results = run_stage(
+            get_stage_checkpoint(global_config, f"{stage_prefix}ngram", ngram_key),
+            compute_ngram_results,
+            global_config.num_process,
+        )
+        ngram_results.to_pandas().to_csv(
+            f"ngram_contaminated_results_{decontaminate_args.ngram_size}.csv", index=False)
+
+        # An empty `Dataset.map` output has no columns, only the non-empty results are combined
+        # ผลลัพธ์ที่ว่างจะไม่มีคอลัมน์ จึงรวมเฉพาะผลลัพธ์ที่ไม่ว่าง
+        found = [
+            results.select_columns(["original_id"])
+            for results in (contaminated_results, ngram_results)
+            if len(results) > 0
+        ]
+        if found:
+            contaminated_results = concatenate_datasets(found)
 
-        # Calculate Jaccard distance and identify contaminated data.
-        # คำนวณระยะทาง Jaccard และระบุข้อมูลที่ปนเปื้อน
-        contaminated_pretrain = contaminated_pretrain_dataset(
-            pretrain_dataset_minhash_result, data, signature, decontaminate_args)
+    return contaminated_results
 
-        # Add contaminated data to the results list
-        # เพิ่มข้อมูลที่ปนเปื้อนเข้าไปในรายการผลลัพธ์
-        contaminated_results.extend(contaminated_pretrain)
-        print(len(contaminated_results), "len(contaminated_results)")
 
-    # Save contaminated results to a CSV file.
-    # บันทึกผลลัพธ์ที่ปนเปื้อนไปยังไฟล์ CSV
-    df = pd.DataFrame(contaminated_results)
-    save_dataset_to_disk(df, f"contaminated_results_{num_perm}.csv")
+def decontaminate(
+    dataset_groups, pretrain_data_args, decontaminate_args, global_config
+):
+    """
+    This function is used to remove contaminated data from a pretraining dataset by using MinHash and MinHashLSH techniques.
+    It identifies and removes similar text from the dataset to ensure data cleanliness.
+
+    ฟังก์ชันนี้มีไว้เพื่อกำจัดข้อมูลปนเปื้อนจากชุดข้อมูลการฝึก โดยใช้เทคนิค MinHash และ MinHashLSH
+    เพื่อค้นหาและระบุข้อความที่คล้ายคลึงกันและลบออกจากชุดข้อมูล
+
+    Parameters:
+    dataset_groups (dict): A collection of dataset groups to be processed.
+                           กลุ่มของชุดข้อมูลที่ต้องการประมวลผล
+    pretrain_data_args (Namespace): Arguments used to load the pretraining dataset.
+                                    อาร์กิวเมนต์ที่ใช้ในการโหลดชุดข้อมูลการฝึก
+    decontaminate_args (Namespace): Arguments used for decontaminating the data.
+                                    อาร์กิวเมนต์ที่ใช้ในการกำจัดข้อมูลปนเปื้อน
+    global_config (Namespace): General settings like the number of permutations and the number of processes.
+                               การตั้งค่าทั่วไป เช่น จำนวน permutations และจำนวน process
+
+    Returns:
+    None
+    ไม่มีค่าออกมา
+    """
+
+    # Load pretraining dataset and MinHash dataset from disk
+    # โหลดชุดข้อมูลการฝึกและชุดข้อมูล MinHash จากดิสก์
+    pretrain_dataset, pretrain_dataset_minhash = prepare_dataset(
+        pretrain_data_args, decontaminate_args)
+
+    # Find the contaminated documents, each stage is skipped by a restarted job when `checkpoint_path` is set.
+    # ค้นหาเอกสารที่ปนเปื้อน โดยขั้นตอนที่เสร็จแล้วจะถูกข้ามเมื่อเริ่มงานใหม่ หากกำหนด `checkpoint_path`
+    contaminated_results = find_contamination(
+        dataset_groups,
+        pretrain_dataset[pretrain_data_args.split],
+        pretrain_dataset_minhash,
+        pretrain_data_args,
+        decontaminate_args,
+        global_config,
+    )
 
     # Identify and remove contaminated data from the pretraining dataset
     # ระบุและลบข้อมูลที่ปนเปื้อนออกจากชุดข้อมูลการฝึก
-    prepare_dataset = indentify_decontaminate_pretrain_dataset(
+    pretrain_dataset = indentify_decontaminate_pretrain_dataset(
         contaminated_results, pretrain_dataset, pretrain_data_args, global_config)
     print(pretrain_dataset)
 
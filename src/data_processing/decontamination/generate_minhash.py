@@ -1,36 +1,84 @@
-from data_processing.core.minhash import (
-    generate_minhash_signature,
-    generate_minhash_signature_hf,
+from data_processing.core.checkpoint import (
+    dataset_fingerprint,
+    get_stage_checkpoint,
+    run_stage,
+    stage_key,
+    stage_map_kwargs,
+)
+from data_processing.core.minhash import generate_minhash_signature_hf
+from data_processing.core.token_cache import dictionary_version, prepare_token_cache
+from data_processing.decontamination.signature_store import (
+    get_signature_path,
+    get_store_path,
+    hash_texts,
+    is_store_current,
+    save_signature_store,
 )
 from data_processing.decontamination.utils import (
     MAPPER,
     load_data,
 )
-from tqdm.auto import tqdm
 
-import pickle
-from multiprocessing import Pool
+from datasets import Dataset
 from nlpo3 import load_dict
 
 
-def generate_minhash_item(item):
+def generate_benchmark_signatures(dataset_groups, minhash_config, global_config):
     """
-    ฟังก์ชันนี้มีไว้เพื่อสร้างลายเซ็น MinHash สำหรับข้อความที่ได้รับมา
+    ฟังก์ชันนี้สร้างลายเซ็น MinHash ของชุดข้อมูลประเมินผลแต่ละชุด และบันทึกไว้ในที่เก็บลายเซ็น
+    ลายเซ็นจะถูกนำกลับมาใช้ หากข้อมูลต้นฉบับและจำนวน permutations ไม่เปลี่ยนแปลง
+    ต้องโหลดพจนานุกรม "newmm" ก่อนเรียกใช้
 
     Parameters:
-    item (tuple): ทูเพิลที่ประกอบด้วยข้อความ (text) และจำนวน permutations (num_perm)
+    dataset_groups (dict): กลุ่มของชุดข้อมูลประเมินผลที่ต้องการประมวลผล
+    minhash_config (Namespace): การตั้งค่าสำหรับการสร้าง MinHash รวมถึง `newmm_dict` และ `signature_path`
+    global_config (Namespace): การตั้งค่าทั่วไป เช่น จำนวน permutations และจำนวน process
 
     Returns:
-    MinHash: วัตถุ MinHash ที่มีลายเซ็นที่สร้างขึ้นจากข้อความ
+    None
     """
-    text, num_perm = item
-    return generate_minhash_signature(text, num_perm)
+    num_perm = global_config.num_perm
+    signature_path = get_signature_path(minhash_config)
+    dict_version = dictionary_version(minhash_config.newmm_dict)
+
+    # วนลูปผ่านกลุ่มข้อมูลแต่ละกลุ่ม
+    for dataset_key in dataset_groups.keys():
+        dataset_arg = dataset_groups[dataset_key]
+        # โหลดชุดข้อมูล
+        dataset = load_data(dataset_arg)
+        # แปลงข้อมูลแต่ละรายการในชุดข้อมูลโดยใช้ MAPPER
+        # กำจัดรายการที่ซ้ำกัน และเรียงลำดับเพื่อให้ดัชนีของแต่ละข้อความคงที่ทุกครั้งที่รัน
+        texts = sorted(
+            {MAPPER[dataset_key](item) for item in dataset[dataset_arg.split].to_list()}
+        )
+
+        # ข้ามการสร้างลายเซ็น หากลายเซ็นที่บันทึกไว้ยังตรงกับข้อมูลต้นฉบับและพจนานุกรม
+        store_path = get_store_path(
+            signature_path, dataset_key, dataset_arg.split, num_perm)
+        source_hash = hash_texts(texts)
+        if is_store_current(store_path, num_perm, source_hash, dict_version):
+            print(f"Reusing signatures of {dataset_key} from {store_path}")
+            continue
+
+        print(texts[:5], dataset_key)
+
+        # สร้างลายเซ็น MinHash ทีละชุดโดยใช้การประมวลผลแบบขนาน
+        signatures = Dataset.from_dict({"text": texts}).map(
+            lambda x: generate_minhash_signature_hf(x, num_perm),
+            batched=True,
+            num_proc=global_config.num_process,
+            desc="Processing dataset",
+        )
+
+        # บันทึกข้อความและลายเซ็นลงในที่เก็บลายเซ็น
+        save_signature_store(signatures, store_path, num_perm, source_hash, dict_version)
 
 
 def generate_minhash(dataset_groups, pretrain_data_args, minhash_config, global_config):
     """
     ฟังก์ชันนี้มีไว้เพื่อสร้างลายเซ็น MinHash สำหรับชุดข้อมูลการฝึก
     โดยใช้เทคนิค MinHash และ MinHashLSH เพื่อสร้างลายเซ็นสำหรับแต่ละข้อความในชุดข้อมูล
+    ลายเซ็นของชุดข้อมูลประเมินผลจะถูกนำกลับมาใช้ หากข้อมูลต้นฉบับและจำนวน permutations ไม่เปลี่ยนแปลง
 
     Parameters:
     dataset_groups (dict): กลุ่มของชุดข้อมูลที่ต้องการประมวลผล
@@ -44,54 +92,46 @@ def generate_minhash(dataset_groups, pretrain_data_args, minhash_config, global_
     # โหลดพจนานุกรมสำหรับการแบ่งคำแบบ "newmm"
     load_dict(minhash_config.newmm_dict, "newmm")
 
-    # วนลูปผ่านกลุ่มข้อมูลแต่ละกลุ่ม
-    for dataset_key in dataset_groups.keys():
-        dataset_arg = dataset_groups[dataset_key]
-        # โหลดชุดข้อมูล
-        dataset = load_data(dataset_arg)
-        # แปลงข้อมูลแต่ละรายการในชุดข้อมูลโดยใช้ MAPPER
-        dataset1 = [
-            MAPPER[dataset_key](item) for item in dataset[dataset_arg.split].to_list()
-        ]
-        # กำจัดรายการที่ซ้ำกัน
-        dataset1 = list(set(dataset1))
-        # สร้างรายการทูเพิลที่ประกอบด้วยข้อความและจำนวน permutations
-        dataset1_map = [(item, global_config.num_perm) for item in dataset1]
-
-        print(dataset1[:5], dataset_key)
-
-        # สร้างลายเซ็น MinHash โดยใช้การประมวลผลแบบขนาน
-        with Pool(processes=global_config.num_process) as pool:
-            signatures = list(
-                tqdm(
-                    pool.imap(generate_minhash_item, dataset1_map),
-                    total=len(dataset1_map),
-                    desc="Processing dataset",
-                )
-            )
-            # เส้นทางไปยังไฟล์ลายเซ็นและไฟล์ข้อมูลที่เก็บไว้ชั่วคราว
-            signature_path = f"./temp/{dataset_key}_{dataset_arg.split}_signature_{global_config.num_perm}.pickle"
-            file_path = f"./temp/{dataset_key}_{dataset_arg.split}_file_{global_config.num_perm}.pickle"
-
-            # บันทึกลายเซ็นลงในไฟล์
-            with open(signature_path, "wb") as file:
-                pickle.dump(signatures, file)
-            # บันทึกข้อมูลลงในไฟล์
-            with open(file_path, "wb") as file:
-                pickle.dump(dataset1, file)
+    # สร้างลายเซ็นของชุดข้อมูลประเมินผลทุกชุด หรือนำลายเซ็นที่บันทึกไว้กลับมาใช้
+    generate_benchmark_signatures(dataset_groups, minhash_config, global_config)
 
     # โหลดชุดข้อมูลการฝึก
     pretrain_dataset = load_data(pretrain_data_args)
 
-    # แปลงชุดข้อมูลการฝึกเป็นลายเซ็น MinHash
     dataset1 = pretrain_dataset[pretrain_data_args.split]
-    signatures = dataset1.map(
-        lambda x: generate_minhash_signature_hf(
-            x, global_config.num_perm, pretrain_data_args.col_name
+
+    # หากกำหนด `checkpoint_path` ลายเซ็นจะถูกบันทึกเป็นจุดบันทึกที่ `save_path` และงานที่เริ่มใหม่จะนำกลับมาใช้
+    checkpoint = get_stage_checkpoint(
+        global_config,
+        "minhash",
+        stage_key(
+            dataset_fingerprint(dataset1),
+            pretrain_data_args.col_name,
+            global_config.num_perm,
+            dictionary_version(minhash_config.newmm_dict),
         ),
-        num_proc=global_config.num_process,
+        data_path=minhash_config.save_path,
     )
+
+    def compute_signatures(checkpoint):
+        # ตัดคำชุดข้อมูลการฝึกเพียงครั้งเดียวต่อพจนานุกรม หากมีการกำหนดแคชการตัดคำ
+        token_cache_path = prepare_token_cache(
+            dataset1, pretrain_data_args.col_name, minhash_config, global_config.num_process)
+
+        # แปลงชุดข้อมูลการฝึกเป็นลายเซ็น MinHash
+        return dataset1.map(
+            lambda x: generate_minhash_signature_hf(
+                x, global_config.num_perm, pretrain_data_args.col_name, token_cache_path
+            ),
+            batched=True,
+            num_proc=global_config.num_process,
+            **stage_map_kwargs(checkpoint, "signatures", load_from_cache_file=None),
+        )
+
+    signatures = run_stage(checkpoint, compute_signatures, global_config.num_process)
+
     # บันทึกชุดข้อมูลลายเซ็น MinHash ลงในที่เก็บข้อมูลที่กำหนด
-    signatures.save_to_disk(
-        minhash_config.save_path, num_proc=global_config.num_process
-    )
+    if checkpoint is None:
+        signatures.save_to_disk(
+            minhash_config.save_path, num_proc=global_config.num_process
+        )
@@ -0,0 +1,337 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from tqdm.auto import tqdm
+from datasets import Features, Sequence, Value
+from nlpo3 import segment
+
+from data_processing.core.checkpoint import stage_map_kwargs
+from data_processing.decontamination.signature_store import (
+    get_signature_path,
+    get_store_path,
+    load_signature_store,
+    load_store_meta,
+)
+
+DEFAULT_NGRAM_SIZE = 13
+DEFAULT_MIN_OVERLAP = 1
+
+# Multiplier of the polynomial hash that folds n token hashes into one n-gram hash
+NGRAM_HASH_PRIME = np.uint64(0x100000001B3)
+
+# Bump whenever the layout or the n-gram hashing changes, older indexes are then rebuilt
+NGRAM_INDEX_VERSION = 1
+
+NGRAM_META_FILE = "meta.json"
+NGRAM_KEYS_FILE = "ngrams.npy"
+NGRAM_OWNERS_FILE = "owners.npy"
+
+
+def tokenize_with_offsets(text):
+    """
+    ฟังก์ชันนี้ตัดคำด้วย newmm และส่งคืนคำที่ไม่ใช่ช่องว่างพร้อมตำแหน่งตัวอักษรเริ่มต้นและสิ้นสุดในข้อความ
+    คำจะถูกแปลงเป็นตัวพิมพ์เล็กเพื่อให้การเปรียบเทียบไม่ขึ้นกับตัวพิมพ์
+
+    Parameters:
+    text (str): ข้อความที่ต้องการตัดคำ
+
+    Returns:
+    tuple: รายการคำ, ตำแหน่งเริ่มต้น และตำแหน่งสิ้นสุดของแต่ละคำ
+    """
+    tokens = []
+    starts = []
+    ends = []
+    offset = 0
+    for token in segment(text, "newmm"):
+        if not token.isspace():
+            tokens.append(token.lower())
+            starts.append(offset)
+            ends.append(offset + len(token))
+        offset += len(token)
+    return tokens, np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+
+
+def hash_tokens(tokens):
+    # 64-bit BLAKE2 hash, stable across processes unlike the built-in hash()
+    return np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little")
+            for t in tokens
+        ),
+        dtype=np.uint64,
+        count=len(tokens),
+    )
+
+
+def hash_ngrams(token_hashes, ngram_size):
+    """
+    ฟังก์ชันนี้รวมค่าแฮชของคำที่ติดกัน `ngram_size` คำให้เป็นค่าแฮชของ n-gram แต่ละตัว
+
+    Parameters:
+    token_hashes (np.ndarray): ค่าแฮช uint64 ของแต่ละคำ
+    ngram_size (int): จำนวนคำใน n-gram
+
+    Returns:
+    np.ndarray: ค่าแฮช uint64 ของ n-gram ที่เริ่มต้นที่แต่ละตำแหน่ง
+    """
+    num_ngrams = len(token_hashes) - ngram_size + 1
+    if num_ngrams <= 0:
+        return np.empty(0, dtype=np.uint64)
+
+    hashes = np.zeros(num_ngrams, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for k in range(ngram_size):
+            hashes = hashes * NGRAM_HASH_PRIME + token_hashes[k : k + num_ngrams]
+    return hashes
+
+
+def get_ngram_index_path(decontaminate_args):
+    index_path = getattr(decontaminate_args, "ngram_index_path", None)
+    if index_path:
+        return index_path
+    return f"./temp/benchmark_ngram_index_{decontaminate_args.ngram_size}"
+
+
+def load_ngram_meta(index_path):
+    meta_path = os.path.join(index_path, NGRAM_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as file:
+        return json.load(file)
+
+
+def get_store_paths(dataset_groups, decontaminate_args, global_config):
+    # ที่เก็บลายเซ็นของแต่ละชุดข้อมูลประเมินผล ตามลำดับใน dataset_groups
+    signature_path = get_signature_path(decontaminate_args)
+    return [
+        get_store_path(signature_path, dataset_key, dataset_groups[dataset_key].split, global_config.num_perm)
+        for dataset_key in dataset_groups.keys()
+    ]
+
+
+def get_store_sources(store_paths):
+    # ค่าแฮชของข้อความต้นฉบับและเวอร์ชันของพจนานุกรมของแต่ละที่เก็บ ซึ่งกำหนดเนื้อหาของดัชนี
+    sources = []
+    for store_path in store_paths:
+        meta = load_store_meta(store_path) or {}
+        sources.append([meta.get("source_hash"), meta.get("dict_version")])
+    return sources
+
+
+def is_ngram_index_current(index_path, ngram_size, benchmarks, sources):
+    """
+    ฟังก์ชันนี้ตรวจสอบว่าดัชนี n-gram ที่สร้างไว้ยังใช้ได้หรือไม่ ซึ่งต้องมีเวอร์ชัน `ngram_size` ชุดข้อมูลประเมินผล
+    และค่าแฮชของข้อความต้นฉบับกับเวอร์ชันของพจนานุกรมของแต่ละที่เก็บลายเซ็นตรงกัน
+
+    Returns:
+    bool: True หากสามารถใช้ดัชนีที่สร้างไว้ได้โดยไม่ต้องสร้างใหม่
+    """
+    meta = load_ngram_meta(index_path)
+    return (
+        meta is not None
+        and meta.get("version") == NGRAM_INDEX_VERSION
+        and meta.get("ngram_size") == ngram_size
+        and meta.get("benchmarks") == benchmarks
+        and meta.get("sources") == sources
+    )
+
+
+def build_ngram_index(dataset_groups, decontaminate_args, global_config):
+    """
+    ฟังก์ชันนี้สร้างดัชนี n-gram จากข้อความของทุกชุดข้อมูลประเมินผลในที่เก็บลายเซ็น
+    โดยเก็บค่าแฮชของ n-gram ที่ไม่ซ้ำกันเป็นอาเรย์ uint64 ที่เรียงลำดับแล้ว และชุดข้อมูลที่เป็นเจ้าของแต่ละ n-gram
+    ขนาดของดัชนีคือ 12 ไบต์ต่อ n-gram และเปิดด้วย mmap ได้
+    ดัชนีที่สร้างไว้จะถูกนำกลับมาใช้ หาก `ngram_size` และที่เก็บลายเซ็นของทุกชุดข้อมูลไม่เปลี่ยนแปลง
+
+    Parameters:
+    dataset_groups (dict): กลุ่มของชุดข้อมูลประเมินผล
+    decontaminate_args (Namespace): อาร์กิวเมนต์ที่ใช้ในการกำจัดข้อมูลปนเปื้อน รวมถึง `ngram_size`
+    global_config (Namespace): การตั้งค่าทั่วไป เช่น จำนวน permutations
+
+    Returns:
+    str: ไดเรกทอรีของดัชนี n-gram
+    """
+    ngram_size = decontaminate_args.ngram_size
+    index_path = get_ngram_index_path(decontaminate_args)
+    benchmarks = list(dataset_groups.keys())
+    store_paths = get_store_paths(dataset_groups, decontaminate_args, global_config)
+    sources = get_store_sources(store_paths)
+
+    if is_ngram_index_current(index_path, ngram_size, benchmarks, sources):
+        print(f"Reusing n-gram index from {index_path}")
+        return index_path
+
+    keys = [np.empty(0, dtype=np.uint64)]
+    owners = [np.empty(0, dtype=np.int32)]
+    for owner, store_path in enumerate(tqdm(store_paths, desc="Building n-gram index...")):
+        for text in load_signature_store(store_path)["text"]:
+            tokens, _, _ = tokenize_with_offsets(text)
+            ngrams = hash_ngrams(hash_tokens(tokens), ngram_size)
+            keys.append(ngrams)
+            owners.append(np.full(len(ngrams), owner, dtype=np.int32))
+
+    # เรียงลำดับและกำจัด n-gram ที่ซ้ำกัน n-gram ที่อยู่ในหลายชุดข้อมูลจะเป็นของชุดข้อมูลแรก
+    keys = np.concatenate(keys)
+    owners = np.concatenate(owners)
+    keys, first = np.unique(keys, return_index=True)
+
+    # ลบ meta.json เดิมก่อน และเขียนใหม่เป็นไฟล์สุดท้าย ดัชนีที่สร้างไม่เสร็จจึงไม่ถูกนำกลับมาใช้
+    os.makedirs(index_path, exist_ok=True)
+    meta_path = os.path.join(index_path, NGRAM_META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    np.save(os.path.join(index_path, NGRAM_KEYS_FILE), keys)
+    np.save(os.path.join(index_path, NGRAM_OWNERS_FILE), owners[first])
+    with open(meta_path, "w") as file:
+        json.dump(
+            {
+                "version": NGRAM_INDEX_VERSION,
+                "ngram_size": ngram_size,
+                "benchmarks": benchmarks,
+                "sources": sources,
+            },
+            file,
+        )
+
+    load_ngram_index.cache_clear()
+
+    return index_path
+
+
+class NgramIndex:
+    """
+    ดัชนี n-gram แบบอ่านอย่างเดียวที่เปิดด้วย mmap และใช้ร่วมกันได้ทุก process
+    """
+
+    def __init__(self, index_path):
+        meta = load_ngram_meta(index_path)
+
+        self.ngram_size = meta["ngram_size"]
+        self.benchmarks = meta["benchmarks"]
+        self.keys = np.load(os.path.join(index_path, NGRAM_KEYS_FILE), mmap_mode="r")
+        self.owners = np.load(os.path.join(index_path, NGRAM_OWNERS_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def match(self, ngrams):
+        """
+        ค้นหา n-gram ที่อยู่ในดัชนีด้วย binary search
+
+        Returns:
+        tuple: ตำแหน่งของ n-gram ที่พบ และชุดข้อมูลที่เป็นเจ้าของ n-gram นั้น
+        """
+        if len(self.keys) == 0 or len(ngrams) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        positions = np.minimum(np.searchsorted(self.keys, ngrams), len(self.keys) - 1)
+        found = np.flatnonzero(self.keys[positions] == ngrams)
+        return found, self.owners[positions[found]]
+
+
+@lru_cache(maxsize=None)
+def load_ngram_index(index_path):
+    return NgramIndex(index_path)
+
+
+def merge_spans(starts, ends):
+    """
+    ฟังก์ชันนี้รวมช่วงตัวอักษรที่ซ้อนทับหรือติดกัน (เรียงตามตำแหน่งเริ่มต้นแล้ว) ให้เป็นช่วงเดียว
+    """
+    merged_starts = []
+    merged_ends = []
+    for start, end in zip(starts, ends):
+        if merged_ends and start <= merged_ends[-1]:
+            merged_ends[-1] = max(merged_ends[-1], end)
+        else:
+            merged_starts.append(int(start))
+            merged_ends.append(int(end))
+    return merged_starts, merged_ends
+
+
+def find_overlaps(batch, idx, index_path, col_name, min_overlap):
+    """
+    ฟังก์ชันนี้ค้นหาเอกสารในชุดข้อมูลการฝึกที่มี n-gram ตรงกับชุดข้อมูลประเมินผลอย่างน้อย `min_overlap` ตัว
+    และส่งคืนเฉพาะเอกสารที่ปนเปื้อน พร้อมช่วงตัวอักษรที่ตรงกัน
+
+    Parameters:
+    batch (dict): ชุดเอกสารของชุดข้อมูลการฝึก
+    idx (list of int): ดัชนีของเอกสารในชุดข้อมูล
+    index_path (str): ไดเรกทอรีของดัชนี n-gram
+    col_name (str): คอลัมน์ข้อความของชุดข้อมูลการฝึก
+    min_overlap (int): จำนวน n-gram ที่ไม่ซ้ำกันขั้นต่ำที่ถือว่าปนเปื้อน
+
+    Returns:
+    dict: ข้อมูลของเอกสารที่ปนเปื้อน
+    """
+    index = load_ngram_index(index_path)
+    ngram_size = index.ngram_size
+    results = {
+        "original_id": [],
+        "original_text": [],
+        "num_matches": [],
+        "duplicate_datasets": [],
+        "span_starts": [],
+        "span_ends": [],
+    }
+
+    for j, text in enumerate(batch[col_name]):
+        tokens, starts, ends = tokenize_with_offsets(text or "")
+        ngrams = hash_ngrams(hash_tokens(tokens), ngram_size)
+        found, owners = index.match(ngrams)
+        num_matches = len(np.unique(ngrams[found]))
+        if num_matches == 0 or num_matches < min_overlap:
+            continue
+
+        span_starts, span_ends = merge_spans(starts[found], ends[found + ngram_size - 1])
+        results["original_id"].append(idx[j])
+        results["original_text"].append(text)
+        results["num_matches"].append(num_matches)
+        results["duplicate_datasets"].append(
+            [index.benchmarks[owner] for owner in np.unique(owners)]
+        )
+        results["span_starts"].append(span_starts)
+        results["span_ends"].append(span_ends)
+
+    return results
+
+
+def detect_ngram_overlap(pretrain_dataset, index_path, col_name, decontaminate_args, global_config, checkpoint=None):
+    """
+    ฟังก์ชันนี้ตรวจสอบชุดข้อมูลการฝึกทั้งหมดในรอบเดียวเพื่อหาเอกสารที่มี n-gram ตรงกับชุดข้อมูลประเมินผล
+    ใช้หน่วยความจำคงที่ คือดัชนีที่เปิดด้วย mmap และเอกสารหนึ่งชุดต่อ process
+
+    Parameters:
+    pretrain_dataset (Dataset): ชุดข้อมูลการฝึก
+    index_path (str): ไดเรกทอรีของดัชนี n-gram
+    col_name (str): คอลัมน์ข้อความของชุดข้อมูลการฝึก
+    decontaminate_args (Namespace): อาร์กิวเมนต์ที่ใช้ในการกำจัดข้อมูลปนเปื้อน รวมถึง `min_ngram_overlap`
+    global_config (Namespace): การตั้งค่าทั่วไป เช่น จำนวน process
+    checkpoint (StageCheckpoint): จุดบันทึกของขั้นตอน สำหรับประมวลผลต่อจากส่วนที่เสร็จแล้ว (ค่าเริ่มต้นคือ None)
+
+    Returns:
+    Dataset: หนึ่งแถวต่อเอกสารที่ปนเปื้อน พร้อมจำนวน n-gram ที่ตรงกัน ชุดข้อมูลประเมินผล และช่วงตัวอักษร
+    """
+    min_overlap = getattr(decontaminate_args, "min_ngram_overlap", None) or DEFAULT_MIN_OVERLAP
+
+    return pretrain_dataset.map(
+        lambda batch, idx: find_overlaps(batch, idx, index_path, col_name, min_overlap),
+        batched=True,
+        with_indices=True,
+        num_proc=global_config.num_process,
+        remove_columns=pretrain_dataset.column_names,
+        features=Features(
+            {
+                "original_id": Value("int64"),
+                "original_text": Value("string"),
+                "num_matches": Value("int64"),
+                "duplicate_datasets": Sequence(Value("string")),
+                "span_starts": Sequence(Value("int64")),
+                "span_ends": Sequence(Value("int64")),
+            }
+        ),
+        desc="Matching n-grams...",
+        **stage_map_kwargs(checkpoint, "ngram"),
+    )
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import shutil
+
+from datasets import load_from_disk
+
+# Bump whenever the layout or the signature definition changes, older stores are then rebuilt
+SIGNATURE_STORE_VERSION = 1
+
+STORE_META_FILE = "meta.json"
+STORE_DATA_DIR = "data"
+
+DEFAULT_SIGNATURE_PATH = "./temp/benchmark_signatures"
+
+
+def get_signature_path(config):
+    """
+    ฟังก์ชันนี้ส่งคืนไดเรกทอรีที่ใช้เก็บลายเซ็น MinHash ของชุดข้อมูลประเมินผล
+    โดยใช้ค่าเริ่มต้นเมื่อไม่ได้กำหนด `signature_path`
+    """
+    return getattr(config, "signature_path", None) or DEFAULT_SIGNATURE_PATH
+
+
+def get_store_path(signature_path, dataset_key, split, num_perm):
+    return os.path.join(signature_path, f"{dataset_key}_{split}_{num_perm}")
+
+
+def hash_texts(texts):
+    """
+    ฟังก์ชันนี้คำนวณค่าแฮชของเนื้อหาข้อความทั้งหมด เพื่อตรวจสอบว่าชุดข้อมูลต้นฉบับเปลี่ยนแปลงหรือไม่
+
+    Parameters:
+    texts (List[str]): ข้อความทั้งหมดของชุดข้อมูล
+
+    Returns:
+    str: ค่าแฮช SHA-256 ของข้อความทั้งหมด
+    """
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def load_store_meta(store_path):
+    meta_path = os.path.join(store_path, STORE_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as file:
+        return json.load(file)
+
+
+def is_store_current(store_path, num_perm, source_hash, dict_version):
+    """
+    ฟังก์ชันนี้ตรวจสอบว่าลายเซ็นที่บันทึกไว้ยังใช้ได้หรือไม่
+    ซึ่งต้องมีเวอร์ชัน จำนวน permutations ค่าแฮชของข้อมูลต้นฉบับ และเวอร์ชันของพจนานุกรม newmm ตรงกัน
+    พจนานุกรมที่เปลี่ยนไปทำให้การตัดคำและ shingle เปลี่ยนไป ลายเซ็นเดิมจึงใช้เทียบกับชุดข้อมูลการฝึกไม่ได้
+
+    Parameters:
+    store_path (str): ไดเรกทอรีของลายเซ็นที่บันทึกไว้
+    num_perm (int): จำนวน permutations
+    source_hash (str): ค่าแฮชของข้อความในชุดข้อมูลต้นฉบับ
+    dict_version (str): เวอร์ชันของพจนานุกรม newmm จาก `dictionary_version`
+
+    Returns:
+    bool: True หากสามารถใช้ลายเซ็นที่บันทึกไว้ได้โดยไม่ต้องสร้างใหม่
+    """
+    meta = load_store_meta(store_path)
+    return (
+        meta is not None
+        and meta.get("version") == SIGNATURE_STORE_VERSION
+        and meta.get("num_perm") == num_perm
+        and meta.get("source_hash") == source_hash
+        and meta.get("dict_version") == dict_version
+    )
+
+
+def save_signature_store(dataset, store_path, num_perm, source_hash, dict_version):
+    """
+    ฟังก์ชันนี้บันทึกข้อความและลายเซ็น MinHash ของชุดข้อมูลประเมินผลในรูปแบบ Arrow
+    โดยคอลัมน์ `hashvalues` เป็นเมทริกซ์ uint64 ที่เปิดด้วย mmap ได้
+
+    Parameters:
+    dataset (Dataset): ชุดข้อมูลที่มีคอลัมน์ `text` และ `hashvalues`
+    store_path (str): ไดเรกทอรีที่ใช้บันทึกลายเซ็น
+    num_perm (int): จำนวน permutations
+    source_hash (str): ค่าแฮชของข้อความในชุดข้อมูลต้นฉบับ
+    dict_version (str): เวอร์ชันของพจนานุกรม newmm ที่ใช้ตัดคำ
+    """
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path)
+
+    dataset.select_columns(["text", "hashvalues"]).save_to_disk(
+        os.path.join(store_path, STORE_DATA_DIR)
+    )
+
+    # เขียน meta.json เป็นไฟล์สุดท้าย ลายเซ็นที่บันทึกไม่ครบจึงไม่ถูกนำกลับมาใช้
+    with open(os.path.join(store_path, STORE_META_FILE), "w") as file:
+        json.dump(
+            {
+                "version": SIGNATURE_STORE_VERSION,
+                "num_perm": num_perm,
+                "num_rows": len(dataset),
+                "source_hash": source_hash,
+                "dict_version": dict_version,
+            },
+            file,
+        )
+
+
+def load_signature_store(store_path):
+    """
+    ฟังก์ชันนี้โหลดข้อความและลายเซ็น MinHash ที่บันทึกไว้ โดยเปิดไฟล์ Arrow ผ่าน mmap
+
+    Parameters:
+    store_path (str): ไดเรกทอรีของลายเซ็นที่บันทึกไว้
+
+    Returns:
+    Dataset: ชุดข้อมูลที่มีคอลัมน์ `text` และ `hashvalues`
+    """
+    if load_store_meta(store_path) is None:
+        raise FileNotFoundError(
+            f"No benchmark signatures found at {store_path}, run generate_minhash first"
+        )
+    return load_from_disk(os.path.join(store_path, STORE_DATA_DIR))
@@ -54,14 +54,14 @@ def generate_query_hellaswag(doc):
     doc (dict): เอกสารที่ต้องการสร้าง query
 
     Returns:
-    tuple: query ที่สร้างขึ้นจากเอกสาร
+    str: query ที่สร้างขึ้นจากเอกสาร
     """
     ctx = (
         doc["ctx_a_th"] + " " + ""
         if doc["ctx_b_th"] is None
         else doc["ctx_b_th"].capitalize()
     )
-    return (preprocess_hellaswag(doc["activity_label_th"] + ": " + ctx),)
+    return preprocess_hellaswag(doc["activity_label_th"] + ": " + ctx)
 
 
 def generate_query_xquad(doc):
@@ -0,0 +1,129 @@
+import numpy as np
+import pyarrow.compute as pc
+from tqdm.auto import tqdm
+
+KEEP_LOWEST_ID = "lowest_id"
+KEEP_LONGEST_TEXT = "longest_text"
+KEEP_SOURCE_PRIORITY = "source_priority"
+KEEP_RULES = (KEEP_LOWEST_ID, KEEP_LONGEST_TEXT, KEEP_SOURCE_PRIORITY)
+
+
+class DisjointSet:
+    """
+    A disjoint-set (union-find) structure over the integer row ids of a dataset.
+    โครงสร้างข้อมูล disjoint-set (union-find) สำหรับดัชนีแถวของชุดข้อมูล
+    """
+
+    def __init__(self, size):
+        self.parent = np.arange(size, dtype=np.int64)
+        self.rank = np.zeros(size, dtype=np.int8)
+
+    def find(self, x):
+        parent = self.parent
+        # Path halving: point every visited node to its grandparent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return
+        if self.rank[x] < self.rank[y]:
+            x, y = y, x
+        self.parent[y] = x
+        if self.rank[x] == self.rank[y]:
+            self.rank[x] += 1
+
+
+def cluster_duplicates(edges, num_rows, batch_size):
+    """
+    This function groups documents into clusters, the connected components of the verified duplicate graph.
+
+    ฟังก์ชันนี้มีไว้เพื่อจัดกลุ่มเอกสารที่ซ้ำกันตามส่วนประกอบที่เชื่อมต่อกันของกราฟข้อมูลซ้ำ
+
+    Parameters:
+    edges (Dataset): A dataset of verified duplicate pairs with `src` and `dst` row ids.
+                     ชุดข้อมูลคู่เอกสารที่ซ้ำกันซึ่งมีคอลัมน์ `src` และ `dst`
+    num_rows (int): The number of rows in the pretraining dataset.
+                    จำนวนแถวของชุดข้อมูลการฝึก
+    batch_size (int): The number of edges read per batch.
+                      จำนวนคู่ที่อ่านในแต่ละชุด
+
+    Returns:
+    tuple: The row ids that belong to a cluster and the cluster id (root row id) of each of them.
+           ดัชนีของเอกสารที่อยู่ในกลุ่ม และรหัสกลุ่มของแต่ละเอกสาร
+    """
+    # Without any duplicate there is no cluster, and the empty `Dataset.map` output has no columns
+    if len(edges) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    disjoint_set = DisjointSet(num_rows)
+    edges = edges.with_format("numpy", columns=["src", "dst"])
+
+    for i in tqdm(
+        range(0, len(edges), batch_size),
+        dynamic_ncols=True,
+        desc="Clustering duplicates...",
+    ):
+        batch = edges[i : i + batch_size]
+        for src, dst in zip(batch["src"], batch["dst"]):
+            disjoint_set.union(src, dst)
+
+    members = np.unique(
+        np.concatenate([edges["src"], edges["dst"]]).astype(np.int64)
+    )
+    cluster_ids = np.fromiter(
+        (disjoint_set.find(member) for member in members),
+        dtype=np.int64,
+        count=len(members),
+    )
+    return members, cluster_ids
+
+
+def select_representatives(members, cluster_ids, dataset, keep_rule, source_priority=None):
+    """
+    This function picks exactly one document to keep in every cluster.
+
+    ฟังก์ชันนี้มีไว้เพื่อเลือกเอกสารเพียงหนึ่งรายการที่จะเก็บไว้ในแต่ละกลุ่ม
+
+    Parameters:
+    members (np.ndarray): The row ids that belong to a cluster.
+                          ดัชนีของเอกสารที่อยู่ในกลุ่ม
+    cluster_ids (np.ndarray): The cluster id of each member.
+                              รหัสกลุ่มของแต่ละเอกสาร
+    dataset (Dataset): The dataset holding the `text` and `source` columns of the members.
+                       ชุดข้อมูลที่มีคอลัมน์ `text` และ `source`
+    keep_rule (str): `lowest_id`, `longest_text` or `source_priority`.
+                     กฎที่ใช้เลือกเอกสารที่จะเก็บไว้
+    source_priority (list of str, optional): Sources ordered from most to least preferred.
+                                             รายการแหล่งที่มาเรียงตามลำดับความสำคัญ
+
+    Returns:
+    np.ndarray: A boolean mask over `members`, True for the kept representative.
+                อาเรย์ boolean ที่เป็น True สำหรับเอกสารที่ถูกเก็บไว้
+    """
+    if keep_rule not in KEEP_RULES:
+        raise ValueError(f"Unknown keep rule {keep_rule}, expected one of {KEEP_RULES}")
+
+    # Primary sort key per member; ties always go to the lowest row id
+    if keep_rule == KEEP_LONGEST_TEXT:
+        texts = dataset.with_format("arrow")[members.tolist()]["text"]
+        primary = -pc.utf8_length(texts).to_numpy(zero_copy_only=False).astype(np.int64)
+    elif keep_rule == KEEP_SOURCE_PRIORITY:
+        ranks = {source: rank for rank, source in enumerate(source_priority or [])}
+        sources = dataset.with_format("arrow")[members.tolist()]["source"].to_pylist()
+        primary = np.array(
+            [ranks.get(str(source), len(ranks)) for source in sources], dtype=np.int64
+        )
+    else:
+        primary = np.zeros(len(members), dtype=np.int64)
+
+    order = np.lexsort((members, primary, cluster_ids))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = cluster_ids[order][1:] != cluster_ids[order][:-1]
+
+    keep = np.zeros(len(members), dtype=bool)
+    keep[order[first]] = True
+    return keep
@@ -1,67 +1,207 @@
 import numpy as np
-from tqdm.auto import tqdm
-from datasets import load_from_disk, Features, Sequence, Value
-from datasketch import MinHashLSH, LeanMinHash
-
+from datasets import load_from_disk, Dataset, Features, Sequence, Value
+
+from data_processing.core.checkpoint import (
+    dataset_fingerprint,
+    get_stage_checkpoint,
+    run_stage,
+    stage_key,
+    stage_map_kwargs,
+)
 from data_processing.core.constants import MINHASH_SEED
 from data_processing.core.minhash import generate_minhash_signature
+from data_processing.core.selection import (
+    build_keep_mask,
+    read_id_column,
+    select_rows,
+)
+from data_processing.core.lsh_index import (
+    build_band_index,
+    get_signature_matrix,
+    hashvalues_matrix,
+    is_band_index_current,
+    jaccard_scores,
+    load_band_index,
+)
+from data_processing.deduplication.cluster import (
+    KEEP_LOWEST_ID,
+    cluster_duplicates,
+    select_representatives,
+)
 
 DEFAULT_MINHASH_COL_NAME = "text"
 DEFAULT_NUM_PERMUTATION = 128
 N_GRAM = 5
 MINHASH_SEED = 1
 
-
-def query_func(item, idx, index):
+# Deduplication modes: remove every document with a duplicate pair, or keep one per cluster
+MODE_PAIR = "pair"
+MODE_CLUSTER = "cluster"
+
+# Number of candidate pairs scored at once during verification
+VERIFY_BLOCK_SIZE = 65536
+
+# Schema of the duplicate pairs, also kept by an empty result
+DUPLICATE_PAIR_FEATURES = Features(
+    {
+        # Store the ID of the duplicate document.
+        "duplicate_id": Value("int32"),
+        # เก็บ ID ของเอกสารที่ซ้ำกัน
+        # Store the text of the duplicate document.
+        "duplicate_text": Value("string"),
+        # เก็บข้อความของเอกสารที่ซ้ำกัน
+        # Store the source dataset of the duplicate.
+        "duplicate_dataset": Value("string"),
+        # เก็บชุดข้อมูลแหล่งที่มาของข้อมูลที่ซ้ำกัน
+        # Store the original dataset of the document.
+        "original_dataset": Value("string"),
+        # เก็บชุดข้อมูลต้นฉบับของเอกสาร
+        # Store the text of the original document.
+        "original_text": Value("string"),
+        # เก็บข้อความของเอกสารต้นฉบับ
+        # Store the ID of the original document.
+        "original_id": Value("int64"),
+        # เก็บ ID ของเอกสารต้นฉบับ
+        # Store the similarity score (Jaccard index) between documents.
+        "score": Value("float32"),
+        # เก็บคะแนนความคล้ายคลึง (ดัชนี Jaccard) ระหว่างเอกสาร
+    }
+)
+
+
+def query_func(batch, idx, index_path, empty_hashvalues):
     """
-    ฟังก์ชันนี้มีไว้เพื่อค้นหาข้อคยามที่คล้ายคลึงกันสำหรับเอกสารที่ได้รับมา
-    โดยใช้ลายเซ็น MinHash และ MinHashLSH index
-    This function searches for similar documents to the given document using MinHash signature and MinHashLSH index.
+    ฟังก์ชันนี้มีไว้เพื่อค้นหาข้อความที่คล้ายคลึงกันสำหรับเอกสารทั้งชุด
+    โดยใช้ลายเซ็น MinHash และดัชนี LSH แบบ band table ที่เปิดด้วย mmap
+    This function searches for similar documents for a batch of documents using MinHash signatures
+    and the memory-mapped LSH band index shared by all worker processes.
 
     Parameters:
-    item (dict): เอกสารที่ต้องการค้นหา
-                 The document to search for, which includes the pre-generated MinHash signature.
-    idx (int): ดัชนีของเอกสารในชุดข้อมูล
-               The index of the document in the dataset.
-    index (MinHashLSH): ดัชนี MinHashLSH ที่ใช้ในการค้นหาข้อความ
-                        The MinHashLSH index used to find similar documents.
+    batch (dict): ชุดเอกสารที่ต้องการค้นหา
+                  The batch of documents to search for, which includes the pre-generated MinHash signatures.
+    idx (list of int): ดัชนีของเอกสารในชุดข้อมูล
+                       The indices of the documents in the dataset.
+    index_path (str): ไดเรกทอรีของดัชนี LSH ที่ใช้ในการค้นหาข้อความ
+                      The directory of the LSH band index used to find similar documents.
+    empty_hashvalues (np.ndarray): ลายเซ็น MinHash ของข้อความว่าง
+                                   The MinHash signature of an empty text, which is never queried.
 
     Returns:
     dict: พจนานุกรมที่มีข้อความที่ค้นพบและดัชนีของเอกสาร
-          A dictionary containing the list of similar documents found and the index of the document.
+          A dictionary containing the lists of similar documents found and the indices of the documents.
     """
 
-    # ค้นหาข้อความที่คล้ายคลึงกันโดยใช้ลายเซ็น MinHash และ MinHashLSH index
-    # Search for similar documents using MinHash signature and MinHashLSH index.
-    neighbors = [
-        str(dup_idx)
-        for dup_idx in index.query(
-            LeanMinHash(seed=MINHASH_SEED, hashvalues=item["hashvalues"]),
-        )
-        if dup_idx != idx  # ตรวจสอบว่าข้อความที่พบไม่ใช่ตัวเอง
-                           # Ensure that the found document is not the same as the current document.
-    ]
+    # เปิดดัชนีครั้งเดียวต่อ process โดยไม่คัดลอกข้อมูลในหน่วยความจำ
+    # Open the index once per process; the mmap pages are shared instead of copied.
+    index = load_band_index(index_path)
+    hashvalues = hashvalues_matrix(batch["hashvalues"])
+
+    # ข้ามเอกสารที่ว่างเปล่า เพราะจะถูกกรองออกอยู่แล้ว
+    # Skip empty documents, they are filtered out afterwards anyway.
+    is_empty = np.all(hashvalues == empty_hashvalues, axis=1)
+    neighbors = [[] for _ in range(len(idx))]
+    query_rows = np.flatnonzero(~is_empty)
+
+    # ค้นหาข้อความที่คล้ายคลึงกันโดยใช้ลายเซ็น MinHash และดัชนี LSH
+    # Search for similar documents using MinHash signatures and the LSH index.
+    for j, candidates in zip(query_rows, index.query(hashvalues[query_rows])):
+        neighbors[j] = [
+            str(dup_idx)
+            for dup_idx in candidates
+            if dup_idx != idx[j]  # ตรวจสอบว่าข้อความที่พบไม่ใช่ตัวเอง
+                                  # Ensure that the found document is not the same as the current document.
+        ]
 
     # ส่งคืนพจนานุกรมที่มีข้อความที่ค้นพบและดัชนีของเอกสาร
-    # Return a dictionary containing the list of similar documents found and the index of the document.
+    # Return a dictionary containing the lists of similar documents found and the indices of the documents.
     return {"__neighbors__": neighbors, "idx": idx}
 
 
+def get_index_path(deduplicate_args):
+    """
+    This function returns where the LSH band index is stored. It defaults to a directory
+    next to the MinHash signatures when `index_path` is not configured.
+
+    ฟังก์ชันนี้ส่งคืนเส้นทางที่ใช้เก็บดัชนี LSH โดยค่าเริ่มต้นจะอยู่ข้างไดเรกทอรีลายเซ็น MinHash
+    """
+    index_path = getattr(deduplicate_args, "index_path", None)
+    if index_path:
+        return index_path
+    return f"{deduplicate_args.minhash_path.rstrip('/')}_lsh_index"
+
+
+def score_candidate_pairs(batch, idx, pretrain_dataset_minhash, upper_only=False):
+    """
+    This function flattens the neighbors of a batch into (document, neighbor) candidate pairs
+    and scores all of them at once against the columnar signature matrix.
+
+    ฟังก์ชันนี้มีไว้เพื่อแปลงรายการเอกสารที่คล้ายกันทั้งชุดให้เป็นคู่ (เอกสาร, เอกสารที่คล้ายกัน)
+    และคำนวณคะแนน Jaccard ของทุกคู่พร้อมกันจากเมทริกซ์ลายเซ็น
+
+    Parameters:
+    batch (dict): A batch of query results, including MinHash signatures and `__neighbors__`.
+                  ข้อมูลผลการค้นหาที่ถูกแบ่งเป็นชุดย่อย
+    idx (list of int): The row ids of the documents in the pretraining dataset.
+                       ดัชนีของเอกสารในชุดข้อมูลการฝึก
+    pretrain_dataset_minhash (Dataset): The dataset containing MinHash signatures for the documents.
+                                        ชุดข้อมูลที่ประกอบด้วยลายเซ็น MinHash
+    upper_only (bool): Keep only pairs whose neighbor id is greater than the document id,
+                       so every symmetric pair is scored once.
+                       เก็บเฉพาะคู่ที่ดัชนีของเอกสารที่คล้ายกันมากกว่าดัชนีของเอกสาร เพื่อให้ตรวจสอบแต่ละคู่เพียงครั้งเดียว
+
+    Returns:
+    tuple: The batch position, the neighbor id and the Jaccard score of every pair.
+           ตำแหน่งในชุด ดัชนีของเอกสารที่คล้ายกัน และคะแนน Jaccard ของแต่ละคู่
+    """
+
+    # Retrieve the MinHash signatures from the batch.
+    # ดึงค่าลายเซ็น MinHash จากข้อมูลที่รับมา
+    hashvalues = hashvalues_matrix(batch["hashvalues"])
+
+    # Flatten the neighbors of the batch into (document, neighbor) candidate pairs.
+    # แปลงรายการเอกสารที่คล้ายกันทั้งชุดให้เป็นคู่ (เอกสาร, เอกสารที่คล้ายกัน)
+    pair_rows = []
+    pair_neighbors = []
+    for j, neighbors in enumerate(batch["__neighbors__"]):
+        for neighbor in sorted({int(n) for n in neighbors}):
+            if neighbor == idx[j] or (upper_only and neighbor < idx[j]):
+                continue  # Skip if the neighbor is the document itself.
+                # ข้ามเอกสารที่เป็นตัวเอง
+            pair_rows.append(j)
+            pair_neighbors.append(neighbor)
+
+    pair_rows = np.asarray(pair_rows, dtype=np.int64)
+    pair_neighbors = np.asarray(pair_neighbors, dtype=np.int64)
+
+    # Calculate the Jaccard score of every pair against the columnar signature matrix.
+    # คำนวณคะแนน Jaccard ของทุกคู่จากเมทริกซ์ลายเซ็น
+    signatures = get_signature_matrix(pretrain_dataset_minhash)
+    scores = np.empty(len(pair_rows), dtype=np.float64)
+    for start in range(0, len(pair_rows), VERIFY_BLOCK_SIZE):
+        block = slice(start, start + VERIFY_BLOCK_SIZE)
+        scores[block] = jaccard_scores(
+            hashvalues[pair_rows[block]], signatures.take(pair_neighbors[block])
+        )
+
+    return pair_rows, pair_neighbors, scores
+
+
 def process_data(batch, idx, pretrain_dataset_minhash, threshold):
     """
     This function processes a batch of data to find duplicate documents by comparing MinHash signatures
-    and returns the detected duplicates.
+    and returns the detected duplicates. All candidate pairs of the batch are scored at once against the
+    columnar signature matrix, and `text`/`source` are fetched only for the confirmed duplicates.
 
     ฟังก์ชันนี้มีไว้เพื่อประมวลผลข้อมูลชุดหนึ่งเพื่อค้นหาข้อความที่ซ้ำกัน
-    โดยใช้การเปรียบเทียบลายเซ็น MinHash และส่งคืนข้อมูลที่พบว่าซ้ำกัน
+    โดยใช้การเปรียบเทียบลายเซ็น MinHash ของทุกคู่ในชุดพร้อมกัน และดึงข้อความเฉพาะคู่ที่ซ้ำกันจริง
 
     Parameters:
     batch (dict): A batch of data to process, including MinHash signatures.
                   ข้อมูลที่ถูกแบ่งเป็นชุดย่อยเพื่อประมวลผล
     idx (list of int): A list of indices identifying the data in the dataset.
                        รายการของดัชนีที่ใช้ระบุข้อมูลในชุดข้อมูล
-    pretrain_dataset_minhash (dict): The dataset containing MinHash signatures for the documents.
-                                     ชุดข้อมูลที่ประกอบด้วยลายเซ็น MinHash สำหรับข้อมูลที่ต้องการตรวจสอบ
+    pretrain_dataset_minhash (Dataset): The dataset containing MinHash signatures for the documents.
+                                        ชุดข้อมูลที่ประกอบด้วยลายเซ็น MinHash สำหรับข้อมูลที่ต้องการตรวจสอบ
     threshold (float): The threshold value used to determine duplicates.
                        ค่าที่ใช้เป็นเกณฑ์ในการตัดสินว่าข้อมูลใดควรถูกพิจารณาว่าเป็นข้อมูลซ้ำ
 
@@ -70,73 +210,66 @@ def process_data(batch, idx, pretrain_dataset_minhash, threshold):
                           พจนานุกรมที่ประกอบด้วยรายการของข้อมูลที่พบว่าซ้ำกัน
     """
 
-    # Initialize a list to store the results of detected duplicates.
-    duplicate_results = []
-    # สร้างรายการเพื่อเก็บข้อมูลที่พบว่าซ้ำกัน
-    # Retrieve the MinHash signatures from the batch.
-    hashvalues = batch["hashvalues"]
-    # ดึงค่าลายเซ็น MinHash จากข้อมูลที่รับมา
-
-    # Loop over each document in the batch.
-    # วนลูปผ่านแต่ละเอกสารใน batch
-    for j in range(len(idx)):
-        key = idx[j]
-        doc_hash_value = hashvalues[j]
-
-        # Create a LeanMinHash object for the current document.
-        # สร้าง LeanMinHash สำหรับเอกสารปัจจุบัน
-        minhash = LeanMinHash(seed=MINHASH_SEED, hashvalues=doc_hash_value)
-        # Retrieve the list of similar documents.
-        neighbors = set(batch["__neighbors__"][j])
-        # ดึงรายการเอกสารที่คล้ายกัน
-
-        # Loop through the similar documents (neighbors).
-        # วนลูปผ่านเอกสารที่คล้ายกัน
-        for neighbor in neighbors:
-            if neighbor == key:
-                continue  # Skip if the neighbor is the document itself.
-                # ข้ามเอกสารที่เป็นตัวเอง
-            reference = pretrain_dataset_minhash[int(neighbor)]
-            reference_signature = LeanMinHash(
-                seed=MINHASH_SEED, hashvalues=reference["hashvalues"]
-            )
-            # Calculate the Jaccard score.
-            score = minhash.jaccard(reference_signature)
-            # คำนวณคะแนน Jaccard
-
-            # If the score exceeds the threshold, consider it a duplicate.
-            # ถ้าคะแนนมากกว่าหรือเท่ากับเกณฑ์ที่กำหนด ให้ถือว่าเป็นข้อมูลซ้ำ
-            if score > threshold:
-                duplicate_results.append(
-                    {
-                        "duplicate_id": neighbor,
-                        "duplicate_text": reference["text"],
-                        "duplicate_dataset": reference["source"],
-                        "original_dataset": batch["source"][j],
-                        "original_text": batch["text"][j],
-                        "original_id": str(key),
-                        "score": score,
-                    }
-                )
-                break  # Stop checking once a duplicate is found.
-                # หยุดการตรวจสอบเมื่อพบข้อมูลซ้ำ
-
-    # Initialize a dictionary to organize the duplicate results.
-    dict_of_lists = {}
-    # สร้างพจนานุกรมเพื่อนำผลลัพธ์ที่พบมาจัดเก็บ
-
-    # Loop through the list of detected duplicates and organize them into the dictionary.
-    # วนลูปผ่านข้อมูลซ้ำที่พบ และจัดเก็บในรูปแบบพจนานุกรม
-    for dictionary in duplicate_results:
-        for key, value in dictionary.items():
-            if key not in dict_of_lists:
-                dict_of_lists[key] = []
-
-            dict_of_lists[key].append(value)
+    # Score every (document, neighbor) candidate pair of the batch.
+    # คำนวณคะแนน Jaccard ของทุกคู่ (เอกสาร, เอกสารที่คล้ายกัน) ในชุด
+    pair_rows, pair_neighbors, scores = score_candidate_pairs(
+        batch, idx, pretrain_dataset_minhash)
+
+    # Keep the first neighbor above the threshold for each document.
+    # เก็บเอกสารที่คล้ายกันตัวแรกที่มีคะแนนเกินเกณฑ์สำหรับแต่ละเอกสาร
+    is_duplicate = np.flatnonzero(scores > threshold)
+    _, first = np.unique(pair_rows[is_duplicate], return_index=True)
+    confirmed = is_duplicate[first]
+
+    # Fetch text and source only for the confirmed duplicates.
+    # ดึงข้อความและแหล่งที่มาเฉพาะข้อมูลที่ซ้ำกันจริง
+    references = pretrain_dataset_minhash.select_columns(["text", "source"])[
+        pair_neighbors[confirmed].tolist()
+    ]
 
     # Return the dictionary of detected duplicates.
     # ส่งคืนพจนานุกรมที่มีข้อมูลซ้ำที่พบ
-    return dict_of_lists
+    return {
+        "duplicate_id": pair_neighbors[confirmed].tolist(),
+        "duplicate_text": references["text"],
+        "duplicate_dataset": references["source"],
+        "original_dataset": [batch["source"][j] for j in pair_rows[confirmed]],
+        "original_text": [batch["text"][j] for j in pair_rows[confirmed]],
+        "original_id": [idx[j] for j in pair_rows[confirmed]],
+        "score": scores[confirmed].tolist(),
+    }
+
+
+def process_edges(batch, pretrain_dataset_minhash, threshold):
+    """
+    This function verifies the LSH candidate edges of a batch for the clustering mode.
+    Each symmetric pair is scored once, from its lower row id, and only the edges
+    above the threshold are returned.
+
+    ฟังก์ชันนี้มีไว้เพื่อตรวจสอบคู่เอกสารที่ได้จาก LSH สำหรับโหมดการจัดกลุ่ม
+    โดยตรวจสอบแต่ละคู่เพียงครั้งเดียว และส่งคืนเฉพาะคู่ที่มีคะแนนเกินเกณฑ์
+
+    Parameters:
+    batch (dict): A batch of query results, including `idx`, MinHash signatures and `__neighbors__`.
+                  ข้อมูลผลการค้นหาที่ถูกแบ่งเป็นชุดย่อย
+    pretrain_dataset_minhash (Dataset): The dataset containing MinHash signatures for the documents.
+                                        ชุดข้อมูลที่ประกอบด้วยลายเซ็น MinHash
+    threshold (float): The threshold value used to determine duplicates.
+                       ค่าที่ใช้เป็นเกณฑ์ในการตัดสินว่าข้อมูลใดควรถูกพิจารณาว่าเป็นข้อมูลซ้ำ
+
+    Returns:
+    dict: The `src`, `dst` row ids and `score` of the verified duplicate edges.
+          ดัชนี `src`, `dst` และคะแนนของคู่ที่ซ้ำกัน
+    """
+    pair_rows, pair_neighbors, scores = score_candidate_pairs(
+        batch, batch["idx"], pretrain_dataset_minhash, upper_only=True)
+
+    is_duplicate = scores > threshold
+    return {
+        "src": [batch["idx"][j] for j in pair_rows[is_duplicate]],
+        "dst": pair_neighbors[is_duplicate].tolist(),
+        "score": scores[is_duplicate].tolist(),
+    }
 
 
 def prepare_dataset(pretrain_data_args, deduplicate_args):
@@ -168,12 +301,12 @@ def prepare_dataset(pretrain_data_args, deduplicate_args):
     return pretrain_dataset, pretrain_dataset_minhash
 
 
-def generate_minhash_pretrain_dataset(pretrain_dataset_minhash, deduplicate_args, global_config):
+def generate_minhash_pretrain_dataset(pretrain_dataset_minhash, deduplicate_args, global_config, checkpoint=None):
     """
-    This function generates and uses a MinHashLSH index to find similar documents in a pretraining dataset
+    This function generates and uses an LSH band index to find similar documents in a pretraining dataset
     based on MinHash signatures, and returns the filtered dataset containing only those documents with similar neighbors.
 
-    ฟังก์ชันนี้ใช้เพื่อสร้างและใช้งานดัชนี MinHashLSH เพื่อค้นหาเอกสารที่คล้ายกันในชุดข้อมูลการฝึกอบรม
+    ฟังก์ชันนี้ใช้เพื่อสร้างและใช้งานดัชนี LSH เพื่อค้นหาเอกสารที่คล้ายกันในชุดข้อมูลการฝึกอบรม
     โดยอ้างอิงจากลายเซ็น MinHash และส่งคืนชุดข้อมูลที่กรองแล้วซึ่งมีเฉพาะเอกสารที่มีเพื่อนบ้านที่คล้ายกัน
 
     Parameters:
@@ -183,6 +316,8 @@ def generate_minhash_pretrain_dataset(pretrain_dataset_minhash, deduplicate_args
                                     อาร์กิวเมนต์สำหรับการกำจัดข้อมูลซ้ำ รวมถึงเกณฑ์และขนาดแบทช์
     global_config (object/dict): Global configuration settings, including num_perm and num_process.
                                  การตั้งค่าการกำหนดค่าทั่วไป รวมถึง num_perm และ num_process
+    checkpoint (StageCheckpoint): The checkpoint of the stage, an index built with its key is reused. (default is None)
+                                  จุดบันทึกของขั้นตอน ดัชนีที่สร้างด้วยคีย์เดียวกันจะถูกนำกลับมาใช้
 
     Returns:
     pretrain_dataset_minhash_result (Dataset): A filtered dataset containing only documents with similar neighbors.
@@ -194,37 +329,26 @@ def generate_minhash_pretrain_dataset(pretrain_dataset_minhash, deduplicate_args
     empty_hashvalues = generate_minhash_signature(
         "", global_config.num_perm).hashvalues
 
-    # Initialize a MinHashLSH index for efficient similarity search.
-    # เริ่มต้นดัชนี MinHashLSH สำหรับการค้นหาความคล้ายคลึงกันอย่างมีประสิทธิภาพ
-    globals()["minhash_index"] = MinHashLSH(
-        threshold=deduplicate_args.thresold,
-        num_perm=global_config.num_perm,
-    )
-
-    # Insert the MinHash signatures into the LSH index in batches.
-    # แทรกลายเซ็น MinHash ลงในดัชนี LSH เป็นชุดๆ
-    with globals()["minhash_index"].insertion_session() as session:
-        for i in tqdm(
-            range(0, len(pretrain_dataset_minhash),
-                  deduplicate_args.batch_size),
-            dynamic_ncols=True,
-            # Status message during MinHash iteration.
-            desc="Iterating MinHashes...",
-            # ข้อความสถานะระหว่างการทำซ้ำ MinHash
-        ):
-            batch = pretrain_dataset_minhash[i: i +
-                                             deduplicate_args.batch_size]
-            for j, hash_value in enumerate(batch["hashvalues"]):
-                key = i + j
-                session.insert(
-                    key, LeanMinHash(seed=MINHASH_SEED, hashvalues=hash_value)
-                )
+    # Build a read-only LSH band index on disk, shared by the query workers through mmap.
+    # A restarted job reuses the index when it was completed with the key of the checkpoint.
+    # สร้างดัชนี LSH แบบอ่านอย่างเดียวบนดิสก์ ซึ่ง process ที่ใช้ค้นหาจะใช้ร่วมกันผ่าน mmap
+    index_path = get_index_path(deduplicate_args)
+    index_key = checkpoint.key if checkpoint is not None else None
+    if not is_band_index_current(index_path, index_key):
+        build_band_index(
+            pretrain_dataset_minhash,
+            threshold=deduplicate_args.thresold,
+            num_perm=global_config.num_perm,
+            index_path=index_path,
+            batch_size=deduplicate_args.batch_size,
+            key=index_key,
+        )
 
     # Query the MinHash index to find similar (duplicate) documents.
     # สอบถามดัชนี MinHash เพื่อค้นหาเอกสารที่คล้ายกัน (ซ้ำกัน)
     pretrain_dataset_minhash_result = pretrain_dataset_minhash.map(
-        lambda doc, idx: query_func(
-            doc, idx, index=globals()["minhash_index"]),
+        lambda batch, idx: query_func(
+            batch, idx, index_path, empty_hashvalues),
         desc="Querying...",  # Status message during querying.
                              # ข้อความสถานะระหว่างการสอบถาม
         num_proc=global_config.num_process,
@@ -235,20 +359,22 @@ def generate_minhash_pretrain_dataset(pretrain_dataset_minhash, deduplicate_args
                 "idx": Value("int32"),
             }
         ),
-        load_from_cache_file=False,
+        batched=True,
         with_indices=True,
+        **stage_map_kwargs(checkpoint, "query"),
     ).filter(
         lambda x: len(x["__neighbors__"]) > 0
         and not np.array_equal(x["hashvalues"], empty_hashvalues),
         desc="Filtering...",  # Status message during filtering.
                               # ข้อความสถานะระหว่างการกรอง
         num_proc=global_config.num_process,
+        **stage_map_kwargs(checkpoint, "filter", load_from_cache_file=None),
     )
 
     return pretrain_dataset_minhash_result
 
 
-def indentify_duplicate_pretrain_dataset(pretrain_dataset_minhash, pretrain_dataset_minhash_result, deduplicate_args, global_config):
+def indentify_duplicate_pretrain_dataset(pretrain_dataset_minhash, pretrain_dataset_minhash_result, deduplicate_args, global_config, checkpoint=None):
     """
     This function identifies duplicate documents in a pretraining dataset by comparing MinHash signatures.
     It processes the results from a previous MinHash comparison to extract specific duplicate details.
@@ -265,6 +391,8 @@ def indentify_duplicate_pretrain_dataset(pretrain_dataset_minhash, pretrain_data
                                     การตั้งค่าสำหรับการกำจัดข้อมูลซ้ำ รวมถึงเกณฑ์ความคล้ายคลึง
     global_config (object/dict): Global configuration settings, including the number of processes to use.
                                  การตั้งค่าทั่วไป รวมถึงจำนวน process ที่จะใช้
+    checkpoint (StageCheckpoint): The checkpoint of the stage, to resume its map. (default is None)
+                                  จุดบันทึกของขั้นตอน
 
     Returns:
     duplicate_results (Dataset): A dataset containing details of identified duplicates, including IDs, text, and scores.
@@ -274,53 +402,108 @@ def indentify_duplicate_pretrain_dataset(pretrain_dataset_minhash, pretrain_data
     # Map through the MinHash result dataset to identify duplicates by processing each batch.
     # วนลูปผ่านชุดข้อมูลผลลัพธ์ MinHash เพื่อระบุข้อมูลที่ซ้ำกันโดยประมวลผลแต่ละชุด
     duplicate_results = pretrain_dataset_minhash_result.map(
-        lambda batch, idx: process_data(
-            batch, idx, pretrain_dataset_minhash, deduplicate_args.thresold
+        # Use the "idx" column, the row id in the pretraining dataset, for reference during processing.
+        # ใช้คอลัมน์ "idx" ซึ่งเป็นดัชนีในชุดข้อมูลการฝึก เพื่อใช้อ้างอิงในระหว่างการประมวลผล
+        lambda batch: process_data(
+            batch, batch["idx"], pretrain_dataset_minhash, deduplicate_args.thresold
         ),
         # Process in batches to handle large datasets efficiently.
         batched=True,
         # ประมวลผลเป็นชุดเพื่อจัดการกับชุดข้อมูลขนาดใหญ่ได้อย่างมีประสิทธิภาพ
-        with_indices=True,  # Include indices for reference during processing.
-                            # รวมดัชนีเพื่อใช้อ้างอิงในระหว่างการประมวลผล
         # Use multiple processes as defined in global_config.
         num_proc=global_config.num_process,
         # ใช้หลาย process ตามที่กำหนดใน global_config
         # Remove original columns to focus on duplicates.
         remove_columns=pretrain_dataset_minhash_result.column_names,
         # ลบคอลัมน์เดิมเพื่อเน้นที่ข้อมูลซ้ำ
-        # Do not load from cache to ensure fresh processing.
-        load_from_cache_file=False,
-        # ไม่โหลดจากแคชเพื่อให้แน่ใจว่าประมวลผลใหม่
+        # Do not load from the HF cache to ensure fresh processing, only from the shards of the checkpoint.
+        # ไม่โหลดจากแคชเพื่อให้แน่ใจว่าประมวลผลใหม่ ยกเว้นส่วนที่บันทึกไว้ในจุดบันทึก
+        **stage_map_kwargs(checkpoint, "pairs"),
+        features=DUPLICATE_PAIR_FEATURES,
+    )
+
+    # Without any LSH neighbour the map output is empty and has no columns, an empty result keeps the schema.
+    # หากไม่พบเอกสารที่คล้ายกัน ผลลัพธ์จะว่างและไม่มีคอลัมน์ จึงสร้างผลลัพธ์ว่างที่มีคอลัมน์ครบ
+    if len(duplicate_results) == 0:
+        duplicate_results = Dataset.from_dict(
+            {name: [] for name in DUPLICATE_PAIR_FEATURES}, features=DUPLICATE_PAIR_FEATURES)
+
+    # Return the dataset containing details of detected duplicates.
+    return duplicate_results
+    # ส่งคืนชุดข้อมูลที่มีรายละเอียดของข้อมูลที่ซ้ำกันที่ตรวจพบ
+
+
+def indentify_duplicate_clusters(pretrain_dataset_minhash, pretrain_dataset_minhash_result, deduplicate_args, global_config, checkpoint=None):
+    """
+    This function identifies clusters of duplicate documents, the connected components of the verified
+    LSH candidate graph, and keeps exactly one representative per cluster.
+
+    ฟังก์ชันนี้มีไว้เพื่อจัดกลุ่มเอกสารที่ซ้ำกันตามส่วนประกอบที่เชื่อมต่อกันของกราฟคู่เอกสารจาก LSH
+    และเก็บเอกสารไว้เพียงหนึ่งรายการต่อกลุ่ม
+
+    Parameters:
+    pretrain_dataset_minhash (Dataset): A dataset containing MinHash signatures for reference documents.
+                                        ชุดข้อมูลที่มีลายเซ็น MinHash สำหรับเอกสารอ้างอิง
+    pretrain_dataset_minhash_result (Dataset): A dataset containing results from an initial MinHash comparison.
+                                               ชุดข้อมูลที่มีผลลัพธ์จากการเปรียบเทียบ MinHash เบื้องต้น
+    deduplicate_args (object/dict): Deduplication settings, including the similarity threshold,
+                                    `keep_rule` and `source_priority`.
+                                    การตั้งค่าสำหรับการกำจัดข้อมูลซ้ำ รวมถึงเกณฑ์ความคล้ายคลึง และกฎการเลือกเอกสารที่จะเก็บไว้
+    global_config (object/dict): Global configuration settings, including the number of processes to use.
+                                 การตั้งค่าทั่วไป รวมถึงจำนวน process ที่จะใช้
+    checkpoint (StageCheckpoint): The checkpoint of the stage, to resume its map. (default is None)
+                                  จุดบันทึกของขั้นตอน
+
+    Returns:
+    cluster_results (Dataset): A dataset with the `idx`, `cluster_id` and `keep` flag of every clustered document.
+                               ชุดข้อมูลที่มี `idx`, `cluster_id` และ `keep` ของเอกสารที่อยู่ในกลุ่ม
+    """
+
+    # Verify each candidate edge once and keep the ones above the threshold.
+    # ตรวจสอบแต่ละคู่เพียงครั้งเดียว และเก็บเฉพาะคู่ที่มีคะแนนเกินเกณฑ์
+    edges = pretrain_dataset_minhash_result.map(
+        lambda batch: process_edges(
+            batch, pretrain_dataset_minhash, deduplicate_args.thresold
+        ),
+        batched=True,
+        num_proc=global_config.num_process,
+        remove_columns=pretrain_dataset_minhash_result.column_names,
         features=Features(
             {
-                # Store the ID of the duplicate document.
-                "duplicate_id": Value("int32"),
-                # เก็บ ID ของเอกสารที่ซ้ำกัน
-                # Store the text of the duplicate document.
-                "duplicate_text": Value("string"),
-                # เก็บข้อความของเอกสารที่ซ้ำกัน
-                # Store the source dataset of the duplicate.
-                "duplicate_dataset": Value("string"),
-                # เก็บชุดข้อมูลแหล่งที่มาของข้อมูลที่ซ้ำกัน
-                # Store the original dataset of the document.
-                "original_dataset": Value("string"),
-                # เก็บชุดข้อมูลต้นฉบับของเอกสาร
-                # Store the text of the original document.
-                "original_text": Value("string"),
-                # เก็บข้อความของเอกสารต้นฉบับ
-                # Store the ID of the original document.
-                "original_id": Value("string"),
-                # เก็บ ID ของเอกสารต้นฉบับ
-                # Store the similarity score (Jaccard index) between documents.
+                "src": Value("int64"),
+                "dst": Value("int64"),
                 "score": Value("float32"),
-                # เก็บคะแนนความคล้ายคลึง (ดัชนี Jaccard) ระหว่างเอกสาร
             }
         ),
+        desc="Verifying edges...",
+        **stage_map_kwargs(checkpoint, "edges"),
     )
 
-    # Return the dataset containing details of detected duplicates.
-    return duplicate_results
-    # ส่งคืนชุดข้อมูลที่มีรายละเอียดของข้อมูลที่ซ้ำกันที่ตรวจพบ
+    # Build the connected components with a disjoint-set over the row ids.
+    # สร้างกลุ่มเอกสารด้วยโครงสร้าง disjoint-set บนดัชนีของแถว
+    members, cluster_ids = cluster_duplicates(
+        edges, len(pretrain_dataset_minhash), deduplicate_args.batch_size)
+
+    # Pick the document to keep in every cluster.
+    # เลือกเอกสารที่จะเก็บไว้ในแต่ละกลุ่ม
+    keep = select_representatives(
+        members,
+        cluster_ids,
+        pretrain_dataset_minhash,
+        getattr(deduplicate_args, "keep_rule", None) or KEEP_LOWEST_ID,
+        getattr(deduplicate_args, "source_priority", None),
+    )
+
+    return Dataset.from_dict(
+        {"idx": members, "cluster_id": cluster_ids, "keep": keep},
+        features=Features(
+            {
+                "idx": Value("int64"),
+                "cluster_id": Value("int64"),
+                "keep": Value("bool"),
+            }
+        ),
+    )
 
 
 def save_dataset_to_disk(dataset, save_path):
@@ -340,6 +523,30 @@ def save_dataset_to_disk(dataset, save_path):
     dataset.save_to_disk(save_path)
 
 
+def get_duplicate_ids(duplicate_results, deduplicate_args):
+    """
+    This function returns the row ids of the documents to remove, from the results of either deduplication mode.
+    ฟังก์ชันนี้ส่งคืนดัชนีของเอกสารที่ต้องการลบ จากผลการตรวจหาข้อมูลซ้ำของทั้งสองโหมด
+
+    Parameters:
+    duplicate_results (Dataset): The duplicate pairs, or the clusters with their `keep` flag.
+                                 คู่เอกสารที่ซ้ำกัน หรือกลุ่มเอกสารพร้อมคอลัมน์ `keep`
+    deduplicate_args (object/dict): Deduplication settings, including the batch size.
+                                    การตั้งค่าสำหรับการกำจัดข้อมูลซ้ำ รวมถึงขนาดแบทช์
+
+    Returns:
+    np.ndarray: The row ids to remove as int64.
+                ดัชนีของแถวที่ต้องการลบในรูปแบบ int64
+    """
+    if "cluster_id" in duplicate_results.column_names:
+        # Clustering mode: remove every member except the kept representative.
+        # โหมดการจัดกลุ่ม: ลบทุกเอกสารในกลุ่มยกเว้นเอกสารที่ถูกเลือกไว้
+        return read_id_column(
+            duplicate_results, "idx", deduplicate_args.batch_size, where="keep")
+    return read_id_column(
+        duplicate_results, "original_id", deduplicate_args.batch_size)
+
+
 def deduplicate_pretrain_dataset(pretrain_dataset, duplicate_results, pretrain_data_args, deduplicate_args, global_config):
     """
     This function removes duplicate entries from the pretraining dataset based on identified duplicate results.
@@ -363,40 +570,104 @@ def deduplicate_pretrain_dataset(pretrain_dataset, duplicate_results, pretrain_d
                       ชุดข้อมูลที่ถูกล้างข้อมูลแล้วโดยลบข้อมูลซ้ำออก
     """
 
-    # Initialize a set to collect IDs of duplicates to remove.
-    # สร้างชุดเพื่อรวบรวมรหัสของข้อมูลซ้ำที่จะลบ
-    original_ids_to_remove = set()
-
-    # Collect the indices of the original documents that should be removed.
-    # รวบรวมดัชนีของเอกสารต้นฉบับที่ควรถูกลบออก
-    for i in tqdm(
-        range(0, len(duplicate_results), deduplicate_args.batch_size),
-        dynamic_ncols=True,
-        # Status message during index collection.
-        desc="Collecting index to remove...",
-        # ข้อความสถานะระหว่างการรวบรวมดัชนี
-    ):
-        batch = duplicate_results[i: i + deduplicate_args.batch_size]
-        for idx in batch["original_id"]:
-            original_ids_to_remove.add(idx)
+    # Collect the integer row ids of the original documents that should be removed.
+    # รวบรวมดัชนีของเอกสารต้นฉบับที่ควรถูกลบออกเป็นจำนวนเต็ม
+    ids_to_remove = get_duplicate_ids(duplicate_results, deduplicate_args)
 
-    # Filter out the duplicates from the original pretraining dataset.
-    # กรองข้อมูลซ้ำออกจากชุดข้อมูลการฝึกสอนล่วงหน้าต้นฉบับ
-    pretrain_dataset[pretrain_data_args.split] = pretrain_dataset[
-        pretrain_data_args.split
-    ].filter(
-        lambda _, idx: str(idx) not in original_ids_to_remove,
-        desc="Filtering...",  # Status message during filtering.
-                              # ข้อความสถานะระหว่างการกรอง
-        num_proc=global_config.num_process,
-        with_indices=True,
-    )
+    # Keep the remaining rows with a boolean mask, taken by Arrow without a per-row callback.
+    # เก็บแถวที่เหลือด้วย boolean mask โดยไม่ต้องเรียกฟังก์ชันทีละแถว
+    split_dataset = pretrain_dataset[pretrain_data_args.split]
+    keep_mask = build_keep_mask(len(split_dataset), ids_to_remove)
+    pretrain_dataset[pretrain_data_args.split] = select_rows(split_dataset, keep_mask)
 
     # Return the cleaned dataset.
     # ส่งคืนชุดข้อมูลที่ถูกล้างข้อมูลแล้ว
     return pretrain_dataset
 
 
+def find_duplicates(pretrain_dataset_minhash, deduplicate_args, global_config, stage_prefix=""):
+    """
+    This function queries the LSH band index with every signature and verifies the candidates, pair by pair
+    or as clusters, and saves the duplicate results to `save_path_duplicated`.
+
+    ฟังก์ชันนี้ค้นหาเอกสารที่คล้ายกันจากดัชนี LSH ด้วยลายเซ็นทุกรายการ ตรวจสอบคู่ที่พบแบบทีละคู่หรือแบบจัดกลุ่ม
+    และบันทึกผลการตรวจหาข้อมูลซ้ำที่ `save_path_duplicated`
+
+    Parameters:
+    pretrain_dataset_minhash (Dataset): A dataset with the `hashvalues`, `text` and `source` of each document.
+                                        ชุดข้อมูลที่มีลายเซ็น MinHash ข้อความ และแหล่งที่มาของแต่ละเอกสาร
+    deduplicate_args (Namespace): Arguments related to the deduplication process, including the threshold and mode.
+                                  อาร์กิวเมนต์ที่เกี่ยวข้องกับกระบวนการลบความซ้ำซ้อน รวมถึงเกณฑ์และโหมด
+    global_config (Namespace): Configuration settings such as the number of permutations and processes.
+                               การตั้งค่าคอนฟิก เช่น จำนวนการเรียงสับเปลี่ยนและกระบวนการ
+    stage_prefix (str): Prepended to the names of the checkpoint stages. (default is "")
+                        คำนำหน้าชื่อขั้นตอนของจุดบันทึก
+
+    Returns:
+    Dataset: The duplicate results.
+             ผลการตรวจหาข้อมูลซ้ำ
+    """
+
+    # With `checkpoint_path`, each stage is keyed by its input and settings and skipped by a restarted job.
+    # หากกำหนด `checkpoint_path` แต่ละขั้นตอนที่เสร็จแล้วจะถูกข้ามเมื่อเริ่มงานใหม่
+    query_key = stage_key(
+        "query",
+        dataset_fingerprint(pretrain_dataset_minhash),
+        deduplicate_args.thresold,
+        global_config.num_perm,
+    )
+    duplicates_key = stage_key(
+        "duplicates",
+        query_key,
+        getattr(deduplicate_args, "mode", None),
+        getattr(deduplicate_args, "keep_rule", None),
+        list(getattr(deduplicate_args, "source_priority", None) or []),
+    )
+
+    # Query the MinHash index to find similar (duplicate) documents.
+    # สอบถามดัชนี MinHash เพื่อค้นหาเอกสารที่คล้ายกัน (ซ้ำกัน)
+    pretrain_dataset_minhash_result = run_stage(
+        get_stage_checkpoint(global_config, f"{stage_prefix}query", query_key),
+        lambda checkpoint: generate_minhash_pretrain_dataset(
+            pretrain_dataset_minhash, deduplicate_args, global_config, checkpoint),
+        global_config.num_process,
+    )
+
+    # Debugging print statement to verify the results of the MinHash queries.
+    # คำสั่งพิมพ์เพื่อการดีบักเพื่อยืนยันผลลัพธ์ของการสอบถาม MinHash
+    print(pretrain_dataset_minhash_result, "pretrain_dataset_minhash_result")
+
+    # Process the query results to identify duplicates, either pair by pair or as clusters.
+    # ประมวลผลผลการสอบถามเพื่อระบุข้อมูลซ้ำ แบบทีละคู่หรือแบบจัดกลุ่ม
+    if getattr(deduplicate_args, "mode", None) == MODE_CLUSTER:
+        identify_duplicates = indentify_duplicate_clusters
+    else:
+        identify_duplicates = indentify_duplicate_pretrain_dataset
+
+    # The duplicate results checkpoint is saved directly at `save_path_duplicated`.
+    # จุดบันทึกของผลการตรวจหาข้อมูลซ้ำจะถูกบันทึกที่ `save_path_duplicated` โดยตรง
+    duplicates_checkpoint = get_stage_checkpoint(
+        global_config, f"{stage_prefix}duplicates", duplicates_key, data_path=deduplicate_args.save_path_duplicated)
+    duplicate_results = run_stage(
+        duplicates_checkpoint,
+        lambda checkpoint: identify_duplicates(
+            pretrain_dataset_minhash, pretrain_dataset_minhash_result, deduplicate_args, global_config, checkpoint),
+        global_config.num_process,
+    )
+
+    # Debugging print statement to verify the detected duplicates.
+    # คำสั่งพิมพ์เพื่อการดีบักเพื่อยืนยันการตรวจหาข้อมูลซ้ำ
+    print(duplicate_results, "duplicate_results")
+
+    # Save the duplicate detection results to disk.
+    # บันทึกผลการตรวจหาข้อมูลซ้ำลงดิสก์
+    if duplicates_checkpoint is None:
+        save_dataset_to_disk(
+            duplicate_results, deduplicate_args.save_path_duplicated)
+
+    return duplicate_results
+
+
 def deduplicate(pretrain_data_args, deduplicate_args, global_config):
     """
     This function is designed to remove duplicate documents from a pretraining dataset by using MinHash signatures.
@@ -427,29 +698,11 @@ def deduplicate(pretrain_data_args, deduplicate_args, global_config):
     # คำสั่งพิมพ์เพื่อการดีบักเพื่อยืนยันการโหลดชุดข้อมูล MinHash
     print(pretrain_dataset_minhash, "pretrain_dataset_minhash")
 
-    # Query the MinHash index to find similar (duplicate) documents.
-    # สอบถามดัชนี MinHash เพื่อค้นหาเอกสารที่คล้ายกัน (ซ้ำกัน)
-    pretrain_dataset_minhash_result = generate_minhash_pretrain_dataset(
+    # Find the duplicates, each stage is skipped by a restarted job when `checkpoint_path` is set.
+    # ค้นหาข้อมูลซ้ำ โดยขั้นตอนที่เสร็จแล้วจะถูกข้ามเมื่อเริ่มงานใหม่ หากกำหนด `checkpoint_path`
+    duplicate_results = find_duplicates(
         pretrain_dataset_minhash, deduplicate_args, global_config)
 
-    # Debugging print statement to verify the results of the MinHash queries.
-    # คำสั่งพิมพ์เพื่อการดีบักเพื่อยืนยันผลลัพธ์ของการสอบถาม MinHash
-    print(pretrain_dataset_minhash_result, "pretrain_dataset_minhash_result")
-
-    # Process the query results to identify duplicates.
-    # ประมวลผลผลการสอบถามเพื่อระบุข้อมูลซ้ำ
-    duplicate_results = indentify_duplicate_pretrain_dataset(
-        pretrain_dataset_minhash, pretrain_dataset_minhash_result, deduplicate_args, global_config)
-
-    # Debugging print statement to verify the detected duplicates.
-    # คำสั่งพิมพ์เพื่อการดีบักเพื่อยืนยันการตรวจหาข้อมูลซ้ำ
-    print(duplicate_results, "duplicate_results")
-
-    # Save the duplicate detection results to disk.
-    # บันทึกผลการตรวจหาข้อมูลซ้ำลงดิสก์
-    save_dataset_to_disk(
-        duplicate_results, deduplicate_args.save_path_duplicated)
-
     # Filter out the duplicates from the original pretraining dataset.
     # กรองข้อมูลซ้ำออกจากชุดข้อมูลการฝึกสอนล่วงหน้าต้นฉบับ
     deduplicated_pretrain_dataset = deduplicate_pretrain_dataset(
@@ -1,4 +1,12 @@
+from data_processing.core.checkpoint import (
+    dataset_fingerprint,
+    get_stage_checkpoint,
+    run_stage,
+    stage_key,
+    stage_map_kwargs,
+)
 from data_processing.core.minhash import generate_minhash_signature_hf
+from data_processing.core.token_cache import dictionary_version, prepare_token_cache
 
 from datasets import load_from_disk
 
@@ -25,13 +33,16 @@ def prepare_pretrain_dataset(pretrain_data_args):
     return dataset
 
 
-def gen_minhash_signature_dataset(dataset, global_config):
+def gen_minhash_signature_dataset(dataset, global_config, token_cache_path=None, checkpoint=None):
 
     # Generate MinHash signatures for each document in the dataset.
     # สร้างลายเซ็น MinHash สำหรับแต่ละเอกสารในชุดข้อมูล
     signatures = dataset.map(
-        lambda x: generate_minhash_signature_hf(x, global_config.num_perm),
+        lambda x: generate_minhash_signature_hf(
+            x, global_config.num_perm, token_cache_path=token_cache_path),
+        batched=True,
         num_proc=global_config.num_process,
+        **stage_map_kwargs(checkpoint, "signatures", load_from_cache_file=None),
     )
 
     return signatures
@@ -73,10 +84,33 @@ def generate_minhash(pretrain_data_args, minhash_config, global_config):
     # โหลดชุดข้อมูลการฝึกจากเส้นทางที่กำหนด
     dataset = prepare_pretrain_dataset(pretrain_data_args)
 
-    # Generate MinHash signatures for each document in the dataset.
-    # สร้างลายเซ็น MinHash สำหรับแต่ละเอกสารในชุดข้อมูล
-    signatures = gen_minhash_signature_dataset(dataset, global_config)
+    # With `checkpoint_path`, the signatures are saved as a stage checkpoint and reused by a restarted job.
+    # หากกำหนด `checkpoint_path` ลายเซ็นจะถูกบันทึกเป็นจุดบันทึก และงานที่เริ่มใหม่จะนำกลับมาใช้
+    checkpoint = get_stage_checkpoint(
+        global_config,
+        "minhash",
+        stage_key(
+            dataset_fingerprint(dataset),
+            global_config.num_perm,
+            dictionary_version(minhash_config.newmm_dict),
+        ),
+        data_path=minhash_config.save_path,
+    )
+
+    def compute_signatures(checkpoint):
+        # Segment the dataset once per dictionary when a token cache is configured.
+        # ตัดคำชุดข้อมูลเพียงครั้งเดียวต่อพจนานุกรม หากมีการกำหนดแคชการตัดคำ
+        token_cache_path = prepare_token_cache(
+            dataset, "text", minhash_config, global_config.num_process)
+
+        # Generate MinHash signatures for each document in the dataset.
+        # สร้างลายเซ็น MinHash สำหรับแต่ละเอกสารในชุดข้อมูล
+        return gen_minhash_signature_dataset(
+            dataset, global_config, token_cache_path, checkpoint)
+
+    signatures = run_stage(checkpoint, compute_signatures, global_config.num_process)
 
     # Save the generated signatures to the specified path on disk.
     # บันทึกลายเซ็นที่สร้างขึ้นไปยังเส้นทางที่กำหนดลงดิสก์
-    save_dataset_to_disk(signatures, minhash_config, global_config)
+    if checkpoint is None:
+        save_dataset_to_disk(signatures, minhash_config, global_config)
@@ -0,0 +1,282 @@
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def is_word_char(char: str) -> bool:
+    # Same definition of a word character as `\b` of Python's `re` on str patterns
+    return char.isalnum() or char == "_"
+
+
+class KeywordMatcher:
+    """
+    This class is an Aho-Corasick automaton over the keyword lists of every category. One pass over
+    a text finds the keywords of all categories, and the cost of the pass does not grow with the
+    number of keywords.
+
+    The counts are the same as `len(re.compile("|".join(words)).findall(text))` for each category:
+    matches of one category do not overlap, the leftmost match wins, and at the same position the
+    keyword listed first wins.
+
+    คลาสนี้เป็น automaton แบบ Aho-Corasick ที่สร้างจากรายการคำของทุกหมวดหมู่
+    สามารถหาคำของทุกหมวดหมู่ได้ในการอ่านข้อความเพียงรอบเดียว โดยเวลาที่ใช้ไม่เพิ่มขึ้นตามจำนวนคำ
+    จำนวนที่นับได้จะเท่ากับการใช้ `findall` ของ regex ที่สร้างจาก `"|".join(words)` ของแต่ละหมวดหมู่
+    """
+
+    def __init__(self):
+        self.categories: List[str] = []
+        # Keywords of each category in list order: (word, boundary_start, boundary_end)
+        self.keywords: Dict[str, List[Tuple[str, bool, bool]]] = {}
+        self.built = False
+
+    def add(self, category: str, word: str, boundary_start: bool = False, boundary_end: bool = False):
+        """
+        Add a keyword to a category, after the keywords already added.
+        เพิ่มคำในหมวดหมู่ ต่อท้ายคำที่เพิ่มไว้แล้ว
+
+        Parameters:
+        category (str): The category of the keyword.
+                        หมวดหมู่ของคำ
+        word (str): The literal keyword. Blank lines of the word lists are ignored.
+                    คำที่ต้องการค้นหา บรรทัดว่างจะถูกข้าม
+        boundary_start (bool): The keyword must start at a word boundary, like a leading `\\b`. (default is False)
+                               คำต้องเริ่มต้นที่ขอบของคำ
+        boundary_end (bool): The keyword must end at a word boundary, like a trailing `\\b`. (default is False)
+                             คำต้องสิ้นสุดที่ขอบของคำ
+        """
+        if category not in self.keywords:
+            self.categories.append(category)
+            self.keywords[category] = []
+        if word:
+            self.keywords[category].append((word, boundary_start, boundary_end))
+        self.built = False
+
+    def add_words(self, category: str, words: Iterable[str]):
+        for word in words:
+            self.add(category, word)
+
+    def build(self) -> "KeywordMatcher":
+        """
+        Build the automaton. It is built again after keywords are added.
+        สร้าง automaton ซึ่งจะถูกสร้างใหม่เมื่อมีการเพิ่มคำ
+        """
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[Tuple[int, int, int, bool, bool]]] = [[]]
+
+        # Build the trie, each final state remembers (category, rank, length, boundaries) of its keywords
+        for category_id, category in enumerate(self.categories):
+            for rank, (word, boundary_start, boundary_end) in enumerate(self.keywords[category]):
+                state = 0
+                for char in word:
+                    if char not in goto[state]:
+                        goto.append({})
+                        outputs.append([])
+                        goto[state][char] = len(goto) - 1
+                    state = goto[state][char]
+                outputs[state].append((category_id, rank, len(word), boundary_start, boundary_end))
+
+        # Breadth-first pass for the failure links. Each state keeps the transitions of its failure
+        # chain, except those already taken from the root, so a step is one or two dict lookups.
+        root = goto[0]
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [{} for _ in goto]
+        queue = deque(root.values())
+        while queue:
+            state = queue.popleft()
+            delta[state] = dict(delta[fail[state]]) if fail[state] else {}
+            for char, next_state in goto[state].items():
+                delta[state][char] = next_state
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                queue.append(next_state)
+            delta[state] = {char: s for char, s in delta[state].items() if root.get(char) != s}
+            outputs[state] = outputs[state] + outputs[fail[state]]
+
+        self.root = root
+        self.delta = delta
+        self.outputs = outputs
+        self.max_lengths = [
+            max((len(word) for word, _, _ in self.keywords[category]), default=0)
+            for category in self.categories
+        ]
+        self.built = True
+        return self
+
+    def ending_at(self, state: int, text: str, end: int) -> List[Tuple[int, int, int]]:
+        # (category id, start, rank) of the keywords of a state that end at `end` and pass their boundary checks
+        found = []
+        for category_id, rank, length, boundary_start, boundary_end in self.outputs[state]:
+            start = end - length
+            if boundary_start and not self.is_boundary(text, start):
+                continue
+            if boundary_end and not self.is_boundary(text, end):
+                continue
+            found.append((category_id, start, rank))
+        return found
+
+    def iter_occurrences(self, text: str) -> Iterator[Tuple[int, int, int, int]]:
+        """
+        Scan the text once and yield every occurrence of every keyword, including overlapping ones,
+        in the order of their end offset.
+
+        อ่านข้อความหนึ่งรอบและส่งคืนทุกตำแหน่งที่พบคำ รวมถึงคำที่ซ้อนทับกัน เรียงตามตำแหน่งสิ้นสุด
+
+        Returns:
+        Iterator[Tuple[int, int, int, int]]: (category id, start, rank, end) of each occurrence.
+                                             หมวดหมู่ ตำแหน่งเริ่มต้น ลำดับของคำ และตำแหน่งสิ้นสุด
+        """
+        if not self.built:
+            self.build()
+
+        root, delta, outputs = self.root, self.delta, self.outputs
+        state = 0
+        for i, char in enumerate(text):
+            next_state = delta[state].get(char)
+            state = root.get(char, 0) if next_state is None else next_state
+            if outputs[state]:
+                for category_id, start, rank in self.ending_at(state, text, i + 1):
+                    yield category_id, start, rank, i + 1
+
+    def find(self, text: str) -> List[List[Tuple[int, int, int]]]:
+        """
+        Find every occurrence of every keyword, grouped by category id as (start, rank, end).
+        ค้นหาคำทั้งหมดที่พบในข้อความ แยกตามหมวดหมู่
+        """
+        occurrences: List[List[Tuple[int, int, int]]] = [[] for _ in self.categories]
+        for category_id, start, rank, end in self.iter_occurrences(text):
+            occurrences[category_id].append((start, rank, end))
+        return occurrences
+
+    @staticmethod
+    def is_boundary(text: str, position: int) -> bool:
+        before = position > 0 and is_word_char(text[position - 1])
+        after = position < len(text) and is_word_char(text[position])
+        return before != after
+
+    @staticmethod
+    def select(occurrences: List[Tuple[int, int, int]]) -> List[Tuple[int, int]]:
+        # Leftmost non-overlapping matches, the keyword listed first wins at the same start (like `findall`)
+        matches = []
+        last_end = 0
+        for start, _, end in sorted(occurrences):
+            if start >= last_end:
+                matches.append((start, end))
+                last_end = end
+        return matches
+
+    def count(self, text: str) -> Dict[str, int]:
+        """
+        Count the matches of every category in one pass over the text.
+        นับจำนวนคำที่ตรงกันของทุกหมวดหมู่ในการอ่านข้อความรอบเดียว
+
+        Parameters:
+        text (str): The text to search.
+                    ข้อความที่ต้องการค้นหา
+
+        Returns:
+        Dict[str, int]: The number of matches of each category.
+                        จำนวนคำที่ตรงกันของแต่ละหมวดหมู่
+        """
+        occurrences = self.find(text)
+        return {
+            category: len(self.select(occurrences[category_id]))
+            for category_id, category in enumerate(self.categories)
+        }
+
+    def first_to_reach(self, text: str, thresholds: Dict[str, int]) -> Optional[Tuple[str, int, int]]:
+        """
+        This function scans the text until one category reaches its threshold and stops there, without
+        collecting the matches. The count of a category is the same as in `count`, so the text is flagged
+        exactly when `count(text)[category] >= threshold` for some category.
+
+        A match is only counted once no longer keyword can still start before it, that is after the scan
+        has moved the longest keyword of its category past its start.
+
+        ฟังก์ชันนี้อ่านข้อความจนกว่าจะมีหมวดหมู่ใดที่จำนวนคำถึงเกณฑ์ และหยุดอ่านทันที โดยไม่เก็บรายการคำที่พบ
+
+        Parameters:
+        text (str): The text to search.
+                    ข้อความที่ต้องการค้นหา
+        thresholds (Dict[str, int]): The threshold of each category to check, other categories are ignored.
+                                     เกณฑ์ของแต่ละหมวดหมู่ที่ต้องการตรวจสอบ
+
+        Returns:
+        Optional[Tuple[str, int, int]]: The category that reached its threshold, with the start and end
+                                        offsets of the match that reached it, or None.
+                                        หมวดหมู่ที่ถึงเกณฑ์ พร้อมตำแหน่งของคำที่ทำให้ถึงเกณฑ์ หรือ None
+        """
+        if not self.built:
+            self.build()
+
+        limits = {
+            self.categories.index(category): threshold
+            for category, threshold in thresholds.items()
+            if category in self.keywords
+        }
+        for category_id, limit in limits.items():
+            # Like `len(findall(text)) >= 0`, a threshold of zero is always reached
+            if limit <= 0:
+                return self.categories[category_id], 0, 0
+
+        counts = dict.fromkeys(limits, 0)
+        last_ends = dict.fromkeys(limits, 0)
+        pending: Dict[int, List[Tuple[int, int, int]]] = {category_id: [] for category_id in limits}
+
+        def can_reach(category_id):
+            return counts[category_id] + len(pending[category_id]) >= limits[category_id]
+
+        def settle(category_id, position):
+            # Greedily select the pending occurrences whose start can no longer be beaten
+            occurrences = sorted(pending[category_id])
+            max_length = self.max_lengths[category_id]
+            settled = 0
+            for start, _, end in occurrences:
+                if start + max_length > position:
+                    break
+                settled += 1
+                if start >= last_ends[category_id]:
+                    counts[category_id] += 1
+                    last_ends[category_id] = end
+                    if counts[category_id] >= limits[category_id]:
+                        return start, end
+            pending[category_id] = occurrences[settled:]
+            return None
+
+        def next_deadline():
+            # The earliest scan offset at which a category that can still reach its threshold settles
+            deadlines = [
+                min(start for start, _, _ in pending[category_id]) + self.max_lengths[category_id]
+                for category_id in limits
+                if pending[category_id] and can_reach(category_id)
+            ]
+            return min(deadlines, default=None)
+
+        root, delta, outputs = self.root, self.delta, self.outputs
+        state = 0
+        deadline = None
+        for i, char in enumerate(text):
+            next_state = delta[state].get(char)
+            state = root.get(char, 0) if next_state is None else next_state
+            end = i + 1
+            if outputs[state]:
+                for category_id, start, rank in self.ending_at(state, text, end):
+                    if category_id in pending:
+                        pending[category_id].append((start, rank, end))
+                        if can_reach(category_id):
+                            deadline = next_deadline()
+            if deadline is not None and end >= deadline:
+                for category_id in limits:
+                    if pending[category_id] and can_reach(category_id):
+                        match = settle(category_id, end)
+                        if match is not None:
+                            return (self.categories[category_id], *match)
+                deadline = next_deadline()
+
+        # End of text, every pending occurrence is final
+        for category_id in limits:
+            if pending[category_id] and can_reach(category_id):
+                match = settle(category_id, len(text) + self.max_lengths[category_id])
+                if match is not None:
+                    return (self.categories[category_id], *match)
+        return None
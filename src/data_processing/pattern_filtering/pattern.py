@@ -1,6 +1,7 @@
 from datetime import datetime
 import pandas as pd
-from typing import List, Dict, Pattern
+from typing import Callable, List, Dict, NamedTuple, Optional, Pattern
+import os
 import re
 import argparse
 
@@ -27,7 +28,8 @@ from data_processing.pattern_filtering.words_pattern import (
     GARBAGE_RE,
     GARBAGE_THRESHOLD,
     PORN_RE,
-    PORN_THRESHOLD
+    PORN_THRESHOLD,
+    WORD_MATCHER,
 )
 
 # Regular Expression Pattern
@@ -81,8 +83,42 @@ from data_processing.pattern_filtering.regex_pattern import (
     REFINE12_RE,
     REFINE13_RE,
     REFINE14_RE,
+    PAGE_REQUIRED,
+    EMBEDDED_SERVER_REQUIRED,
+    BLOCK_REQUIRED,
+    EMAIL_REQUIRED,
+    URL_REQUIRED,
+    MENU1_REQUIRED,
+    MENU1_MIN_COUNT,
+    MENU2_REQUIRED,
+    MENU2_MIN_COUNT,
+    MENU3_REQUIRED,
+    MENU3_MIN_COUNT,
+    MENU4_REQUIRED,
+    HASHTAG_REQUIRED,
+    SIDEBAR_REQUIRED,
+    MARKUP_REQUIRED,
+    IFRAME_REQUIRED,
+    IP_REQUIRED,
+    DATE2_REQUIRED,
+    HTML_REQUIRED,
+    REFINE1_REQUIRED,
+    REFINE2_REQUIRED,
+    REFINE3_REQUIRED,
+    REFINE4_REQUIRED,
+    REFINE5_REQUIRED,
+    REFINE6_REQUIRED,
+    REFINE7_REQUIRED,
+    REFINE8_REQUIRED,
+    REFINE9_REQUIRED,
+    REFINE10_REQUIRED,
+    REFINE11_REQUIRED,
+    REFINE12_REQUIRED,
+    REFINE13_REQUIRED,
 )
 
+from data_processing.pattern_filtering.rule_engine import RegexRule, RuleEngine
+
 # Default Word Pattern
 LIST_WORD_PATTERN = [
     {"KEY": "GAMBLE", "VALUE": {"PATTERN": GAMBLE_RE, "THRESHOLD": GAMBLE_THRESHOLD}},
@@ -130,6 +166,143 @@ LIST_WORD_PATTERN = [
 
 WORD_PATTERN_FILTER = None
 
+# Substitution rules of clean_text, applied in this order
+# กฎการแทนที่ของ clean_text ซึ่งจะถูกใช้ตามลำดับนี้
+CLEAN_TEXT_RULES = [
+    RegexRule(GAMBLE_RE),
+    RegexRule(PORN_RE),
+    RegexRule(PAGE_RE, PAGE_REQUIRED),
+    RegexRule(EMBEDDED_SERVER_RE, EMBEDDED_SERVER_REQUIRED),
+    RegexRule(U_RE),
+    RegexRule(EMAIL_RE, EMAIL_REQUIRED),
+    RegexRule(URL_RE, URL_REQUIRED),
+    RegexRule(MENU1_RE, MENU1_REQUIRED, MENU1_MIN_COUNT),
+    RegexRule(MENU2_RE, MENU2_REQUIRED, MENU2_MIN_COUNT),
+    RegexRule(MENU3_RE, MENU3_REQUIRED, MENU3_MIN_COUNT),
+    RegexRule(MENU4_RE, MENU4_REQUIRED),
+    RegexRule(SIDEBAR_RE, SIDEBAR_REQUIRED),
+    RegexRule(BLOCK_RE, BLOCK_REQUIRED),
+    RegexRule(HASHTAG_RE, HASHTAG_REQUIRED),
+    RegexRule(MARKUP_RE, MARKUP_REQUIRED),
+    RegexRule(IFRAME_RE, IFRAME_REQUIRED),
+    RegexRule(IP_RE, IP_REQUIRED),
+    RegexRule(TEL_RE),
+    RegexRule(DATE1_RE),
+    RegexRule(DATE2_RE, DATE2_REQUIRED),
+    RegexRule(HTML_RE, HTML_REQUIRED),
+    # Additional rules to refine the text further
+    # กฎเพิ่มเติมเพื่อปรับแต่งข้อความ (เรียงตามลำดับ)
+    RegexRule(REFINE1_RE, REFINE1_REQUIRED),
+    RegexRule(REFINE2_RE, REFINE2_REQUIRED),
+    RegexRule(REFINE3_RE, REFINE3_REQUIRED),
+    RegexRule(REFINE4_RE, REFINE4_REQUIRED),
+    RegexRule(REFINE5_RE, REFINE5_REQUIRED),
+    RegexRule(REFINE6_RE, REFINE6_REQUIRED),
+    RegexRule(REFINE7_RE, REFINE7_REQUIRED),
+    RegexRule(REFINE8_RE, REFINE8_REQUIRED),
+    RegexRule(REFINE9_RE, REFINE9_REQUIRED),
+    RegexRule(REFINE10_RE, REFINE10_REQUIRED),
+    RegexRule(REFINE11_RE, REFINE11_REQUIRED),
+    RegexRule(REFINE12_RE, REFINE12_REQUIRED),
+    RegexRule(REFINE13_RE, REFINE13_REQUIRED),
+    RegexRule(REFINE14_RE),
+]
+
+CLEAN_TEXT_ENGINE = RuleEngine(CLEAN_TEXT_RULES)
+
+class RemoveVerdict(NamedTuple):
+    """
+    The reason a document is removed: the pattern that reached its threshold first.
+    เหตุผลที่เอกสารถูกลบ คือรูปแบบคำที่ถึงเกณฑ์เป็นรูปแบบแรก
+
+    key (str): The KEY of the pattern in LIST_WORD_PATTERN. / ชื่อของรูปแบบคำ
+    offset (int): The character offset of the match that reached the threshold. / ตำแหน่งของคำที่ทำให้ถึงเกณฑ์
+    threshold (int): The threshold of the pattern. / เกณฑ์ของรูปแบบคำ
+    """
+
+    key: str
+    offset: int
+    threshold: int
+
+
+# Opt-in debug hook, called with every checked text and its verdict (None when the text is kept)
+# ฟังก์ชันสำหรับดีบัก จะถูกเรียกพร้อมข้อความและผลการตรวจสอบ (None หากข้อความไม่ถูกลบ)
+REMOVE_DEBUG_HOOK: Optional[Callable[[str, Optional[RemoveVerdict]], None]] = None
+
+
+def print_remove_verdict(text: str, verdict: Optional[RemoveVerdict]):
+    if verdict is None:
+        print("keep")
+    else:
+        print(verdict.key, verdict.threshold, repr(text[verdict.offset : verdict.offset + 50]))
+
+
+def find_threshold_match(pattern: Pattern, text: str, threshold: int) -> Optional[int]:
+    # Offset of the match that brings the count to the threshold, scanning stops there
+    if threshold <= 0:
+        return 0
+    for num_matches, match in enumerate(pattern.finditer(text), 1):
+        if num_matches >= threshold:
+            return match.start()
+    return None
+
+
+def check_remove_document(text: str) -> Optional[RemoveVerdict]:
+    """
+    This function checks the text against the word patterns (only those in WORD_PATTERN_FILTER when it
+    is set) and returns why it should be removed. Scanning stops as soon as one pattern reaches its
+    threshold: every keyword category is checked in a single pass over the text, then the other
+    patterns are checked one by one.
+
+    ฟังก์ชันนี้ตรวจสอบข้อความกับรูปแบบคำ และส่งคืนเหตุผลที่ข้อความควรถูกลบ
+    โดยจะหยุดอ่านข้อความทันทีที่มีรูปแบบใดถึงเกณฑ์ หมวดหมู่คำทั้งหมดถูกตรวจสอบในการอ่านข้อความรอบเดียว
+    จากนั้นจึงตรวจสอบรูปแบบอื่นทีละรูปแบบ
+
+    Parameters:
+    text (str): ข้อความที่ต้องการตรวจสอบ / The text to be checked
+
+    Returns:
+    Optional[RemoveVerdict]: รูปแบบคำที่ถึงเกณฑ์ หรือ None ถ้าข้อความไม่ควรถูกลบ
+                             The pattern that reached its threshold, or None if the text should be kept.
+    """
+
+    # Split the patterns to check into keyword categories and other regex patterns
+    # แยกรูปแบบที่ต้องตรวจสอบเป็นหมวดหมู่คำ และรูปแบบ regex อื่น ๆ
+    keyword_thresholds = {}
+    other_patterns = []
+    for WP in LIST_WORD_PATTERN:
+        if WORD_PATTERN_FILTER != None and WP["KEY"] not in WORD_PATTERN_FILTER:
+            continue
+        WORD_THRESHOLD = int(WP["VALUE"]["THRESHOLD"])
+        if WP["KEY"] in WORD_MATCHER.keywords:
+            keyword_thresholds[WP["KEY"]] = WORD_THRESHOLD
+        else:
+            other_patterns.append((WP["KEY"], WP["VALUE"]["PATTERN"], WORD_THRESHOLD))
+
+    verdict = None
+
+    # All keyword categories in one pass, stopping at the first category that reaches its threshold
+    # ตรวจสอบทุกหมวดหมู่คำในการอ่านรอบเดียว และหยุดเมื่อมีหมวดหมู่ที่ถึงเกณฑ์
+    match = WORD_MATCHER.first_to_reach(text, keyword_thresholds)
+    if match is not None:
+        key, offset, _ = match
+        verdict = RemoveVerdict(key, offset, keyword_thresholds[key])
+
+    # The other patterns, each scan stops once the threshold is reached
+    # รูปแบบอื่น ๆ โดยแต่ละรูปแบบจะหยุดอ่านเมื่อถึงเกณฑ์
+    if verdict is None:
+        for key, WORD_PATTERN, WORD_THRESHOLD in other_patterns:
+            offset = find_threshold_match(WORD_PATTERN, text, WORD_THRESHOLD)
+            if offset is not None:
+                verdict = RemoveVerdict(key, offset, WORD_THRESHOLD)
+                break
+
+    if REMOVE_DEBUG_HOOK is not None:
+        REMOVE_DEBUG_HOOK(text, verdict)
+
+    return verdict
+
+
 def clean_with_remove_document(text: str) -> bool:
     """
     This function is designed to check and filter text based on predefined word patterns.
@@ -137,6 +310,7 @@ def clean_with_remove_document(text: str) -> bool:
     as determined by the threshold. If the text meets or exceeds the threshold for any
     pattern, the function returns True, indicating that the text should be removed. If
     none of the patterns reach their threshold, the function returns False.
+    Use `check_remove_document` to know which pattern was reached.
     
     ฟังก์ชันนี้มีไว้เพื่อตรวจสอบและกรองข้อความที่ตรงกับรูปแบบคำที่กำหนด
     โดยจะตรวจสอบว่ามีจำนวนคำที่ตรงกับรูปแบบ (pattern) ถึงเกณฑ์ที่กำหนดหรือไม่
@@ -150,54 +324,79 @@ def clean_with_remove_document(text: str) -> bool:
     bool: True ถ้าข้อความควรถูกลบออก (ตรงกับรูปแบบคำและเกณฑ์ที่กำหนด), False ถ้าไม่ตรง
           True if the text should be removed; False otherwise.
     """
+    return check_remove_document(text) is not None
 
-    # If no specific word pattern filter is provided, process all patterns in the list
-    # ถ้าไม่มีการกำหนดตัวกรองรูปแบบคำ (WORD_PATTERN_FILTER == None)
-    if WORD_PATTERN_FILTER == None:
-        # Loop through each word pattern in the LIST_WORD_PATTERN
-        # วนลูปผ่านรายการรูปแบบคำใน LIST_WORD_PATTERN
-        for WP in LIST_WORD_PATTERN:
-            # Extract the threshold value for the current pattern
-            # กำหนดเกณฑ์จำนวนคำที่ตรงกับรูปแบบ
-            WORD_THRESHOLD = int(WP["VALUE"]["THRESHOLD"])
-            
-            # Extract the pattern (regular expression) for the current word pattern
-            # กำหนดรูปแบบคำ (pattern)
-            WORD_PATTERN = WP["VALUE"]["PATTERN"]
-            
-            # Find all matches in the text up to the threshold
-            # หาคำที่ตรงกับรูปแบบในข้อความและเก็บใน matches
-            matches = WORD_PATTERN.findall(text)
-            
-            # If the number of matches meets the threshold, return True
-            # ถ้าจำนวนคำที่ตรงกับรูปแบบถึงเกณฑ์ที่กำหนด คืนค่า True
-            print(len(matches), WORD_THRESHOLD)
-            if len(matches) >= WORD_THRESHOLD:
-                return True
-    else:
-        # If specific word pattern filters are provided, process only those
-        # ถ้ามีการกำหนดตัวกรองรูปแบบคำ (WORD_PATTERN_FILTER)
-        for WP in LIST_WORD_PATTERN:
-            if WP["KEY"] in WORD_PATTERN_FILTER:
-                # Extract the threshold and pattern for the current word pattern
-                # กำหนดเกณฑ์จำนวนคำที่ตรงกับรูปแบบ
-                WORD_THRESHOLD = int(WP["VALUE"]["THRESHOLD"])
-                
-                # กำหนดรูปแบบคำ (pattern)
-                WORD_PATTERN = WP["VALUE"]["PATTERN"]
-                
-                # Find all matches in the text up to the threshold
-                # หาคำที่ตรงกับรูปแบบในข้อความและเก็บใน matches
-                matches = WORD_PATTERN.findall(text)
-                
-                # If the number of matches meets the threshold, return True
-                # ถ้าจำนวนคำที่ตรงกับรูปแบบถึงเกณฑ์ที่กำหนด คืนค่า True
-                if len(matches) >= WORD_THRESHOLD:
-                    return True
-
-    # If no patterns meet their threshold, return False
-    # ถ้าไม่มีคำที่ตรงกับรูปแบบและเกณฑ์ที่กำหนด คืนค่า False
-    return False
+
+# Runs of spaces, collapsed to a single space
+SPACES_RE = re.compile("[ ]+")
+
+
+def common_prefix_length(line: str, previous_line: str) -> int:
+    # One scan up to the first differing character, without slicing either line
+    return len(os.path.commonprefix([line, previous_line]))
+
+
+def clean_lines(text: str, cutoff_character_length: int = 30) -> str:
+    """
+    This function removes from each line the prefix it shares with the previous line, drops lines
+    that are not longer than the cutoff length, and normalizes spaces, all in one pass over the
+    lines. The result is the same as splitting and joining the text once per step: runs of spaces
+    become one space, and the whitespace at the start of each line is removed (only one leading
+    space on the first line), along with the lines left empty by it.
+
+    ฟังก์ชันนี้ลบคำนำที่ซ้ำกับบรรทัดก่อนหน้าออกจากแต่ละบรรทัด ลบบรรทัดที่สั้นกว่าเกณฑ์
+    และลบช่องว่างเพิ่มเติม โดยอ่านบรรทัดทั้งหมดเพียงรอบเดียว
+
+    Parameters:
+    text (str): ข้อความที่ต้องการจัดการ / The text to process
+    cutoff_character_length (int, optional): จำนวนตัวอักษรขั้นต่ำที่บรรทัดควรมี (ค่าเริ่มต้นคือ 30)
+                                             The minimum number of characters a line should have. (default is 30)
+
+    Returns:
+    str: ข้อความที่ผ่านการจัดการแล้ว / The processed text
+    """
+    cleaned_lines = []
+    previous_line = None
+    ends_with_blank_line = False
+
+    # Empty lines are skipped before the prefixes are compared
+    # ข้ามบรรทัดว่างก่อนเปรียบเทียบคำนำ
+    for line in text.split("\n"):
+        if not line:
+            continue
+
+        # Remove the prefix shared with the previous non-empty line
+        # ลบคำนำร่วมกับบรรทัดก่อนหน้า
+        if previous_line is None:
+            deduplicated_line = line
+        else:
+            deduplicated_line = line[common_prefix_length(line, previous_line) :]
+        previous_line = line
+
+        # Remove lines that are shorter than the cutoff length
+        # ลบบรรทัดที่สั้นกว่า cutoff_character_length ตัวอักษร
+        if len(deduplicated_line) <= cutoff_character_length:
+            continue
+
+        # Remove extra spaces
+        # ลบช่องว่างเพิ่มเติม
+        if "  " in deduplicated_line:
+            deduplicated_line = SPACES_RE.sub(" ", deduplicated_line)
+        if not cleaned_lines:
+            if deduplicated_line.startswith(" "):
+                deduplicated_line = deduplicated_line[1:]
+        else:
+            deduplicated_line = deduplicated_line.lstrip()
+            if not deduplicated_line:
+                ends_with_blank_line = True
+                continue
+
+        cleaned_lines.append(deduplicated_line)
+        ends_with_blank_line = False
+
+    # A blank last line still leaves its line break
+    # บรรทัดสุดท้ายที่ว่างยังคงเหลือการขึ้นบรรทัดใหม่
+    return "\n".join(cleaned_lines) + ("\n" if ends_with_blank_line else "")
 
 
 def clean_text(text: str, cutoff_character_length = 30) -> str:
@@ -220,84 +419,14 @@ def clean_text(text: str, cutoff_character_length = 30) -> str:
     str: ข้อความที่ผ่านการล้างและทำความสะอาดแล้ว / The cleaned and sanitized text
     """
 
-    # Use various regex patterns to remove unwanted content from the text
-    # ใช้ regex ต่าง ๆ เพื่อลบข้อความที่ไม่ต้องการออก
-    text = GAMBLE_RE.sub(" ", text)
-    text = PORN_RE.sub(" ", text)
-    text = PAGE_RE.sub(" ", text)
-    text = EMBEDDED_SERVER_RE.sub(" ", text)
-    text = U_RE.sub(" ", text)
-    text = EMAIL_RE.sub(" ", text)
-    text = URL_RE.sub(" ", text)
-    text = MENU1_RE.sub(" ", text)
-    text = MENU2_RE.sub(" ", text)
-    text = MENU3_RE.sub(" ", text)
-    text = MENU4_RE.sub(" ", text)
-    text = SIDEBAR_RE.sub(" ", text)
-    text = BLOCK_RE.sub(" ", text)
-    text = HASHTAG_RE.sub(" ", text)
-    text = MARKUP_RE.sub(" ", text)
-    text = IFRAME_RE.sub(" ", text)
-    text = IP_RE.sub(" ", text)
-    text = TEL_RE.sub(" ", text)
-    text = DATE1_RE.sub(" ", text)
-    text = DATE2_RE.sub(" ", text)
-    text = HTML_RE.sub(" ", text)
-
-    # Apply additional regex patterns to refine the text further
-    # ใช้ regex ต่าง ๆ เพื่อปรับแต่งข้อความเพิ่มเติม (เรียงตามลำดับ)
-    text = REFINE1_RE.sub(" ", text)
-    text = REFINE2_RE.sub(" ", text)
-    text = REFINE3_RE.sub(" ", text)
-    text = REFINE4_RE.sub(" ", text)
-    text = REFINE5_RE.sub(" ", text)
-    text = REFINE6_RE.sub(" ", text)
-    text = REFINE7_RE.sub(" ", text)
-    text = REFINE8_RE.sub(" ", text)
-    text = REFINE9_RE.sub(" ", text)
-    text = REFINE10_RE.sub(" ", text)
-    text = REFINE11_RE.sub(" ", text)
-    text = REFINE12_RE.sub(" ", text)
-    text = REFINE13_RE.sub(" ", text)
-    text = REFINE14_RE.sub(" ", text)
-
-    # Split the text into lines and remove any empty lines
-    # แยกข้อความเป็นบรรทัดและลบบรรทัดที่ว่าง
-    lines = [line for line in text.split("\n") if line]
-
-    # Initialize the deduplicated list with the first line
-    # เริ่มต้นรายการด้วยบรรทัดแรก
-    deduplicated_list = [lines[0]]
-
-    # Iterate over the rest of the lines
-    # วนลูปผ่านบรรทัดที่เหลือ
-    for i in range(1, len(lines)):
-        # Find the common prefix between this line and the previous line
-        # หาคำนำร่วมระหว่างบรรทัดนี้และบรรทัดก่อนหน้า
-        common_prefix = ""
-        for char1, char2 in zip(lines[i], lines[i - 1]):
-            if char1 == char2:
-                common_prefix += char1
-            else:
-                break
-
-        # Remove the common prefix from this line and add it to the deduplicated list
-        # ลบคำนำร่วมออกจากบรรทัดนี้และเพิ่มลงในรายการ
-        deduplicated_list.append(lines[i][len(common_prefix) :])
+    # Use various regex patterns to remove unwanted content from the text, rules that
+    # cannot match the current text are skipped
+    # ใช้ regex ต่าง ๆ เพื่อลบข้อความที่ไม่ต้องการออก โดยข้ามกฎที่ไม่สามารถจับคู่กับข้อความได้
+    text = CLEAN_TEXT_ENGINE.sub(text)
 
-    # Join the lines back together
-    # รวมบรรทัดเข้าด้วยกัน
-    text = "\n".join(deduplicated_list)
-
-    # Remove lines that are shorter than the cutoff length
-    # ลบบรรทัดที่สั้นกว่า cutoff_character_length ตัวอักษร
-    text = "\n".join(line for line in text.split("\n") if len(line) > cutoff_character_length)
-
-    # Remove extra spaces before writing the text to disk
-    # ลบช่องว่างเพิ่มเติมก่อนเขียนลงดิสก์
-    text = re.sub("[ ]+", " ", text, 0, re.MULTILINE)
-    text = re.sub("^[ ]", "", text, 0, re.MULTILINE)
-    text = re.sub(r"\n\s*", "\n", text, 0, re.MULTILINE)
+    # Remove repeated line prefixes, short lines and extra spaces
+    # ลบคำนำที่ซ้ำกับบรรทัดก่อนหน้า บรรทัดที่สั้นเกินไป และช่องว่างเพิ่มเติม
+    text = clean_lines(text, cutoff_character_length)
 
     return text
 
@@ -353,14 +482,26 @@ def main():
         help='A list of Pattern to be processed. Example: -p GAMBLE FOOTBALL'
     )
 
+    # Print the verdict of every checked document
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Print which pattern removed each document'
+    )
+
     args = parser.parse_args()
 
+    global WORD_PATTERN_FILTER, REMOVE_DEBUG_HOOK
+
     # Arg parse
     if args.pattern is not None:
         WORD_PATTERN_FILTER = ' '.join(args.pattern)
     else:
         WORD_PATTERN_FILTER = None
 
+    if args.debug:
+        REMOVE_DEBUG_HOOK = print_remove_verdict
+
 
 if __name__ == "__main__":
     main()
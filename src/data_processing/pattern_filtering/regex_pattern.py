@@ -2,6 +2,10 @@
 # flake8: noqa
 import re
 
+# *_REQUIRED: กลุ่มของข้อความที่ทุกการจับคู่ของรูปแบบนั้นต้องมี (ต้องพบอย่างน้อยหนึ่งข้อความจากทุกกลุ่ม)
+# ใช้ตรวจสอบก่อนเรียก re.sub เพื่อข้ามรูปแบบที่ไม่มีทางจับคู่กับข้อความได้
+# *_MIN_COUNT: จำนวนครั้งขั้นต่ำที่ข้อความใน *_REQUIRED ต้องปรากฏ
+
 # รูปแบบที่กำหนดให้จับคู่กับบรรทัดที่ยาวเกินไป
 TOOLARGE_LINE_PATTERN = ".{1500}"
 TOOLARGE_RE = re.compile(TOOLARGE_LINE_PATTERN, re.MULTILINE)
@@ -38,11 +42,13 @@ HEX_THRESHOLD = 25
 PAGE_PATTERN = "(?:<<[ ])?(?:ก่อนหน้า|ย้อนกลับ)[ ]{0,2}(?:\[[ ]?\d{0,6}[ ]?\]|[ ]?\d{0,6}[ ]?)*(?:ต่อไป|หน้าถัดไป|ถัดไป)?(?:[ ]?>>)?|<<(?:[ ]\d{0,6}[ ]\-[ ]\d{0,6})+[ ].{0,100}"
 PAGE_RE = re.compile(PAGE_PATTERN, re.MULTILINE)
 PAGE_THRESHOLD = None
+PAGE_REQUIRED = (("ก่อนหน้า", "ย้อนกลับ", "<<"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความที่เป็น embedded server
 EMBEDDED_SERVER_PATTERN = "<%[ ]*[^%]*%>|<%.*"
 EMBEDDED_SERVER_RE = re.compile(EMBEDDED_SERVER_PATTERN, re.MULTILINE)
 EMBEDDED_SERVER_THRESHOLD = None
+EMBEDDED_SERVER_REQUIRED = (("<%",),)
 
 # รูปแบบที่กำหนดให้จับคู่กับอักขระที่ไม่ควรมีในข้อความ (Unicode special characters)
 U_PATTERN = "\uFEFF|\u00AD|[\u200A-\u200F]|\uFFFD|[\uE000-\uF8FF]|[\u202A-\u202C]|\u0092|[\u0091-\u0096]|\u2028|\u2066|\u2069|\u008d|\u0081|\u008E|<U\+[0-9A-Fa-f]{4}>"
@@ -53,58 +59,73 @@ U_THRESHOLD = None
 BLOCK_PATTERN = "(?:\[[^\]]*\])|(?:«[^»]*»)|(?:<<([^>]*)>>)"
 BLOCK_RE = re.compile(BLOCK_PATTERN, re.MULTILINE)
 BLOCK_THRESHOLD = None
+BLOCK_REQUIRED = (("[", "«", "<<"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับอีเมล
 EMAIL_PATTERN = "(?:(?:([Ee]?mail|อีเมล์)[ ]{0,2}:?[ ]{0,5})?)[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"
 EMAIL_RE = re.compile(EMAIL_PATTERN, re.MULTILINE)
 EMAIL_THRESHOLD = None
+EMAIL_REQUIRED = (("@",),)
 
 # รูปแบบที่กำหนดให้จับคู่กับ URL
 URL_PATTERN = r"\b(?:(?:https?|ftp)://[^\s/$\.\?#].[^\s]*)\b|\b(?:www\.?)?(?:(?:[\w-]*)\.)*(?:com|net|org|info|biz|me|io|co|asia|xyz|th|cn|in|uk|jp|ru)\b"
 URL_RE = re.compile(URL_PATTERN, re.MULTILINE)
 URL_THRESHOLD = None
+URL_REQUIRED = (("://", "com", "net", "org", "info", "biz", "me", "io", "co", "asia", "xyz", "th", "cn", "in", "uk", "jp", "ru"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความที่เป็นเมนู
 MENU1_PATTERN = "\|(?:[^\|\n]*\|)+.*"
 MENU1_RE = re.compile(MENU1_PATTERN, re.MULTILINE)
 MENU1_THRESHOLD = None
+MENU1_REQUIRED = (("|",),)
+MENU1_MIN_COUNT = 2
 
 MENU2_PATTERN = "\|(?:[^\|\n]*\|)+"
 MENU2_RE = re.compile(MENU2_PATTERN, re.MULTILINE)
 MENU2_THRESHOLD = None
+MENU2_REQUIRED = (("|",),)
+MENU2_MIN_COUNT = 2
 
 MENU3_PATTERN = "(?:(?:[^/\n]*/){4,}.*)"
 MENU3_RE = re.compile(MENU3_PATTERN, re.MULTILINE)
 MENU3_THRESHOLD = None
+MENU3_REQUIRED = (("/",),)
+MENU3_MIN_COUNT = 4
 
 MENU4_PATTERN = "^[^\n]{0,20}[ ]{0,2}[>»\\\\].*"
 MENU4_RE = re.compile(MENU4_PATTERN, re.MULTILINE)
 MENU4_THRESHOLD = None
+MENU4_REQUIRED = ((">", "»", "\\"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับ hashtag
 HASHTAG_PATTERN = "#\d*[ ].{0,300}|#(?:(?:[^ \n]*)[ ]?)+|Tag Archives[ ]{0,2}:.{0,300}|Posts Tagged[ ]{0,2}:.{0,300}|HASTAG[ ]{0,2}:.{0,300}|Tag[s]?[ ]{0,2}:.{0,300}|Tagged[ ].{0,300}"
 HASHTAG_RE = re.compile(HASHTAG_PATTERN, re.MULTILINE)
 HASHTAG_THRESHOLD = None
+HASHTAG_REQUIRED = (("#", "Tag", "HASTAG"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความที่เป็น sidebar
 SIDEBAR_PATTERN = ".{0,40}(?:(?:\[|\()\d{0,9}(?:\]|\))(?:[ ]{0,2})?,?)"
 SIDEBAR_RE = re.compile(SIDEBAR_PATTERN, re.MULTILINE)
 SIDEBAR_THRESHOLD = None
+SIDEBAR_REQUIRED = (("[", "("), ("]", ")"))
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความที่เป็น markup
 MARKUP_PATTERN = "\{\{[^\}]*\}\}|\{\{.*"
 MARKUP_RE = re.compile(MARKUP_PATTERN, re.MULTILINE)
 MARKUP_THRESHOLD = None
+MARKUP_REQUIRED = (("{{",),)
 
 # รูปแบบที่กำหนดให้จับคู่กับ iframe
 IFRAME_PATTERN = "<iframe.*?<\/iframe>\s*|<iframe.*"
 IFRAME_RE = re.compile(IFRAME_PATTERN, re.MULTILINE)
 IFRAME_THRESHOLD = None
+IFRAME_REQUIRED = (("<iframe",),)
 
 # รูปแบบที่กำหนดให้จับคู่กับ IP address
 IP_PATTERN = "\((?:(?:X{1,3}|\d{1,3})\.){3}(?:X{1,3}|\d{1,3})\)|\(?IP:?[ ]?(?:(?:X{1,3}|\d{1,3})\.){3}(?:X{1,3}|\d{1,3})\)?"
 IP_RE = re.compile(IP_PATTERN, re.MULTILINE)
 IP_THRESHOLD = None
+IP_REQUIRED = (("(", "IP"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับหมายเลขโทรศัพท์
 TEL_PATTERN = "(?:(?:[Pp]hone|[Mm]obile|มือถือ|Tel|TEL|Fax|FAX|เบอร์โทรศัพท์|เลขโทรศัพท์|เบอร์ติดต่อ|โทรศัพท์|โทรสาร[ ]{0,2}:|เบอร์โทร|โทร[ ]{0,2}:|โทร\.|โทร[ ]|ติดต่อที่[ ]{0,2}:?|ติดต่อ[ ]{0,2}:?)[ ]{0,2}):?(?:(?:[ ]{0,2})?(?:(?:\d{3}-\d{7})|(?:\d{4}-\d{6})|(?:\d{3}-\d{3}-\d{4}|(?:\d{3}-\d{3}-\d{3})|(?:\d{1}-\d{4}-\d{4})|(?:\d{2}-\d{3}-\d{4})|(?:\d{2}\s\d{3}\s\d{4})|(?:\d{2}-\d{7})|(?:\d{3}\s\d{3}\s\d{4})|(?:\d{3}\s\d{3}\s\d{3})|(?:\d{10})))[ ]{0,2},?)+|02\d{7}|0[3-7][2-9]\d{6}|0[6-9][0-9]\d{7}"
@@ -120,6 +141,7 @@ DATE1_THRESHOLD = None
 DATE2_PATTERN = "[พค]\.?ศ\.?[ ]{0,2}\d{4}|\d{4}[ ]{0,2}เวลา[ ]{0,2}\d{2}:?\.?\d{2}(?:[ ][Pp][Mm])|[พค]\.?ศ\."
 DATE2_RE = re.compile(DATE2_PATTERN, re.MULTILINE)
 DATE2_THRESHOLD = None
+DATE2_REQUIRED = (("ศ", "เวลา"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับ HTML
 HTML_PATTERN = (
@@ -127,56 +149,67 @@ HTML_PATTERN = (
 )
 HTML_RE = re.compile(HTML_PATTERN, re.MULTILINE)
 HTML_THRESHOLD = None
+HTML_REQUIRED = (("<br", "&nbsp", "document.", "SELECT", "<a", "<img"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 1)
 REFINE1_PATTERN = "^[ ]?ตอนที่[ ]*\d{0,3}(?:[-–]?\d{0,3})?[ ]{0,2}.{0,100}|^สั่ง.{0,50}บาท|^[ ]?เลขจดแจ้ง[ ]{0,2}.{0,13}|^.{0,100}\.jpg[ ]{0,2}\(.{0,50}|^.{0,20}รายการ|^[ ]?สนใจ[ ]{0,2}.{0,15}โทร[ ]{0,2}.{0,12}|^[ ]?ผู้แสดงความคิดเห็น.{0,60}|^\(.{0,40}[ ]{0,2}\d{0,5}[ ]{0,2}.{0,10}\).{0,200}|^[ ]?ผู้เข้าชมทั้งหมด.{0,30}|^[ ]?ฉบับที่[ ]{0,2}\d{0,7}[^-–]{0,30}-?–?[ ]|^[ ]?โพสต์ที่แชร์โดย.{0,200}|^[ ]?Copyright.{0,200}|กำลังแสดงหน้าที.{0,200}|[ ]{0,2}รีวิว.{0,100}|^[ ]?ข้อที่ \d{0,4}|^เข้าชม/ผู้ติดตาม.{0,13}"
 REFINE1_RE = re.compile(REFINE1_PATTERN, re.MULTILINE)
 REFINE1_THRESHOLD = None
+REFINE1_REQUIRED = (("ตอนที่", "สั่ง", "เลขจดแจ้ง", ".jpg", "รายการ", "สนใจ", "ผู้แสดงความคิดเห็น", "(", "ผู้เข้าชมทั้งหมด", "ฉบับที่", "โพสต์ที่แชร์โดย", "Copyright", "กำลังแสดงหน้าที", "รีวิว", "ข้อที่ ", "เข้าชม/ผู้ติดตาม"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 2)
 REFINE2_PATTERN = "Submitted[ ]by.{0,100}|^เขียนโดย.{0,100}|^Poste?d?[ ]{0,2}(?:by|on){0,2}.{0,100}|^เมื่อวาน[ ]{0,2}\d.{0,100}|^อาทิตย์นี้[ ]{0,2}\d.{0,100}|^อาทิตย์ที่แล้ว[ ]{0,2}\d.{0,100}|^เดือนนี้[ ]{0,2}\d.{0,100}|^เดือนที่แล้ว[ ]{0,2}\d.{0,100}|^รวมผู้เยี่ยมชม[ ]{0,2}\d.{0,100}|^จำนวนผู้ชมโดยประมาณ[ ]{0,2}\d.{0,100}|^รหัสสินค้า[ ]{0,2}\d.{0,100}|^บาร์โค้ด[ ]{0,2}\d.{0,100}|^[ ]โดย[ ]{0,2}.{0,100}|^เข้าชม[ ]{0,2}\d.{0,100}|^โหวต[ ]{0,2}\d.{0,100}|^มุมมอง[ ]{0,2}\d.{0,100}"
 REFINE2_RE = re.compile(REFINE2_PATTERN, re.MULTILINE)
 REFINE2_THRESHOLD = None
+REFINE2_REQUIRED = (("Submitted", "โดย", "Post", "เมื่อวาน", "อาทิตย์", "เดือน", "รวมผู้เยี่ยมชม", "จำนวนผู้ชมโดยประมาณ", "รหัสสินค้า", "บาร์โค้ด", "เข้าชม", "โหวต", "มุมมอง"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 3)
 REFINE3_PATTERN = "^[^@\n]{0,30}@\d{0,10}.{0,30}|.{0,100}[-]$|\d*[ ]*x[ ]\d*[^ ][ ]?|^ดูหนัง[ ]?(?:ออนไลน์)?[ ].{0,60}|^คุ้มค่าที่สุดอันดับ[ ]{0,2}\d{0,2}.{0,80}|^เปิด[^\d\n]+.{0,10}"
 REFINE3_RE = re.compile(REFINE3_PATTERN, re.MULTILINE)
 REFINE3_THRESHOLD = None
+REFINE3_REQUIRED = (("@", "-", "x ", "ดูหนัง", "คุ้มค่าที่สุดอันดับ", "เปิด"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 4)
 REFINE4_PATTERN = "^[^\n]{0,50}คลิก\)|[Ff]acebook[ ]{0,2}(?:\d{0,3},?\d{0,3})[ ]{0,2}เข้าชม|^[ ]{0,2}[^ ]{0,20}[ ]{0,2}\d{0,9}[ ]{0,2}ความเห็น|\[url=.{0,100}|^ผู้ชม[ ]{0,2}(?:\d{0,3},?)+|\([ ]?\)"
 REFINE4_RE = re.compile(REFINE4_PATTERN, re.MULTILINE)
 REFINE4_THRESHOLD = None
+REFINE4_REQUIRED = (("คลิก)", "acebook", "ความเห็น", "[url=", "ผู้ชม", "("),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 5)
 REFINE5_PATTERN = "^[^\d]{0,30}\d{0,10}[ ]{0,2}views.{0,100}|^Prev.{0,100}Next|^สินค้าติดต่อที่.{0,100}|^อ่านต่อคลิก.{0,100}|^สินค้าโปรโมชั่น.{0,200}|^US[ ]?\$\d{0,3},?\d{0,3}.?\d{0,3}.{0,50}"
 REFINE5_RE = re.compile(REFINE5_PATTERN, re.MULTILINE)
 REFINE5_THRESHOLD = None
+REFINE5_REQUIRED = (("views", "Prev", "สินค้าติดต่อที่", "อ่านต่อคลิก", "สินค้าโปรโมชั่น", "US"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 6)
 REFINE6_PATTERN = "^เจ้าหน้าที่ฝ่ายขาย:\n.{0,80}|^(?:\*+[ ]{0,2}[^\*\n]{0,50}[ ]{0,2}\*+)[ ]{0,2}[\+]?(?:(?:\d{0,3},?)+)?|[\*\+]{2,5}|^(?:[^:\n]{0,30}:).{0,200}"
 REFINE6_RE = re.compile(REFINE6_PATTERN, re.MULTILINE)
 REFINE6_THRESHOLD = None
+REFINE6_REQUIRED = (("เจ้าหน้าที่ฝ่ายขาย:", "*", "+", ":"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 7)
 REFINE7_PATTERN = "\(?อ่าน[ ]{0,2}\d{0,3},?\d{0,3}[ ]{0,2}(?:ครั้ง[ ]{0,2})?\)?|โพสต์[ ].{0,100}|Read[ ]{0,2}\d{0,9}[ ]{0,2}times|[^ \n]{0,20}[ ]{0,2}pantip|^Previous (?:Post|article).{0,150}|^Next (?:Post|article).{0,150}|^ตอบกลับ[ ]{0,2}.{0,200}"
 REFINE7_RE = re.compile(REFINE7_PATTERN, re.MULTILINE)
 REFINE7_THRESHOLD = None
+REFINE7_REQUIRED = (("อ่าน", "โพสต์ ", "Read", "pantip", "Previous", "Next", "ตอบกลับ"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 8)
 REFINE8_PATTERN = "^[ ]?(?:[Pp]ostby|[Pp]osted[ ](?:by|on)).*|^[ ]?เข้าชม/ผู้ติดตาม.*|^[ ]?จำนวนผู้ชมโดยประมาณ[ :]?.*|^[ ]?ลงประกาศฟรี[ ].*|^\|[ ]|^[ ]?จาก[ ].*|^[ ]?By.*|^[ ]{0,2}?โดย[ ]{0,2}?.*"
 REFINE8_RE = re.compile(REFINE8_PATTERN, re.MULTILINE)
 REFINE8_THRESHOLD = None
+REFINE8_REQUIRED = (("ostby", "osted ", "เข้าชม/ผู้ติดตาม", "จำนวนผู้ชมโดยประมาณ", "ลงประกาศฟรี", "|", "จาก", "By", "โดย"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 9)
 REFINE9_PATTERN = "^[^\n\.]{0,60}\.{3}$|^[^\n]{0,30}ฉบับที่[ ].*|^Home[ ]/[ ].{100}|^[^\n\|]{0,60}\|.{0,60}"
 REFINE9_RE = re.compile(REFINE9_PATTERN, re.MULTILINE)
 REFINE9_THRESHOLD = None
+REFINE9_REQUIRED = (("...", "ฉบับที่", "Home", "|"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 10)
 REFINE10_PATTERN = "^[ ]?(?:\)|↑|►|←|«)[ ]?|^[-_]+"
 REFINE10_RE = re.compile(REFINE10_PATTERN, re.MULTILINE)
 REFINE10_THRESHOLD = None
+REFINE10_REQUIRED = ((")", "↑", "►", "←", "«", "-", "_"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 11)
 REFINE11_PATTERN = (
@@ -184,6 +217,7 @@ REFINE11_PATTERN = (
 )
 REFINE11_RE = re.compile(REFINE11_PATTERN, re.MULTILINE)
 REFINE11_THRESHOLD = None
+REFINE11_REQUIRED = (("สถิติ",),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 12)
 REFINE12_PATTERN = (
@@ -191,11 +225,13 @@ REFINE12_PATTERN = (
 )
 REFINE12_RE = re.compile(REFINE12_PATTERN, re.MULTILINE)
 REFINE12_THRESHOLD = None
+REFINE12_REQUIRED = (("(รายละเอียด)", "ด", "....."),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 13)
 REFINE13_PATTERN = "^[ ]?(?:เรื่องย่อ[ ].{0,100}|คุ้มค่าที่สุดอันดับ.{0,100}|คุ้[ ]่าที่สุดอันดับ.{0,100}|\(?ลงโฆษณาฟรี[ ].{0,200}|\(free[ ]online[ ].{0,100}|\(คลิกเพื่อดูต้นฉบับ\)[ ].{0,100}|แก้ไขครั้งสุดท้ายโดย[ ].{0,100})|^[^\d\n]{0,30}[ ]\d{0,3},?\d{0,3}[ ]ครั้ง.{0,50}"
 REFINE13_RE = re.compile(REFINE13_PATTERN, re.MULTILINE)
 REFINE13_THRESHOLD = None
+REFINE13_REQUIRED = (("เรื่องย่อ", "่าที่สุดอันดับ", "ลงโฆษณาฟรี", "(free", "(คลิกเพื่อดูต้นฉบับ)", "ครั้ง"),)
 
 # รูปแบบที่กำหนดให้จับคู่กับข้อความเฉพาะในเอกสาร (ปรับแต่ง 14)
 REFINE14_PATTERN = "^(?:[฿$]?\d{0,9}\.?,?\d{0,9}-?–?:?/?(?:[ ]{0,2}x[ ]{0,2}\d{0,8})?(?:\\bกม\\b\.?)?(?:\\bน\\b\.)?(?:ล้าน|แสน|หมื่น|พัน|ร้อย|สิบ|บาท|[ ])?){0,5}"
@@ -0,0 +1,75 @@
+from typing import Iterable, List, Pattern, Sequence, Tuple
+
+
+class RegexRule:
+    """
+    A single substitution rule of the clean_text rule engine.
+
+    กฎการแทนที่หนึ่งกฎของ rule engine ที่ใช้ใน clean_text
+
+    Parameters:
+    regex (Pattern): The compiled pattern to replace.
+                     รูปแบบที่ต้องการแทนที่
+    required (Sequence[Tuple[str, ...]]): Literal groups that every match of the pattern contains; at least
+                                          one literal of each group must be in the text for the pattern to match.
+                                          กลุ่มของข้อความที่ทุกการจับคู่ต้องมี ต้องพบอย่างน้อยหนึ่งข้อความจากทุกกลุ่ม
+    min_count (int): The minimum number of occurrences of a required literal. (default is 1)
+                     จำนวนครั้งขั้นต่ำที่ข้อความที่ต้องมีต้องปรากฏ
+    repl (str): The replacement text. (default is " ")
+                ข้อความที่ใช้แทนที่
+    """
+
+    def __init__(
+        self,
+        regex: Pattern,
+        required: Sequence[Tuple[str, ...]] = (),
+        min_count: int = 1,
+        repl: str = " ",
+    ):
+        self.regex = regex
+        self.required = tuple(tuple(group) for group in required)
+        self.min_count = min_count
+        self.repl = repl
+
+    def may_match(self, text: str) -> bool:
+        # A substring search is much cheaper than a regex scan, and an absent literal rules the match out
+        if self.min_count > 1:
+            return all(
+                any(text.count(literal) >= self.min_count for literal in group)
+                for group in self.required
+            )
+        return all(any(literal in text for literal in group) for group in self.required)
+
+    def sub(self, text: str) -> str:
+        return self.regex.sub(self.repl, text)
+
+
+class RuleEngine:
+    """
+    This class applies an ordered list of substitution rules to a text, with the same result as calling
+    `re.sub` for every rule in turn. Before each rule, the current text is checked for the literals the
+    rule requires; rules that cannot match are skipped, so their scan and string copy are saved.
+
+    Rules are never merged into a single alternation: a combined scan picks the leftmost match among all
+    rules, which differs from the sequential result whenever matches overlap or a replacement creates a
+    match for a later rule.
+
+    คลาสนี้ใช้กฎการแทนที่ตามลำดับกับข้อความ โดยให้ผลลัพธ์เหมือนการเรียก `re.sub` ทีละกฎ
+    ก่อนใช้แต่ละกฎจะตรวจสอบว่าข้อความปัจจุบันมีข้อความที่กฎนั้นต้องการหรือไม่ หากไม่มีจะข้ามกฎนั้น
+
+    Parameters:
+    rules (Iterable[RegexRule]): The rules, applied in order.
+                                 กฎที่ใช้ เรียงตามลำดับ
+    """
+
+    def __init__(self, rules: Iterable[RegexRule]):
+        self.rules: List[RegexRule] = list(rules)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def sub(self, text: str) -> str:
+        for rule in self.rules:
+            if rule.may_match(text):
+                text = rule.sub(text)
+        return text
@@ -3,6 +3,8 @@
 import re
 import os
 
+from data_processing.pattern_filtering.keyword_matcher import KeywordMatcher
+
 # Gamble Clean Words
 GAMBLE_WORDS = None
 GAMBLE_PATH = os.path.join(os.path.dirname(
@@ -119,3 +121,21 @@ with open(HOTEL_AD_PATH) as my_file:
 HOTEL_AD_PATTERN = "|".join(HOTEL_AD)
 HOTEL_AD_RE = re.compile(HOTEL_AD_PATTERN, re.MULTILINE)
 HOTEL_AD_THRESHOLD = 4
+
+# Keyword automaton over every word list, one pass counts the matches of all categories
+WORD_MATCHER = KeywordMatcher()
+WORD_MATCHER.add_words("GAMBLE", GAMBLE_WORDS)
+WORD_MATCHER.add_words("PORN", PORN_WORDS)
+WORD_MATCHER.add_words("FOOTBALL", FOOTBALL_TEAMS)
+WORD_MATCHER.add_words("HOTEL_AD", HOTEL_AD)
+WORD_MATCHER.add_words("SALE_SKIP", SALE_SKIP_WORDS)
+WORD_MATCHER.add_words("SALE", SALE_WORDS)
+WORD_MATCHER.add_words("RENT_SKIP", RENT_SKIP_WORDS)
+WORD_MATCHER.add_words("RENT", RENT_WORDS)
+# SCRIPT_PATTERN only binds \b to its first and last alternative
+for i, word in enumerate(SCRIPT_WORDS):
+    WORD_MATCHER.add(
+        "SCRIPT", word, boundary_start=i == 0, boundary_end=i == len(SCRIPT_WORDS) - 1
+    )
+WORD_MATCHER.add_words("GARBAGE", GARBAGE_WORDS)
+WORD_MATCHER.build()
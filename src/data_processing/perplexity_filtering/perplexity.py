@@ -1,13 +1,13 @@
 import kenlm
 import math
 import numpy as np
-import pandas as pd
 import pickle
 import scipy
 import sentencepiece  # type: ignore
 from data_processing.core.text_normalizer import normalize
-from typing import List
+from typing import List, Optional, Tuple
 import warnings
+import threading
 import os
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
@@ -109,18 +109,163 @@ class SentencesLM:
         # คำนวณและส่งคืนค่า perplexity เฉลี่ยของเอกสาร
         return round(self.pp(total_pp, total_length), 1)  # Rounded to one decimal place
 
+    def score_batch(self, documents: List[List[str]], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Computes the average perplexity of each document in a batch, with the same result as `do`.
+        All lines of the batch are encoded by the sentence piece processor in one call.
+        ฟังก์ชันนี้มีไว้เพื่อคำนวณคะแนน perplexity ของเอกสารทั้งชุด โดยให้ผลลัพธ์เหมือน `do`
+        และแปลงทุกบรรทัดของชุดเอกสารเป็น token ในการเรียกครั้งเดียว
+
+        Parameters:
+        documents (List[List[str]]): The documents, each a list of lines.
+                                     รายการของเอกสาร แต่ละเอกสารเป็นรายการของบรรทัด
+        out (np.ndarray, optional): A float64 buffer of at least len(documents) to write the result into,
+                                    so one buffer can be reused across batches.
+                                    อาเรย์สำหรับเก็บผลลัพธ์ ซึ่งสามารถใช้ซ้ำได้ในทุกชุดเอกสาร
+
+        Returns:
+        np.ndarray: The average perplexity of each document.
+                    ค่า perplexity เฉลี่ยของแต่ละเอกสาร
+        """
+        if out is None:
+            out = np.empty(len(documents), dtype=np.float64)
+        out = out[: len(documents)]
+
+        # Normalize every line of the batch and encode them together
+        # ปรับแต่งทุกบรรทัดของชุดเอกสารและแปลงเป็น token พร้อมกัน
+        lines = [normalize(line, accent=False) for document in documents for line in document]
+        pieces = self.sp.encode(lines, out_type=str)
+
+        # Accumulate the log score and length of each document in the same order as `do`
+        # รวม log score และความยาวของแต่ละเอกสารตามลำดับเดียวกับ `do`
+        k = 0
+        for j, document in enumerate(documents):
+            total_pp = 0
+            total_length = 0
+            for _ in document:
+                total_pp += self.lm.score(" ".join(pieces[k]))
+                total_length += len(lines[k].split()) + 1
+                k += 1
+            out[j] = round(self.pp(total_pp, total_length), 1)
+
+        return out
+
+
+class DecisionTreeLookup:
+    """
+    This class precomputes the leaves of a decision tree trained on the single `log_score` feature as
+    sorted threshold intervals, so a batch of scores is classified with one `np.searchsorted` instead of
+    building a DataFrame and calling `predict_proba`. The probabilities are the same as sklearn's.
+
+    คลาสนี้คำนวณใบของ decision tree ที่ใช้ feature `log_score` เพียงตัวเดียวไว้ล่วงหน้าเป็นช่วงของค่า threshold
+    ที่เรียงลำดับแล้ว เพื่อจัดประเภทคะแนนทั้งชุดด้วย `np.searchsorted` โดยให้ค่าความน่าจะเป็นเหมือนกับ sklearn
+    """
+
+    def __init__(self, tree_classifier):
+        """
+        Parameters:
+        tree_classifier (DecisionTreeClassifier): A fitted tree with one feature and one output.
+                                                  โมเดล decision tree ที่มี feature และ output เดียว
+        """
+        if getattr(tree_classifier, "n_features_in_", None) != 1 or getattr(tree_classifier, "n_outputs_", None) != 1:
+            raise ValueError("DecisionTreeLookup only supports a tree with one feature and one output")
+
+        tree = tree_classifier.tree_
+        is_split = tree.children_left != -1
+
+        # Sorted split thresholds, interval i holds the scores x with thresholds[i - 1] < x <= thresholds[i]
+        # ค่า threshold ที่เรียงลำดับแล้ว ช่วงที่ i คือค่าที่อยู่ระหว่าง thresholds[i - 1] และ thresholds[i]
+        self.thresholds = np.unique(tree.threshold[is_split])
+
+        # Walk the tree once per interval to find its leaf, a split sends interval i left when i <= its threshold index
+        # หาใบของแต่ละช่วงโดยไล่ตาม decision tree
+        leaves = np.empty(len(self.thresholds) + 1, dtype=np.int64)
+        for i in range(len(leaves)):
+            node = 0
+            while is_split[node]:
+                j = np.searchsorted(self.thresholds, tree.threshold[node])
+                node = tree.children_left[node] if i <= j else tree.children_right[node]
+            leaves[i] = node
+
+        # Normalize the leaf values with the same operations as DecisionTreeClassifier.predict_proba
+        # ปรับค่าของใบด้วยวิธีเดียวกับ predict_proba
+        proba = tree.value[leaves, 0, : tree_classifier.n_classes_].copy()
+        normalizer = proba.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        proba /= normalizer
+        self.proba = proba
+
+    def predict_proba(self, log_scores) -> np.ndarray:
+        # The tree compares the features as float32, like sklearn does
+        scores = np.asarray(log_scores, dtype=np.float32).astype(np.float64)
+        return self.proba[np.searchsorted(self.thresholds, scores, side="left")]
+
+
+class LazyModel:
+    """
+    A per-process singleton that loads a model on first use. Loading is guarded by a lock so
+    concurrent threads load the model only once. A model loaded before a fork is inherited by
+    the child processes.
+
+    ตัวเก็บโมเดลที่โหลดเมื่อถูกใช้งานครั้งแรก การโหลดถูกป้องกันด้วย lock เพื่อให้โหลดเพียงครั้งเดียว
+    แม้ถูกเรียกจากหลาย thread พร้อมกัน โมเดลที่โหลดก่อน fork จะถูกใช้ร่วมกันใน process ลูก
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.model = None
+
+    def get(self):
+        if self.model is None:
+            with self.lock:
+                if self.model is None:
+                    self.model = self.loader()
+        return self.model
+
+
+def load_classifier():
+    # Construct the path to the decision tree classifier file
+    # สร้างเส้นทางไปยังไฟล์โมเดล decision tree
+    classifier_filename = os.path.join(os.path.dirname(__file__), 'decision_tree.sav')
+
+    # Load the decision tree classifier from the specified file
+    # โหลดโมเดล decision tree จากไฟล์
+    with open(classifier_filename, "rb") as file:
+        return pickle.load(file)
+
+
+# The models are loaded on first use, not at import
+# โมเดลจะถูกโหลดเมื่อใช้งานครั้งแรก ไม่ใช่ตอน import
+CLASSIFIER = LazyModel(load_classifier)
+CLASSIFIER_LOOKUP = LazyModel(lambda: DecisionTreeLookup(CLASSIFIER.get()))
+LANGUAGE_MODEL = LazyModel(SentencesLM)
+
 
-# Construct the path to the decision tree classifier file
-# สร้างเส้นทางไปยังไฟล์โมเดล decision tree
-classifier_filename = os.path.join(os.path.dirname(__file__), 'decision_tree.sav')
+def get_classifier():
+    return CLASSIFIER.get()
 
-# Load the decision tree classifier from the specified file
-# โหลดโมเดล decision tree จากไฟล์
-classifier = pickle.load(open(classifier_filename, "rb"))
 
-# Create an instance of the SentencesLM class for perplexity calculations
-# สร้างวัตถุ SentencesLM สำหรับการคำนวณ perplexity
-lm = SentencesLM()
+def get_classifier_lookup() -> DecisionTreeLookup:
+    # The tree precomputed as threshold intervals on log_score
+    return CLASSIFIER_LOOKUP.get()
+
+
+def get_language_model() -> SentencesLM:
+    return LANGUAGE_MODEL.get()
+
+
+def preload():
+    """
+    Loads the language model and the classifier now. Call it in the parent process before starting
+    worker processes (e.g. `Dataset.map(num_proc=...)`), so the workers share the memory-mapped
+    language model pages instead of each loading their own copy.
+
+    โหลดโมเดลภาษาและโมเดลจัดประเภททันที ควรเรียกใน process หลักก่อนเริ่ม worker
+    เพื่อให้ทุก worker ใช้หน้าหน่วยความจำของโมเดลภาษาร่วมกัน แทนที่จะโหลดแยกกัน
+    """
+    get_language_model()
+    get_classifier_lookup()
 
 
 
@@ -147,7 +292,7 @@ def classify_spam(text: str, threshold=0.5):
 
     # Calculate the perplexity score for the text by splitting it into lines
     # คำนวณคะแนน perplexity สำหรับข้อความ
-    pp_score = lm.do(text.split("\n"))
+    pp_score = get_language_model().do(text.split("\n"))
 
     # Calculate the logarithm of the perplexity score
     # คำนวณลอการิทึมของคะแนน perplexity
@@ -155,7 +300,7 @@ def classify_spam(text: str, threshold=0.5):
 
     # Use the decision tree model to predict whether the text is spam
     # ใช้โมเดล decision tree ในการทำนายประเภทของข้อความ
-    predicted_proba = classifier.predict_proba(pd.DataFrame({"log_score": [log_pp_score]}))
+    predicted_proba = get_classifier_lookup().predict_proba([log_pp_score])
     prediction = (predicted_proba [:,1] >= threshold).astype('int')
 
     # Return the prediction and the log perplexity score
@@ -164,6 +309,46 @@ def classify_spam(text: str, threshold=0.5):
 
 
 
+def classify_spam_batch(texts: List[str], threshold=0.5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    This function classifies a batch of texts as either spam or not spam, with the same result as
+    calling `classify_spam` on each text. The decision tree is called once for the whole batch.
+
+    ฟังก์ชันนี้มีไว้เพื่อจัดประเภทข้อความทั้งชุดว่ามีลักษณะเป็น spam หรือไม่
+    โดยให้ผลลัพธ์เหมือนการเรียก `classify_spam` ทีละข้อความ และเรียกโมเดล decision tree เพียงครั้งเดียว
+
+    Parameters:
+    texts (List[str]): The texts to be classified.
+                       ข้อความที่ต้องการจัดประเภท
+    threshold (float): default=0.5 If the proba > threshold returns 1 else 0.
+
+    Returns:
+    tuple:
+        - predictions (np.ndarray): The predicted classification of each text (1 for spam, 0 for non-spam).
+                                    ค่าที่ทำนายของแต่ละข้อความ (1 คือ spam, 0 คือ non-spam)
+        - log_pp_scores (np.ndarray): The logarithm of the perplexity score of each text.
+                                      ค่าลอการิทึมของคะแนน perplexity ของแต่ละข้อความ
+    """
+    if len(texts) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=np.float64)
+
+    # Calculate the perplexity scores of the whole batch
+    # คำนวณคะแนน perplexity ของข้อความทั้งชุด
+    pp_scores = get_language_model().score_batch([text.split("\n") for text in texts])
+
+    # math.log per score, so the values are the same as classify_spam
+    # ใช้ math.log ทีละค่าเพื่อให้ได้ค่าเดียวกับ classify_spam
+    log_pp_scores = np.array([math.log(pp_score) for pp_score in pp_scores], dtype=np.float64)
+
+    # Use the decision tree lookup once for the whole batch
+    # ใช้ decision tree เพียงครั้งเดียวสำหรับข้อความทั้งชุด
+    predicted_proba = get_classifier_lookup().predict_proba(log_pp_scores)
+    predictions = (predicted_proba[:, 1] >= threshold).astype('int')
+
+    return predictions, log_pp_scores
+
+
+
 def sample_text_back(
     probs: np.ndarray,
     percentage: float = 0.1,
@@ -0,0 +1,958 @@
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+from collections import deque
+from functools import partial
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import scipy.stats
+import zstandard as zstd
+from datasets import Dataset, DatasetDict, Features, IterableDataset, concatenate_datasets, load_from_disk
+from nlpo3 import load_dict
+
+try:
+    import orjson
+
+    json_loads, json_dumps = orjson.loads, orjson.dumps
+except ImportError:
+    # Fall back to the standard library, orjson is only faster
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+from data_processing.core.checkpoint import (
+    dataset_fingerprint,
+    get_stage_checkpoint,
+    run_stage,
+    stage_key,
+    stage_map_kwargs,
+)
+from data_processing.core.minhash import generate_minhash_signatures_batch
+from data_processing.core.selection import build_keep_mask, select_rows
+from data_processing.core.token_cache import dictionary_version
+from data_processing.decontamination.decontaminate import find_contamination
+from data_processing.decontamination.generate_minhash import generate_benchmark_signatures
+from data_processing.deduplication.deduplicate import find_duplicates, get_duplicate_ids
+from data_processing.pattern_filtering.pattern import clean_text as clean_pattern_text
+from data_processing.perplexity_filtering.perplexity import (
+    classify_spam_batch,
+    preload,
+    sample_text_back,
+)
+
+# Label of the texts that are blank after cleaning, they are never kept
+BLANK_PREDICTION = -1
+UNCHANGED_DATE = "None"
+
+# Created date of the sources whose documents have none
+SOURCE_CREATED_DATES = {
+    "cc100": "2020-10-23T23:31:11.000Z",
+    "oscar": "2023-06-08T14:30:28.000Z",
+}
+
+OUTPUT_FORMATS = ("jsonl.zst", "parquet")
+MANIFEST_FILE = "manifest.json"
+# Rows converted to Python at a time while a shard is written
+WRITE_BATCH_SIZE = 1000
+# Rows per shard of the streaming writer
+DEFAULT_ROWS_PER_SHARD = 1000000
+# Rows per Arrow record batch while an input file is read
+READ_BATCH_SIZE = 10000
+# Bytes decompressed at a time while an input file is read
+DECOMPRESS_BLOCK_SIZE = 1 << 22
+# Column of the fused stage that is only used by the global steps, it is not written
+SIGNATURE_COLUMN = "hashvalues"
+# Column of the anonymization stage recording the path taken by each document, it is not written
+NER_COLUMN = "__ner__"
+
+OSCAR_SCHEMA = pa.schema(
+    [
+        ("text", pa.string()),
+        ("created_date", pa.string()),
+        ("source", pa.string()),
+        ("source_id", pa.string()),
+        ("meta", pa.string()),
+    ]
+)
+
+
+def clean_text(text: str) -> str:
+    """
+    Clean a text for the pipelines: the pattern filters run once as the mc4 pass and once more as the oscar
+    pass on what is left. An empty result marks a blank text.
+    ทำความสะอาดข้อความด้วย pattern สองรอบ ได้แก่รอบของ mc4 และรอบของ oscar ผลลัพธ์ว่างหมายถึงข้อความว่าง
+    """
+    text = clean_pattern_text(text.strip())
+
+    if text == "":
+        return ""
+
+    return clean_pattern_text(text)
+
+
+def set_column(table: pa.Table, name: str, array) -> pa.Table:
+    # Replace the column when the table already has it, append it otherwise
+    index = table.schema.get_field_index(name)
+    if index == -1:
+        return table.append_column(name, array)
+    return table.set_column(index, name, array)
+
+
+def chunk_keep_mask(predictions: np.ndarray, log_pp_scores: np.ndarray, sampled_back_ratio: float = 0.0) -> np.ndarray:
+    """
+    This function builds the keep-mask of a chunk: the non-spam texts, and a sample of the spam texts
+    drawn from the distribution of their log perplexity scores. Blank texts are never kept.
+
+    ฟังก์ชันนี้สร้างอาเรย์ boolean ที่ระบุว่าแถวใดของ chunk จะถูกเก็บไว้ ได้แก่ข้อความที่ไม่ใช่ spam
+    และข้อความ spam บางส่วนที่ถูกสุ่มกลับมาตามการกระจายของคะแนน log perplexity โดยไม่เก็บข้อความว่าง
+
+    Parameters:
+    predictions (np.ndarray): The prediction of each text, 0 for non-spam, 1 for spam and -1 for blank.
+                              ค่าที่ทำนายของแต่ละข้อความ 0 คือ non-spam, 1 คือ spam และ -1 คือข้อความว่าง
+    log_pp_scores (np.ndarray): The log perplexity score of each text.
+                                คะแนน log perplexity ของแต่ละข้อความ
+    sampled_back_ratio (float): The ratio of spam texts to sample back. (default is 0.0)
+                                อัตราส่วนของข้อความ spam ที่จะสุ่มกลับมา
+
+    Returns:
+    np.ndarray: A boolean array, True for the rows to keep.
+                อาเรย์ boolean ซึ่งเป็น True สำหรับแถวที่เก็บไว้
+    """
+    keep_mask = predictions == 0
+
+    spam_idx = np.flatnonzero(predictions == 1)
+    if len(spam_idx) > 1 and sampled_back_ratio > 0:
+        spam_log_pps = log_pp_scores[spam_idx]
+
+        # sampled some data point classified as spam back
+        probs = scipy.stats.norm.pdf(
+            spam_log_pps,
+            loc=np.mean(spam_log_pps),
+            scale=np.std(spam_log_pps),
+        )
+        sampled_back_idx = sample_text_back(probs, percentage=float(sampled_back_ratio))
+
+        # Map the sampled positions back to the rows of the chunk
+        keep_mask[spam_idx[np.asarray(sampled_back_idx, dtype=np.int64)]] = True
+
+    return keep_mask
+
+
+def process_chunk(
+    chunk: pa.Table,
+    clean_text: Callable[[str], str],
+    do_perplexity: bool = False,
+    sampled_back_ratio: float = 0.0,
+) -> pa.Table:
+    """
+    This function cleans the texts of a chunk, classifies them as spam or not with the perplexity model,
+    and keeps the non-spam texts with a sample of the spam texts. The rows are selected by a single
+    keep-mask applied to every column at once with Arrow `filter`, the other columns are never copied
+    into Python lists.
+
+    Expects a chunk from `Dataset.with_format("arrow").map(batched=True)`.
+
+    ฟังก์ชันนี้ทำความสะอาดข้อความใน chunk จัดประเภทว่าเป็น spam หรือไม่ด้วยโมเดล perplexity
+    และเก็บข้อความที่ไม่ใช่ spam พร้อมข้อความ spam บางส่วน โดยเลือกแถวด้วยอาเรย์ boolean
+    เพียงชุดเดียวผ่าน `filter` ของ Arrow กับทุกคอลัมน์พร้อมกัน
+
+    Parameters:
+    chunk (pa.Table): The chunk to process, with a `text` column.
+                      chunk ที่ต้องการประมวลผล ซึ่งมีคอลัมน์ `text`
+    clean_text (Callable[[str], str]): The function that cleans a text, an empty result marks a blank text.
+                                       ฟังก์ชันที่ใช้ทำความสะอาดข้อความ หากได้ข้อความว่างจะถือว่าเป็นข้อความว่าง
+    do_perplexity (bool): Classify the texts with the perplexity model and sample spam back. (default is False)
+                          จัดประเภทข้อความด้วยโมเดล perplexity และสุ่มข้อความ spam กลับมา
+    sampled_back_ratio (float): The ratio of spam texts to sample back. (default is 0.0)
+                                อัตราส่วนของข้อความ spam ที่จะสุ่มกลับมา
+
+    Returns:
+    pa.Table: The kept rows, with the cleaned `text` and the `prediction`, `log_pp_score` and
+              `updated_date` columns.
+              แถวที่ถูกเก็บไว้ พร้อมข้อความที่ทำความสะอาดแล้ว และคอลัมน์ `prediction`, `log_pp_score` และ `updated_date`
+    """
+    original_texts = chunk.column("text").to_pylist()
+    texts = [clean_text(text) for text in original_texts]
+    n = len(texts)
+
+    # Texts that are blank after cleaning are labelled BLANK_PREDICTION, the others are non-spam until scored
+    non_blank = np.fromiter((text != "" for text in texts), dtype=bool, count=n)
+    predictions = np.where(non_blank, 0, BLANK_PREDICTION).astype(np.int64)
+    log_pp_scores = np.zeros(n, dtype=np.float64)
+    updated_dates = [
+        str(datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ")) if new_text != text else UNCHANGED_DATE
+        for new_text, text in zip(texts, original_texts)
+    ]
+
+    if do_perplexity:
+        # Score every non-empty text of the chunk in one batch
+        scored_idx = np.flatnonzero(non_blank)
+        batch_predictions, batch_log_pp_scores = classify_spam_batch([texts[i] for i in scored_idx])
+        predictions[scored_idx] = batch_predictions
+        log_pp_scores[scored_idx] = batch_log_pp_scores
+
+    keep_mask = chunk_keep_mask(
+        predictions,
+        log_pp_scores,
+        sampled_back_ratio if do_perplexity else 0.0,
+    )
+
+    table = set_column(chunk, "text", pa.array(texts, type=chunk.schema.field("text").type))
+    table = set_column(table, "prediction", pa.array(predictions))
+    table = set_column(table, "log_pp_score", pa.array(log_pp_scores))
+    table = set_column(table, "updated_date", pa.array(updated_dates, type=pa.string()))
+    return table.filter(pa.array(keep_mask))
+
+
+def filter_fields(table: pa.Table, source: str, filename: str) -> pa.Table:
+    """
+    This function converts processed rows to the output fields of a source, for a whole batch at once:
+    it sets `source`, `created_date` and `meta`, drops the processing columns and fills the `updated_date`
+    of unchanged texts with their created date.
+
+    ฟังก์ชันนี้แปลงแถวที่ประมวลผลแล้วให้อยู่ในรูปแบบฟิลด์ของผลลัพธ์ของแต่ละแหล่งข้อมูล ทีละชุด
+
+    Parameters:
+    table (pa.Table): The rows returned by `process_chunk`.
+                      แถวที่ได้จาก `process_chunk`
+    source (str): The source of the dataset, e.g. mc4, cc100 or oscar.
+                  แหล่งที่มาของชุดข้อมูล
+    filename (str): The input dataset, recorded in `meta`.
+                    ชุดข้อมูลต้นทางที่บันทึกไว้ใน `meta`
+
+    Returns:
+    pa.Table: The rows with the output fields.
+              แถวที่มีฟิลด์ของผลลัพธ์
+    """
+    n = len(table)
+    table = set_column(table, "source", pa.array([source] * n, type=pa.string()))
+    table = table.drop([name for name in ("log_pp_score", "prediction") if name in table.column_names])
+
+    # oscar_cl rows already carry their created date and meta from the reader
+    if source != "oscar_cl":
+        meta_dict = {"filename": filename}
+
+        if source == "mc4":
+            timestamps = table.column("timestamp").to_pylist()
+            table = set_column(table, "created_date", pa.array([str(t) for t in timestamps], type=pa.string()))
+            meta = [str({**meta_dict, "url": url}) for url in table.column("url").to_pylist()]
+            table = table.drop(["timestamp", "url"])
+        else:
+            if source == "cc100":
+                created_date = SOURCE_CREATED_DATES["cc100"]
+            elif "oscar" in source:
+                created_date = SOURCE_CREATED_DATES["oscar"]
+                table = set_column(table, "source_id", table.column("id"))
+                table = table.drop(["id"])
+            else:
+                created_date = None
+
+            if created_date is not None:
+                table = set_column(table, "created_date", pa.array([created_date] * n, type=pa.string()))
+            meta = [str(meta_dict)] * n
+
+        table = set_column(table, "meta", pa.array(meta, type=pa.string()))
+
+    updated_dates = table.column("updated_date")
+    created_dates = table.column("created_date").cast(updated_dates.type)
+    return set_column(
+        table,
+        "updated_date",
+        pc.if_else(pc.equal(updated_dates, UNCHANGED_DATE), created_dates, updated_dates),
+    )
+
+
+def shard_file_name(index: int, num_shards: int, output_format: str) -> str:
+    return f"data-{index:05d}-of-{num_shards:05d}.{output_format}"
+
+
+class TableFileWriter:
+    """
+    This class writes Arrow tables to one .jsonl.zst or .parquet file. The file is written under a temporary
+    name and renamed on `close`, so an output file is never partial.
+
+    คลาสนี้เขียนตาราง Arrow ลงไฟล์ .jsonl.zst หรือ .parquet หนึ่งไฟล์ โดยเขียนเป็นไฟล์ชั่วคราวก่อน
+    และเปลี่ยนชื่อเมื่อเรียก `close` ทำให้ไม่มีไฟล์ผลลัพธ์ที่เขียนไม่ครบ
+
+    Parameters:
+    path (str): The output file.
+                ไฟล์ผลลัพธ์
+    output_format (str): "jsonl.zst" or "parquet".
+                         รูปแบบของไฟล์
+    """
+
+    def __init__(self, path: str, output_format: str):
+        self.path = path
+        self.output_format = output_format
+        self.temp_path = path + ".tmp"
+        self.num_rows = 0
+        self.file = zstd.open(self.temp_path, "wb") if output_format == "jsonl.zst" else None
+        self.parquet_writer = None
+
+    def write(self, table: pa.Table):
+        if self.output_format == "parquet":
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.temp_path, table.schema)
+            elif table.schema != self.parquet_writer.schema:
+                # e.g. a column that is all null in this batch
+                table = table.cast(self.parquet_writer.schema)
+            self.parquet_writer.write_table(table)
+        else:
+            self.file.write(b"".join(json_dumps(row) + b"\n" for row in table.to_pylist()))
+        self.num_rows += len(table)
+
+    def close(self) -> int:
+        if self.output_format == "parquet":
+            if self.parquet_writer is None:
+                pq.write_table(pa.table({}), self.temp_path)
+            else:
+                self.parquet_writer.close()
+        else:
+            self.file.close()
+        os.replace(self.temp_path, self.path)
+        return self.num_rows
+
+
+def write_manifest(output_dirs: List[str], shards: List[dict], output_format: str) -> dict:
+    manifest = {
+        "format": output_format,
+        "num_shards": len(shards),
+        "num_rows": sum(shard["num_rows"] for shard in shards),
+        "shards": shards,
+    }
+    # manifest.json is written last, a directory without it is incomplete
+    for output_dir in output_dirs:
+        with open(os.path.join(output_dir, MANIFEST_FILE), "w") as file:
+            json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def write_shard(
+    dataset: Dataset,
+    path: str,
+    output_format: str,
+    transform: Optional[Callable[[pa.Table], pa.Table]] = None,
+) -> int:
+    """
+    Write the rows of a dataset to one file, `WRITE_BATCH_SIZE` rows at a time.
+    เขียนแถวของชุดข้อมูลลงไฟล์เดียว ทีละ `WRITE_BATCH_SIZE` แถว
+
+    Returns:
+    int: The number of rows written.
+         จำนวนแถวที่เขียน
+    """
+    table = dataset.with_format("arrow")
+    writer = TableFileWriter(path, output_format)
+
+    for start in range(0, len(dataset), WRITE_BATCH_SIZE):
+        batch = table[start : start + WRITE_BATCH_SIZE]
+        writer.write(batch if transform is None else transform(batch))
+    if len(dataset) == 0:
+        # An empty shard still gets a file, with the schema of the output
+        batch = table[0:0]
+        writer.write(batch if transform is None else transform(batch))
+
+    return writer.close()
+
+
+def write_shards_hf(batch, dataset, output_dirs, num_shards, output_format, transform):
+    # Expects a batch of shard ids from `Dataset.map(batched=True)`
+    files, num_rows = [], []
+    for index in batch["shard"]:
+        name = shard_file_name(index, num_shards, output_format)
+        path = os.path.join(output_dirs[0], name)
+        shard = dataset.shard(num_shards, index, contiguous=True)
+        num_rows.append(write_shard(shard, path, output_format, transform))
+        for output_dir in output_dirs[1:]:
+            shutil.copyfile(path, os.path.join(output_dir, name))
+        files.append(name)
+    return {"file": files, "num_rows": num_rows}
+
+
+def write_shards(
+    dataset: Dataset,
+    output_dirs: List[str],
+    num_proc: int,
+    num_shards: Optional[int] = None,
+    output_format: str = "jsonl.zst",
+    transform: Optional[Callable[[pa.Table], pa.Table]] = None,
+) -> dict:
+    """
+    This function writes a dataset as numbered shards, `data-00000-of-00128.jsonl.zst` or `.parquet`, with
+    `num_proc` processes. Each shard is a contiguous slice of the dataset written by one worker, with
+    `transform` applied batch by batch, so the write scales with the number of processes. A `manifest.json`
+    listing the shards and their number of rows is written last, once every shard is complete.
+
+    ฟังก์ชันนี้เขียนชุดข้อมูลเป็นไฟล์ย่อยที่มีหมายเลขกำกับด้วย process จำนวน `num_proc` โดยแต่ละไฟล์เป็นช่วงต่อเนื่อง
+    ของชุดข้อมูลที่เขียนโดย worker หนึ่งตัว และเขียน `manifest.json` เป็นไฟล์สุดท้ายเมื่อเขียนทุกไฟล์เสร็จ
+
+    Parameters:
+    dataset (Dataset): The dataset to write.
+                       ชุดข้อมูลที่ต้องการเขียน
+    output_dirs (List[str]): The directories to write, the shards are written to the first one and copied to the others.
+                             ไดเรกทอรีที่ต้องการเขียน ไฟล์จะถูกเขียนในไดเรกทอรีแรกและคัดลอกไปยังไดเรกทอรีอื่น
+    num_proc (int): The number of processes.
+                    จำนวน process
+    num_shards (int): The number of shards. (default is `num_proc`)
+                      จำนวนไฟล์ย่อย
+    output_format (str): "jsonl.zst" or "parquet". (default is "jsonl.zst")
+                         รูปแบบของไฟล์
+    transform (Callable[[pa.Table], pa.Table]): Applied to each batch before it is written, e.g. `filter_fields`.
+                                                ฟังก์ชันที่ใช้กับแต่ละชุดก่อนเขียน
+
+    Returns:
+    dict: The manifest.
+          ข้อมูลใน manifest
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, got {output_format}")
+    num_shards = num_shards or num_proc
+    for output_dir in output_dirs:
+        os.makedirs(output_dir, exist_ok=True)
+
+    shards = Dataset.from_dict({"shard": list(range(num_shards))}).map(
+        write_shards_hf,
+        fn_kwargs={
+            "dataset": dataset,
+            "output_dirs": output_dirs,
+            "num_shards": num_shards,
+            "output_format": output_format,
+            "transform": transform,
+        },
+        batched=True,
+        batch_size=1,
+        num_proc=min(num_proc, num_shards),
+        remove_columns=["shard"],
+        # The shards are written as a side effect, a cached result would skip them
+        load_from_cache_file=False,
+        keep_in_memory=True,
+        desc="Writing shards...",
+    )
+
+    return write_manifest(output_dirs, shards.to_list(), output_format)
+
+
+def list_jsonl_zst_files(dir_path: str) -> List[str]:
+    # Every .jsonl.zst file under the directory, in a fixed order so the rows keep the same order across runs
+    return sorted(
+        os.path.join(root, filename)
+        for root, _, files in os.walk(dir_path)
+        for filename in files
+        if filename.endswith(".jsonl.zst")
+    )
+
+
+def oscar_record_batch(items: List[dict], source: str, first_id: int) -> pa.RecordBatch:
+    # The rows of a batch of OSCAR documents, `source_id` is the line number within the file
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array([item["content"] for item in items], type=pa.string()),
+            pa.array([item["warc_headers"]["warc-date"] for item in items], type=pa.string()),
+            pa.array([source] * len(items), type=pa.string()),
+            pa.array([str(first_id + i) for i in range(len(items))], type=pa.string()),
+            pa.array(
+                [
+                    str(
+                        {
+                            "url": item["warc_headers"]["warc-target-uri"],
+                            "quality_warnings": item["metadata"]["quality_warnings"],
+                        }
+                    )
+                    for item in items
+                ],
+                type=pa.string(),
+            ),
+        ],
+        schema=OSCAR_SCHEMA,
+    )
+
+
+def iter_lines(stream, block_size: int = DECOMPRESS_BLOCK_SIZE):
+    # Split a binary stream into non-empty lines, reading large blocks instead of one line at a time
+    rest = b""
+    for block in iter(lambda: stream.read(block_size), b""):
+        lines = (rest + block).split(b"\n")
+        rest = lines.pop()
+        yield from (line for line in lines if line)
+    if rest:
+        yield rest
+
+
+def iter_jsonl_zst_record_batches(file_path: str, batch_size: int = READ_BATCH_SIZE) -> Iterator[pa.RecordBatch]:
+    # Decompress and parse one OSCAR .jsonl.zst file, `batch_size` rows per record batch
+    source = "oscar_colossal_{}".format(file_path.split("/")[-3])
+    num_rows = 0
+
+    with open(file_path, "rb") as file:
+        items = []
+        for line in iter_lines(zstd.ZstdDecompressor().stream_reader(file)):
+            items.append(json_loads(line))
+            if len(items) == batch_size:
+                yield oscar_record_batch(items, source, num_rows)
+                num_rows += len(items)
+                items = []
+        if items:
+            yield oscar_record_batch(items, source, num_rows)
+
+
+def convert_jsonl_zst_file(file_path: str, arrow_path: str) -> int:
+    """
+    Decompress and parse one OSCAR .jsonl.zst file into an Arrow stream file. The file is written under
+    a temporary name and renamed once complete, the rename records the file as done.
+    แตกไฟล์และแปลงไฟล์ .jsonl.zst ของ OSCAR หนึ่งไฟล์เป็นไฟล์ Arrow โดยเขียนเป็นไฟล์ชั่วคราวก่อน
+    แล้วจึงเปลี่ยนชื่อเมื่อเขียนเสร็จ ซึ่งเป็นการบันทึกว่าไฟล์นี้ถูกอ่านครบแล้ว
+
+    Returns:
+    int: The number of rows.
+         จำนวนแถว
+    """
+    temp_path = arrow_path + ".tmp"
+    num_rows = 0
+
+    with pa.OSFile(temp_path, "wb") as sink:
+        with pa.ipc.new_stream(sink, OSCAR_SCHEMA) as writer:
+            for batch in iter_jsonl_zst_record_batches(file_path):
+                writer.write_batch(batch)
+                num_rows += batch.num_rows
+
+    os.replace(temp_path, arrow_path)
+    return num_rows
+
+
+def convert_jsonl_zst_files_hf(batch, arrow_paths):
+    # Expects a batch of file indices from `Dataset.map(batched=True)`
+    num_rows = []
+    for file_path, index in zip(batch["file"], batch["index"]):
+        try:
+            num_rows.append(convert_jsonl_zst_file(file_path, arrow_paths[index]))
+        except Exception as e:
+            print(f"Error processing file {file_path}: {e}")
+            num_rows.append(-1)
+    return {"file": batch["file"], "num_rows": num_rows}
+
+
+def read_jsonl_zst_files(dir_path: str, cache_dir: str, num_proc: int = 1) -> Dataset:
+    """
+    This function reads the OSCAR colossal .jsonl.zst files of a directory as one dataset. Each file is a
+    shard, decompressed and parsed by one of `num_proc` processes straight into Arrow record batches, and
+    stored in `cache_dir`. A file already converted by an earlier run is not read again, so a crashed
+    ingest resumes at the next unfinished file. Files that fail are reported, left out and retried on the
+    next run.
+
+    ฟังก์ชันนี้อ่านไฟล์ .jsonl.zst ของ OSCAR colossal ในไดเรกทอรีเป็นชุดข้อมูลเดียว โดยแต่ละไฟล์ถูกแตกไฟล์
+    และแปลงเป็น Arrow โดย process หนึ่งตัวจาก `num_proc` และเก็บไว้ใน `cache_dir` ไฟล์ที่แปลงเสร็จแล้วจะไม่ถูกอ่านซ้ำ
+    ทำให้สามารถอ่านต่อจากไฟล์ที่ยังไม่เสร็จได้เมื่อโปรแกรมหยุดทำงานกลางคัน
+
+    Parameters:
+    dir_path (str): The directory of the .jsonl.zst files, as `<dir_path>/<folder>/<subfolder>/<file>.jsonl.zst`.
+                    ไดเรกทอรีของไฟล์ .jsonl.zst
+    cache_dir (str): The directory of the converted Arrow files.
+                     ไดเรกทอรีที่เก็บไฟล์ Arrow ที่แปลงแล้ว
+    num_proc (int): The number of processes. (default is 1)
+                    จำนวน process
+
+    Returns:
+    Dataset: The documents with the `text`, `created_date`, `source`, `source_id` and `meta` columns.
+             ชุดข้อมูลของเอกสาร
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    file_paths = list_jsonl_zst_files(dir_path)
+    arrow_paths = [
+        os.path.join(cache_dir, os.path.relpath(path, dir_path).replace(os.sep, "__") + ".arrow")
+        for path in file_paths
+    ]
+
+    pending = [i for i, path in enumerate(arrow_paths) if not os.path.exists(path)]
+    if pending:
+        Dataset.from_dict({"file": [file_paths[i] for i in pending], "index": pending}).map(
+            convert_jsonl_zst_files_hf,
+            fn_kwargs={"arrow_paths": arrow_paths},
+            batched=True,
+            batch_size=1,
+            num_proc=max(1, min(num_proc, len(pending))),
+            remove_columns=["index"],
+            # The files are converted as a side effect, a cached result would skip them
+            load_from_cache_file=False,
+            keep_in_memory=True,
+            desc="Reading files...",
+        )
+
+    shards = [Dataset.from_file(path) for path in arrow_paths if os.path.exists(path)]
+    if not shards:
+        return Dataset.from_dict(
+            {name: [] for name in OSCAR_SCHEMA.names},
+            features=Features.from_arrow_schema(OSCAR_SCHEMA),
+        )
+    return concatenate_datasets(shards)
+
+
+def iter_dataset_chunks(dataset: Union[Dataset, IterableDataset], batch_size: int) -> Iterator[pa.Table]:
+    # Chunks of `batch_size` rows as Arrow tables, a streaming dataset is read as it goes
+    return dataset.with_format("arrow").iter(batch_size=batch_size)
+
+
+def iter_jsonl_zst_chunks(dir_path: str, batch_size: int) -> Iterator[pa.Table]:
+    """
+    Read the OSCAR colossal .jsonl.zst files of a directory one file at a time, as chunks of at most
+    `batch_size` rows, without converting the files first. Files that fail are reported and skipped.
+    อ่านไฟล์ .jsonl.zst ของ OSCAR colossal ทีละไฟล์เป็น chunk ขนาดไม่เกิน `batch_size` แถว โดยไม่ต้องแปลงไฟล์ก่อน
+    """
+    for file_path in list_jsonl_zst_files(dir_path):
+        try:
+            for batch in iter_jsonl_zst_record_batches(file_path, batch_size):
+                yield pa.Table.from_batches([batch])
+        except Exception as e:
+            print(f"Error processing file {file_path}: {e}")
+
+
+def add_row_ids(chunks: Iterable[pa.Table], name: str = "source_id") -> Iterator[pa.Table]:
+    # Number the rows across the chunks, like `add_column(name, range(len(dataset)))`
+    first = 0
+    for chunk in chunks:
+        yield chunk.append_column(name, pa.array(np.arange(first, first + len(chunk), dtype=np.int64)))
+        first += len(chunk)
+
+
+class ShardWriter:
+    """
+    This class writes a stream of Arrow tables as numbered shards, `data-00000.jsonl.zst` or `.parquet`,
+    starting a new shard every `rows_per_shard` rows. Each shard is copied to the other output directories
+    once complete, and `close` writes the manifest.
+
+    คลาสนี้เขียนตาราง Arrow ที่ได้รับต่อเนื่องเป็นไฟล์ย่อยที่มีหมายเลขกำกับ โดยเริ่มไฟล์ใหม่ทุก `rows_per_shard` แถว
+    และเขียน manifest เมื่อเรียก `close`
+
+    Parameters:
+    output_dirs (List[str]): The directories to write, the shards are written to the first one and copied to the others.
+                             ไดเรกทอรีที่ต้องการเขียน ไฟล์จะถูกเขียนในไดเรกทอรีแรกและคัดลอกไปยังไดเรกทอรีอื่น
+    output_format (str): "jsonl.zst" or "parquet". (default is "jsonl.zst")
+                         รูปแบบของไฟล์
+    rows_per_shard (int): The number of rows of a shard. (default is 1000000)
+                          จำนวนแถวของแต่ละไฟล์
+    """
+
+    def __init__(self, output_dirs: List[str], output_format: str = "jsonl.zst", rows_per_shard: int = DEFAULT_ROWS_PER_SHARD):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, got {output_format}")
+        self.output_dirs = output_dirs
+        self.output_format = output_format
+        self.rows_per_shard = rows_per_shard
+        self.shards: List[dict] = []
+        self.writer: Optional[TableFileWriter] = None
+        for output_dir in output_dirs:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def shard_name(self, index: int) -> str:
+        return f"data-{index:05d}.{self.output_format}"
+
+    def write(self, table: pa.Table):
+        start = 0
+        while start < len(table):
+            if self.writer is None:
+                path = os.path.join(self.output_dirs[0], self.shard_name(len(self.shards)))
+                self.writer = TableFileWriter(path, self.output_format)
+            length = min(self.rows_per_shard - self.writer.num_rows, len(table) - start)
+            self.writer.write(table.slice(start, length))
+            start += length
+            if self.writer.num_rows >= self.rows_per_shard:
+                self.finish_shard()
+
+    def finish_shard(self):
+        name = self.shard_name(len(self.shards))
+        num_rows = self.writer.close()
+        for output_dir in self.output_dirs[1:]:
+            shutil.copyfile(self.writer.path, os.path.join(output_dir, name))
+        self.shards.append({"file": name, "num_rows": num_rows})
+        self.writer = None
+
+    def close(self) -> dict:
+        if self.writer is not None:
+            self.finish_shard()
+        return write_manifest(self.output_dirs, self.shards, self.output_format)
+
+
+def stream_chunks(
+    chunks: Iterable[pa.Table],
+    process: Callable[[pa.Table], pa.Table],
+    writer: ShardWriter,
+    num_proc: int = 1,
+    max_pending: Optional[int] = None,
+) -> dict:
+    """
+    This function runs `process` on a stream of chunks with `num_proc` worker processes and writes the
+    results in input order as they complete. At most `max_pending` chunks are in flight: the next chunk
+    is read only once the oldest result is written, so memory stays bounded whatever the corpus size.
+    Workers are forked, models loaded before the call (e.g. with `preload`) are shared with them.
+
+    ฟังก์ชันนี้ประมวลผล chunk ที่อ่านต่อเนื่องด้วย worker จำนวน `num_proc` และเขียนผลลัพธ์ตามลำดับเดิม
+    โดยมี chunk ที่กำลังประมวลผลไม่เกิน `max_pending` ชุด ทำให้หน่วยความจำที่ใช้ไม่ขึ้นกับขนาดของข้อมูล
+
+    Parameters:
+    chunks (Iterable[pa.Table]): The input chunks.
+                                 chunk ของข้อมูลนำเข้า
+    process (Callable[[pa.Table], pa.Table]): The function applied to each chunk, it must be picklable.
+                                              ฟังก์ชันที่ใช้กับแต่ละ chunk
+    writer (ShardWriter): The writer of the results.
+                          ตัวเขียนผลลัพธ์
+    num_proc (int): The number of processes. (default is 1)
+                    จำนวน process
+    max_pending (int): The maximum number of chunks in flight. (default is 2 * num_proc)
+                       จำนวน chunk สูงสุดที่กำลังประมวลผล
+
+    Returns:
+    dict: The manifest.
+          ข้อมูลใน manifest
+    """
+    max_pending = max_pending or 2 * num_proc
+
+    with multiprocessing.get_context("fork").Pool(num_proc) as pool:
+        pending = deque()
+        for chunk in chunks:
+            # Back-pressure, wait for the oldest chunk before reading more
+            if len(pending) >= max_pending:
+                writer.write(pending.popleft().get())
+            pending.append(pool.apply_async(process, (chunk,)))
+        while pending:
+            writer.write(pending.popleft().get())
+
+    return writer.close()
+
+
+def signature_array(signatures: np.ndarray) -> pa.ListArray:
+    # One list<uint64> per row, the type of the `hashvalues` column written by the MinHash scripts
+    num_rows, num_perm = signatures.shape
+    offsets = pa.array(np.arange(0, (num_rows + 1) * num_perm, num_perm, dtype=np.int32))
+    return pa.ListArray.from_arrays(offsets, pa.array(signatures.reshape(-1), type=pa.uint64()))
+
+
+def process_fused_chunk(
+    chunk: pa.Table,
+    clean_text: Callable[[str], str],
+    source: str,
+    filename: str,
+    num_perm: int,
+    do_perplexity: bool = False,
+    sampled_back_ratio: float = 0.0,
+) -> pa.Table:
+    """
+    This function runs every per-document stage on a chunk in one pass: it cleans and scores the texts with
+    `process_chunk`, converts the kept rows to the output fields and segments them with newmm into their MinHash
+    signature. The texts are passed from stage to stage in memory.
+
+    Expects a chunk from `Dataset.with_format("arrow").map(batched=True)`, with the "newmm" dictionary loaded.
+
+    ฟังก์ชันนี้ประมวลผลทุกขั้นตอนที่ทำทีละเอกสารกับ chunk ในรอบเดียว ได้แก่ ทำความสะอาดและจัดประเภทข้อความ
+    แปลงเป็นฟิลด์ของผลลัพธ์ และตัดคำด้วย newmm เพื่อสร้างลายเซ็น MinHash โดยส่งข้อความระหว่างขั้นตอนในหน่วยความจำ
+
+    Parameters:
+    chunk (pa.Table): The chunk to process, with a `text` column.
+                      chunk ที่ต้องการประมวลผล ซึ่งมีคอลัมน์ `text`
+    clean_text (Callable[[str], str]): The function that cleans a text, an empty result marks a blank text.
+                                       ฟังก์ชันที่ใช้ทำความสะอาดข้อความ
+    source (str): The source of the dataset, e.g. mc4, cc100 or oscar.
+                  แหล่งที่มาของชุดข้อมูล
+    filename (str): The input dataset, recorded in `meta`.
+                    ชุดข้อมูลต้นทางที่บันทึกไว้ใน `meta`
+    num_perm (int): The number of permutations of the MinHash signatures.
+                    จำนวน permutations ของลายเซ็น MinHash
+    do_perplexity (bool): Classify the texts with the perplexity model and sample spam back. (default is False)
+                          จัดประเภทข้อความด้วยโมเดล perplexity และสุ่มข้อความ spam กลับมา
+    sampled_back_ratio (float): The ratio of spam texts to sample back. (default is 0.0)
+                                อัตราส่วนของข้อความ spam ที่จะสุ่มกลับมา
+
+    Returns:
+    pa.Table: The kept rows with the output fields and their `hashvalues`.
+              แถวที่ถูกเก็บไว้พร้อมฟิลด์ของผลลัพธ์และลายเซ็น `hashvalues`
+    """
+    table = filter_fields(
+        process_chunk(chunk, clean_text, do_perplexity, sampled_back_ratio),
+        source=source,
+        filename=filename,
+    )
+
+    signatures = generate_minhash_signatures_batch(table.column("text").to_pylist(), num_perm)
+    return set_column(table, SIGNATURE_COLUMN, signature_array(signatures))
+
+
+def run_pipeline(
+    clean_text: Callable[[str], str],
+    pretrain_data_args,
+    processing_config,
+    minhash_config,
+    deduplicate_args,
+    output_config,
+    global_config,
+    dataset_groups=None,
+    decontaminate_args=None,
+    blind_config=None,
+) -> dict:
+    """
+    This function runs the pattern, perplexity and MinHash stages as one fused `map` over the batches of a
+    dataset, then the global steps, LSH deduplication and decontamination, on the emitted `hashvalues` column.
+    With `blind_config`, only the kept rows are anonymized, after the global steps have read the cleaned texts,
+    and the rows are written once with `write_shards`. The separate scripts read and write the whole dataset
+    once per stage, here the global steps and the output read the output of the fused stage.
+    With `global_config.checkpoint_path`, every stage is skipped by a restarted job once it is done.
+
+    ฟังก์ชันนี้ประมวลผลขั้นตอน pattern, perplexity และ MinHash ด้วย `map` เพียงรอบเดียว
+    จากนั้นจึงกำจัดข้อมูลซ้ำด้วย LSH และกำจัดข้อมูลปนเปื้อนจากคอลัมน์ `hashvalues` หากกำหนด `blind_config`
+    จะปกปิดข้อมูลเฉพาะแถวที่เก็บไว้ หลังจากขั้นตอนทั้งหมดอ่านข้อความที่ทำความสะอาดแล้ว และเขียนแถวที่เก็บไว้เพียงครั้งเดียว
+    ขั้นตอนทั้งหมดอ่านผลลัพธ์ของ `map` แทนการอ่านและเขียนชุดข้อมูลทั้งหมดในทุกขั้นตอน
+
+    Parameters:
+    clean_text (Callable[[str], str]): The function that cleans a text, an empty result marks a blank text.
+                                       ฟังก์ชันที่ใช้ทำความสะอาดข้อความ
+    pretrain_data_args (Namespace): The input dataset, its `path_name`, `split` and `col_name`.
+                                    ชุดข้อมูลนำเข้า
+    processing_config (Namespace): The `source`, `batch_size`, `do_perplexity` and `sampled_back_ratio`.
+                                   การตั้งค่าการประมวลผลทีละเอกสาร
+    minhash_config (Namespace): The newmm dictionary of the MinHash signatures, and the `signature_path` of the benchmarks.
+                                การตั้งค่าสำหรับ MinHash รวมถึงพจนานุกรม
+    deduplicate_args (Namespace): The deduplication settings, as for `deduplicate`.
+                                  การตั้งค่าการกำจัดข้อมูลซ้ำ
+    output_config (Namespace): The output `path`, optional `scratch_path`, `num_shards` and `output_format`.
+                               การตั้งค่าของผลลัพธ์
+    global_config (Namespace): The number of permutations and processes, and the optional `checkpoint_path`.
+                               การตั้งค่าทั่วไป
+    dataset_groups (dict): The benchmarks, None to skip decontamination. (default is None)
+                           ชุดข้อมูลประเมินผล หรือ None หากไม่ต้องการกำจัดข้อมูลปนเปื้อน
+    decontaminate_args (Namespace): The decontamination settings, as for `decontaminate`. (default is None)
+                                    การตั้งค่าการกำจัดข้อมูลปนเปื้อน
+    blind_config (Namespace): The anonymization settings, None to skip anonymization. (default is None)
+                              การตั้งค่าการปกปิดข้อมูล หรือ None หากไม่ต้องการปกปิดข้อมูล
+
+    Returns:
+    dict: The manifest of the written shards.
+          ข้อมูลใน manifest ของไฟล์ที่เขียน
+    """
+    num_proc = global_config.num_process
+    num_perm = global_config.num_perm
+    source = processing_config.source
+    do_perplexity = bool(processing_config.do_perplexity)
+    sampled_back_ratio = processing_config.sampled_back_ratio or 0.0
+
+    dataset = load_from_disk(pretrain_data_args.path_name)
+    if isinstance(dataset, DatasetDict):
+        dataset = dataset[pretrain_data_args.split]
+    if "id" not in dataset.column_names and "source_id" not in dataset.column_names:
+        dataset = dataset.add_column("source_id", list(range(len(dataset))))
+
+    # Load the dictionary and the models once here, the forked workers share them
+    load_dict(minhash_config.newmm_dict, "newmm")
+    if do_perplexity:
+        preload()
+
+    checkpoint = get_stage_checkpoint(
+        global_config,
+        "fused",
+        stage_key(
+            dataset_fingerprint(dataset),
+            source,
+            do_perplexity,
+            sampled_back_ratio,
+            processing_config.batch_size,
+            num_perm,
+            dictionary_version(minhash_config.newmm_dict),
+        ),
+    )
+
+    # Every per-document stage runs in the same map, only its output is written to the cache
+    fused = run_stage(
+        checkpoint,
+        lambda checkpoint: dataset.with_format("arrow").map(
+            partial(
+                process_fused_chunk,
+                clean_text=clean_text,
+                source=source,
+                filename=pretrain_data_args.path_name,
+                num_perm=num_perm,
+                do_perplexity=do_perplexity,
+                sampled_back_ratio=sampled_back_ratio,
+            ),
+            batched=True,
+            batch_size=processing_config.batch_size,
+            num_proc=num_proc,
+            remove_columns=dataset.column_names,
+            desc="Processing...",
+            **stage_map_kwargs(checkpoint, "fused", load_from_cache_file=None),
+        ).with_format(None),
+        num_proc,
+    )
+
+    # The global steps read the signatures of the fused output, their stages are prefixed to share the checkpoints.
+    # An empty dataset has nothing to remove, `Dataset.map` does not run on it and leaves no columns.
+    remove_ids = [np.empty(0, dtype=np.int64)]
+    if len(fused) > 0:
+        duplicate_results = find_duplicates(fused, deduplicate_args, global_config, stage_prefix="deduplicate_")
+        remove_ids.append(get_duplicate_ids(duplicate_results, deduplicate_args))
+        print(f"Found {len(remove_ids[-1])} duplicates")
+
+        if dataset_groups is not None and decontaminate_args is not None:
+            generate_benchmark_signatures(dataset_groups, minhash_config, global_config)
+            contaminated_results = find_contamination(
+                dataset_groups,
+                fused,
+                fused,
+                pretrain_data_args,
+                decontaminate_args,
+                global_config,
+                stage_prefix="decontaminate_",
+            )
+            if len(contaminated_results) > 0:
+                remove_ids.append(
+                    np.asarray(contaminated_results.with_format("numpy")["original_id"], dtype=np.int64))
+            print(f"Found {len(contaminated_results)} contaminated documents")
+
+    # A document both duplicated and contaminated is removed once
+    keep_mask = build_keep_mask(len(fused), np.concatenate(remove_ids))
+    output = select_rows(fused, keep_mask)
+    if SIGNATURE_COLUMN in output.column_names:
+        output = output.remove_columns(SIGNATURE_COLUMN)
+
+    # Anonymize only the kept rows. The global steps, the n-gram check of decontamination included,
+    # read the cleaned texts, and no document later removed goes through the NER model.
+    if blind_config is not None and len(output) > 0:
+        # Imported here, torch and transformers are only needed when the texts are anonymized
+        from data_processing.anonymization.anonymize import anonymize_batch_hf, get_anonymizer_args
+
+        anonymizer_args = get_anonymizer_args(blind_config)
+        checkpoint = get_stage_checkpoint(
+            global_config, "anonymize", stage_key(dataset_fingerprint(output), anonymizer_args))
+        kept = output
+        output = run_stage(
+            checkpoint,
+            lambda checkpoint: kept.map(
+                anonymize_batch_hf,
+                fn_kwargs={"anonymizer_args": anonymizer_args},
+                batched=True,
+                batch_size=anonymizer_args["batch_size"],
+                num_proc=num_proc,
+                desc="Anonymizing...",
+                **stage_map_kwargs(checkpoint, "anonymize", load_from_cache_file=None),
+            ),
+            num_proc,
+        )
+
+        # Report how many documents took each path, the workers' counters do not reach this process
+        num_ner = sum(output[NER_COLUMN])
+        print(f"Anonymized {len(output)} documents: {num_ner} with NER, {len(output) - num_ner} with regex only")
+        output = output.remove_columns(NER_COLUMN)
+
+    output_dirs = [output_config.path]
+    if getattr(output_config, "scratch_path", None):
+        output_dirs.append(output_config.scratch_path)
+
+    return write_shards(
+        output,
+        output_dirs,
+        num_proc=num_proc,
+        num_shards=getattr(output_config, "num_shards", None),
+        output_format=getattr(output_config, "output_format", None) or "jsonl.zst",
+    )
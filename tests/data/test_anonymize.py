@@ -1,6 +1,10 @@
 from data_processing.anonymization.anonymize import (
     anonymize,
-    ner_tag_transformer
+    get_anonymizer,
+    ner_tag_transformer,
+    plan_windows,
+    replace_sensitive_information,
+    window_owners,
 )
 import pandas as pd
 from datasets import Dataset
@@ -66,6 +70,76 @@ class TestAnonymize(unittest.TestCase):
 
         self.assertIn("<id no.>", result)
 
+    def test_anonymize_batch(self):
+        texts = [
+            "โปรดส่ง email มาหาฉันที่ email nectec@gmail.com",
+            "เบอร์โทรของฉันคือ 0890340123",
+            "บัตรประชาชนของฉันคือ 1-1996-99999-94-1",
+        ]
+        anonymizer = get_anonymizer()
+
+        # The model is loaded once per process and configuration
+        self.assertIs(anonymizer, get_anonymizer())
+        self.assertEqual(anonymizer.anonymize_batch(texts), [anonymize(text) for text in texts])
+
+    def test_plan_windows(self):
+        # Words of 2 tokens, windows of 8 tokens sharing 4 tokens
+        word_starts = list(range(0, 20, 2))
+        windows = plan_windows(word_starts, 20, 8, 4)
+        self.assertEqual(windows, [(0, 8), (4, 12), (8, 16), (12, 20)])
+
+        # Every token is owned by exactly one window that contains it
+        owned = window_owners(windows, word_starts)
+        self.assertEqual(owned, [(0, 6), (6, 10), (10, 14), (14, 20)])
+        for (start, end), (low, high) in zip(windows, owned):
+            self.assertTrue(start <= low <= high <= end)
+
+        # A document that fits is a single window
+        self.assertEqual(plan_windows([0, 2, 5], 7, 10, 4), [(0, 7)])
+        self.assertEqual(plan_windows([], 0, 10, 4), [])
+
+    def test_plan_windows_long_word(self):
+        # Windows are cut on word boundaries, and inside a word only when it is longer than a window
+        word_starts = [0, 1, 15, 16]
+        windows = plan_windows(word_starts, 17, 6, 2)
+        self.assertEqual(windows[0], (0, 1))
+        for start, end in windows:
+            self.assertLessEqual(end - start, 6)
+        self.assertEqual(windows[-1][1], 17)
+
+    def test_long_document(self):
+        # A document longer than the model's max length is anonymized in full
+        text_test = "เบอร์โทรของฉันคือ 0890340123 " * 200
+        result = anonymize(text_test, ner_corpus="pythainlp/thainer-corpus-v2-base-model", NER_TAG=True)
+
+        self.assertEqual(result.count("<phone_number>"), 200)
+
+    def test_prescreen(self):
+        anonymizer = get_anonymizer(prescreen=True)
+        texts = [
+            "วันนี้อากาศดีมาก ฝนไม่ตก",
+            "เบอร์โทรของฉันคือ 0890340123",
+            "ฉันชื่อ นางสาวมะลิวา บุญสระดี",
+        ]
+        self.assertEqual(anonymizer.screen(texts), [False, True, True])
+
+        # A document without any signal only gets the regex substitutions
+        counts = dict(anonymizer.counts)
+        result = anonymizer.anonymize_batch(texts)
+        self.assertEqual(result[0], replace_sensitive_information(texts[0]))
+        self.assertIn("<phone_number>", result[1])
+        self.assertEqual(anonymizer.counts["regex"] - counts.get("regex", 0), 1)
+        self.assertEqual(anonymizer.counts["ner"] - counts.get("ner", 0), 2)
+
+    def test_untitled_person_without_prescreen(self):
+        # Without the pre-screen, a name without a title still goes through the NER model
+        text_test = "สมชาย ใจดี เดินทางไปเชียงใหม่เมื่อวานนี้"
+        anonymizer = get_anonymizer()
+        self.assertFalse(anonymizer.prescreen)
+        self.assertEqual(anonymizer.screen([text_test]), [True])
+
+        self.assertIn("<person>", anonymize(text_test))
+
 
 if __name__ == "__main__":
     TestAnonymize.NER_TAG_TRANSFORMER_MODEL = "pythainlp/thainer-corpus-v2-base-model"
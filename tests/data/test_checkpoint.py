@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from datasets import Dataset
+
+from data_processing.core.checkpoint import (
+    StageCheckpoint,
+    dataset_fingerprint,
+    get_stage_checkpoint,
+    run_stage,
+    stage_key,
+    stage_map_kwargs,
+)
+
+
+def double_hf(batch):
+    return {"value": [2 * value for value in batch["value"]]}
+
+
+def fail_hf(batch):
+    raise RuntimeError("the stage should be loaded from its checkpoint")
+
+
+def fail_first_shard_hf(batch, idx):
+    # Only the rows of the second shard may be processed again
+    if min(idx) < 5:
+        raise RuntimeError("the first shard should be loaded from its cache file")
+    return {"value": [2 * value for value in batch["value"]]}
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_run_stage_once(self):
+        dataset = Dataset.from_dict({"value": list(range(10))})
+        key = stage_key(dataset_fingerprint(dataset), 0.9)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            checkpoint = StageCheckpoint(tmpdir, "double", key)
+            self.assertFalse(checkpoint.is_done())
+
+            result = run_stage(
+                checkpoint,
+                lambda checkpoint: dataset.map(double_hf, batched=True, **checkpoint.map_kwargs("double")),
+            )
+            self.assertTrue(checkpoint.is_done())
+            self.assertEqual(result["value"], [2 * i for i in range(10)])
+            self.assertFalse(os.path.exists(os.path.join(checkpoint.path, "shards")))
+
+            # A restarted job loads the output instead of running the stage again
+            result = run_stage(
+                StageCheckpoint(tmpdir, "double", key),
+                lambda checkpoint: dataset.map(fail_hf, batched=True, **checkpoint.map_kwargs("double")),
+            )
+            self.assertEqual(result["value"], [2 * i for i in range(10)])
+
+            # Other settings give another key, and the stage runs again
+            self.assertNotEqual(stage_key(dataset_fingerprint(dataset), 0.8), key)
+            self.assertFalse(StageCheckpoint(tmpdir, "double", stage_key(dataset_fingerprint(dataset), 0.8)).is_done())
+
+    def test_resume_map_shards(self):
+        dataset = Dataset.from_dict({"value": list(range(10))})
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            checkpoint = StageCheckpoint(tmpdir, "double", "key")
+            dataset.map(double_hf, batched=True, num_proc=2, **checkpoint.map_kwargs("double"))
+
+            # The job stopped before the second shard was complete
+            shards_path = os.path.join(checkpoint.path, "shards", "key")
+            shard_files = sorted(os.listdir(shards_path))
+            self.assertEqual(len(shard_files), 2)
+            os.remove(os.path.join(shards_path, shard_files[1]))
+
+            result = dataset.map(
+                fail_first_shard_hf, batched=True, with_indices=True, num_proc=2, **checkpoint.map_kwargs("double")
+            )
+            self.assertEqual(result["value"], [2 * i for i in range(10)])
+
+    def test_without_checkpoint(self):
+        self.assertIsNone(get_stage_checkpoint(SimpleNamespace(num_process=1), "double", "key"))
+        self.assertIsNone(get_stage_checkpoint(SimpleNamespace(checkpoint_path=None), "double", "key"))
+        self.assertEqual(stage_map_kwargs(None, "double"), {"load_from_cache_file": False})
+
+        dataset = Dataset.from_dict({"value": [1, 2]})
+        result = run_stage(None, lambda checkpoint: dataset.map(double_hf, batched=True))
+        self.assertEqual(result["value"], [2, 4])
+
+    def test_data_path(self):
+        dataset = Dataset.from_dict({"value": [1, 2]})
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data_path = os.path.join(tmpdir, "signatures")
+            global_config = SimpleNamespace(checkpoint_path=os.path.join(tmpdir, "checkpoints"))
+            checkpoint = get_stage_checkpoint(global_config, "minhash", "key", data_path=data_path)
+            run_stage(checkpoint, lambda checkpoint: dataset)
+
+            self.assertTrue(os.path.exists(data_path))
+            self.assertTrue(checkpoint.is_done())
+            # The stage is done only while its output is still there
+            self.assertFalse(
+                get_stage_checkpoint(global_config, "minhash", "key", data_path=os.path.join(tmpdir, "other")).is_done()
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
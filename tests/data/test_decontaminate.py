@@ -0,0 +1,203 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+from datasets import Dataset, DatasetDict
+from datasketch import LeanMinHash, MinHashLSH
+from nlpo3 import load_dict
+
+from data_processing.core.constants import MINHASH_SEED
+from data_processing.core.lsh_index import build_band_index
+from data_processing.decontamination.decontaminate import (
+    contaminated_pretrain_dataset,
+    indentify_decontaminate_pretrain_dataset,
+    process_data,
+    query_func,
+)
+from data_processing.decontamination.ngram_overlap import (
+    NGRAM_KEYS_FILE,
+    build_ngram_index,
+    find_overlaps,
+    hash_ngrams,
+    merge_spans,
+)
+from data_processing.decontamination.signature_store import (
+    get_store_path,
+    hash_texts,
+    save_signature_store,
+)
+
+NEWMM_DICT = os.path.join(
+    os.path.dirname(__file__),
+    "../../src/data_processing/deduplication/words_th.txt",
+)
+
+
+def random_signatures(num_rows, num_perm, seed=0):
+    rng = np.random.RandomState(seed)
+    return rng.randint(0, 2**32 - 1, size=(num_rows, num_perm)).astype(np.uint64)
+
+
+class TestCombinedBenchmarkIndex(unittest.TestCase):
+
+    def test_single_pass_matches_per_benchmark_lsh(self):
+        num_perm, threshold = 128, 0.3
+        benchmarks = {"bench_a": random_signatures(6, num_perm, 1), "bench_b": random_signatures(4, num_perm, 2)}
+        queries = random_signatures(5, num_perm, 3)
+        queries[0] = benchmarks["bench_a"][2]
+        queries[1, :90] = benchmarks["bench_b"][3, :90]
+        queries[2] = benchmarks["bench_a"][5]
+        queries[2, :64] = benchmarks["bench_b"][0, :64]
+
+        benchmark_dataset = Dataset.from_dict(
+            {
+                "benchmark": [k for k, v in benchmarks.items() for _ in v],
+                "local_id": [i for v in benchmarks.values() for i in range(len(v))],
+                "text": [f"{k} {i}" for k, v in benchmarks.items() for i in range(len(v))],
+                "hashvalues": np.concatenate(list(benchmarks.values())),
+            }
+        )
+
+        with tempfile.TemporaryDirectory() as index_path:
+            build_band_index(benchmark_dataset, threshold, num_perm, index_path, batch_size=3)
+            idx = list(range(len(queries)))
+            batch = query_func({"hashvalues": queries}, idx, index_path, np.zeros(num_perm, dtype=np.uint64))
+            batch.update(
+                hashvalues=queries,
+                source=["pretrain"] * len(queries),
+                text=[f"doc {i}" for i in idx],
+            )
+            results = process_data(batch, benchmark_dataset, threshold, "text")
+
+        expected = set()
+        for key, signatures in benchmarks.items():
+            lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+            for i, hashvalues in enumerate(signatures):
+                lsh.insert(i, LeanMinHash(seed=MINHASH_SEED, hashvalues=hashvalues))
+            for j, hashvalues in enumerate(queries):
+                minhash = LeanMinHash(seed=MINHASH_SEED, hashvalues=hashvalues)
+                scores = {i: minhash.jaccard(LeanMinHash(seed=MINHASH_SEED, hashvalues=signatures[i])) for i in lsh.query(minhash)}
+                scores = {i: s for i, s in scores.items() if s > threshold}
+                if scores:
+                    expected.add((j, key, max(scores, key=lambda i: (scores[i], -i))))
+
+        self.assertEqual(
+            set(zip(results["original_id"], results["duplicate_dataset"], results["duplicate_id"])),
+            expected,
+        )
+        self.assertEqual(len(expected), 4)
+
+
+class TestNoCandidates(unittest.TestCase):
+
+    def test_nothing_removed_without_candidates(self):
+        pretrain_data_args = SimpleNamespace(split="train", col_name="text")
+        global_config = SimpleNamespace(num_process=1)
+        # No pretraining document has an LSH candidate
+        candidates = Dataset.from_dict({"text": ["a"], "idx": [0]}).select([])
+
+        contaminated_results = contaminated_pretrain_dataset(
+            candidates, None, pretrain_data_args, SimpleNamespace(thresold=0.3), global_config)
+        self.assertEqual(len(contaminated_results), 0)
+        self.assertIn("original_id", contaminated_results.column_names)
+
+        # An empty result without columns removes nothing either
+        for results in (contaminated_results, Dataset.from_dict({})):
+            pretrain_dataset = DatasetDict({"train": Dataset.from_dict({"text": ["a", "b"]})})
+            pretrain_dataset = indentify_decontaminate_pretrain_dataset(
+                results, pretrain_dataset, pretrain_data_args, global_config)
+            self.assertEqual(pretrain_dataset["train"]["text"], ["a", "b"])
+
+
+class TestNgramOverlap(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        load_dict(NEWMM_DICT, "newmm")
+
+    def test_hash_ngrams(self):
+        token_hashes = np.array([1, 2, 3, 1, 2, 3], dtype=np.uint64)
+        ngrams = hash_ngrams(token_hashes, 3)
+        self.assertEqual(len(ngrams), 4)
+        self.assertEqual(ngrams[0], ngrams[3])
+        self.assertEqual(len(set(ngrams.tolist())), 3)
+        self.assertEqual(len(hash_ngrams(token_hashes, 7)), 0)
+
+    def test_merge_spans(self):
+        self.assertEqual(merge_spans([0, 3, 10], [5, 8, 12]), ([0, 10], [8, 12]))
+
+    def test_short_item_inside_long_document(self):
+        item = "นักเรียนต้องส่งการบ้านวิชาคณิตศาสตร์ภายในวันศุกร์นี้"
+        document = "ข่าวเศรษฐกิจวันนี้ " * 20 + item + " และอื่น ๆ" * 20
+        unrelated = "วันนี้อากาศดีมากเราจึงไปเดินเล่นที่สวนสาธารณะใกล้บ้าน"
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            args = SimpleNamespace(
+                ngram_size=4,
+                signature_path=tmpdir,
+                ngram_index_path=os.path.join(tmpdir, "ngram_index"),
+            )
+            save_signature_store(
+                Dataset.from_dict({"text": [item], "hashvalues": [[0] * 4]}),
+                get_store_path(tmpdir, "bench", "test", 4),
+                4,
+                hash_texts([item]),
+                "dict",
+            )
+            index_path = build_ngram_index(
+                {"bench": SimpleNamespace(split="test")}, args, SimpleNamespace(num_perm=4)
+            )
+            results = find_overlaps(
+                {"text": [unrelated, document]}, [0, 1], index_path, "text", min_overlap=2
+            )
+
+        self.assertEqual(results["original_id"], [1])
+        self.assertEqual(results["duplicate_datasets"], [["bench"]])
+        start, end = results["span_starts"][0][0], results["span_ends"][0][0]
+        self.assertEqual(document[start:end], item)
+
+    def test_ngram_index_reused_while_current(self):
+        item = "นักเรียนต้องส่งการบ้านวิชาคณิตศาสตร์ภายในวันศุกร์นี้"
+        dataset_groups = {"bench": SimpleNamespace(split="test")}
+        global_config = SimpleNamespace(num_perm=4)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store_path = get_store_path(tmpdir, "bench", "test", 4)
+            keys_path = os.path.join(tmpdir, "ngram_index", NGRAM_KEYS_FILE)
+
+            def save_store(texts):
+                save_signature_store(
+                    Dataset.from_dict({"text": texts, "hashvalues": [[0] * 4] * len(texts)}),
+                    store_path,
+                    4,
+                    hash_texts(texts),
+                    "dict",
+                )
+
+            def build(ngram_size):
+                args = SimpleNamespace(
+                    ngram_size=ngram_size,
+                    signature_path=tmpdir,
+                    ngram_index_path=os.path.join(tmpdir, "ngram_index"),
+                )
+                build_ngram_index(dataset_groups, args, global_config)
+                return np.load(keys_path)
+
+            save_store([item])
+            keys = build(4)
+            os.remove(keys_path)
+            np.save(keys_path, keys[:0])
+
+            # The index is kept while its meta matches, a changed file shows it was not rebuilt
+            self.assertEqual(len(build(4)), 0)
+            # Another `ngram_size` or new benchmark texts rebuild it
+            self.assertGreater(len(build(3)), 0)
+            np.testing.assert_array_equal(build(4), keys)
+            save_store([item, "วันนี้อากาศดีมากเราจึงไปเดินเล่นที่สวนสาธารณะใกล้บ้าน"])
+            self.assertGreater(len(build(4)), len(keys))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,9 @@ from hydra import compose, initialize
 import unittest
 from data_processing.deduplication.deduplicate import (
     deduplicate,
+    find_duplicates,
     generate_minhash_pretrain_dataset,
+    get_duplicate_ids,
     indentify_duplicate_pretrain_dataset,
     deduplicate_pretrain_dataset
 )
@@ -16,9 +18,19 @@ from data_processing.deduplication.generate_minhash import (
 
 )
 
+from data_processing.deduplication.cluster import (
+    DisjointSet,
+    cluster_duplicates,
+    select_representatives,
+)
+
 import pandas as pd
 from datasets import Dataset
 import hydra
+import numpy as np
+import os
+import tempfile
+from types import SimpleNamespace
 
 # Data for the dataset
 train_data = {
@@ -119,5 +131,65 @@ class TestGenerateMinhash(unittest.TestCase):
         self.assertGreater(len(dataset_dict["train"]), len(pretrain_dataset["train"]))
 
 
+class TestPairMode(unittest.TestCase):
+
+    def test_no_duplicates(self):
+        # Without any LSH neighbour the pairs are an empty map output, without columns
+        rng = np.random.RandomState(0)
+        dataset = Dataset.from_dict({
+            "text": ["a", "b", "c"],
+            "source": ["mc4"] * 3,
+            "hashvalues": rng.randint(0, 2**32 - 1, size=(3, 128)).astype(np.uint64),
+        })
+        with tempfile.TemporaryDirectory() as root:
+            deduplicate_args = SimpleNamespace(
+                thresold=0.9,
+                index_path=os.path.join(root, "index"),
+                save_path_duplicated=os.path.join(root, "duplicated"),
+                batch_size=2,
+                mode="pair",
+            )
+            duplicate_results = find_duplicates(
+                dataset, deduplicate_args, SimpleNamespace(num_process=1, num_perm=128, checkpoint_path=None))
+
+            self.assertEqual(len(duplicate_results), 0)
+            self.assertEqual(get_duplicate_ids(duplicate_results, deduplicate_args).tolist(), [])
+
+
+class TestCluster(unittest.TestCase):
+
+    def test_disjoint_set(self):
+        disjoint_set = DisjointSet(6)
+        disjoint_set.union(0, 1)
+        disjoint_set.union(3, 4)
+        disjoint_set.union(1, 4)
+        self.assertEqual(disjoint_set.find(0), disjoint_set.find(3))
+        self.assertNotEqual(disjoint_set.find(0), disjoint_set.find(2))
+        self.assertEqual(disjoint_set.find(5), 5)
+
+    def test_keep_one_per_cluster(self):
+        edges = Dataset.from_dict({"src": [0, 2, 3, 6], "dst": [5, 3, 4, 7], "score": [1.0] * 4})
+        dataset = Dataset.from_dict({
+            "text": ["a", "b", "ccc", "dd", "eeee", "f", "g", "hh"],
+            "source": ["mc4", "mc4", "mc4", "oscar", "mc4", "cc100", "mc4", "cc100"],
+        })
+        members, cluster_ids = cluster_duplicates(edges, len(dataset), batch_size=2)
+        self.assertEqual(members.tolist(), [0, 2, 3, 4, 5, 6, 7])
+
+        def kept(keep_rule, source_priority=None):
+            keep = select_representatives(members, cluster_ids, dataset, keep_rule, source_priority)
+            return members[keep].tolist()
+
+        self.assertEqual(kept("lowest_id"), [0, 2, 6])
+        self.assertEqual(kept("longest_text"), [0, 4, 7])
+        self.assertEqual(kept("source_priority", ["cc100", "oscar"]), [3, 5, 7])
+
+    def test_no_duplicates(self):
+        # The edges of a dataset without duplicates are an empty map output, without columns
+        members, cluster_ids = cluster_duplicates(Dataset.from_dict({}), 2, batch_size=2)
+        self.assertEqual(members.tolist(), [])
+        self.assertEqual(cluster_ids.tolist(), [])
+
+
 if __name__ == "__main__":
     unittest.main()
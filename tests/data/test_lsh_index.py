@@ -0,0 +1,95 @@
+import tempfile
+import unittest
+
+import numpy as np
+from datasets import Dataset, concatenate_datasets
+from datasketch import LeanMinHash, MinHashLSH
+
+from data_processing.core.constants import MINHASH_SEED
+from data_processing.core.lsh_index import (
+    SignatureMatrix,
+    build_band_index,
+    is_band_index_current,
+    jaccard_scores,
+    load_band_index,
+)
+
+
+def random_signatures(num_rows, num_perm, seed=0):
+    rng = np.random.RandomState(seed)
+    signatures = rng.randint(0, 2**32 - 1, size=(num_rows, num_perm)).astype(np.uint64)
+    # Make a few near-duplicates sharing most of their hash values.
+    signatures[1] = signatures[0]
+    signatures[2, :100] = signatures[0, :100]
+    signatures[4, :] = signatures[3, :]
+    signatures[4, 5] = 7
+    return signatures
+
+
+class TestBandIndex(unittest.TestCase):
+
+    def test_query_matches_minhash_lsh(self):
+        num_perm = 128
+        signatures = random_signatures(50, num_perm)
+        dataset = Dataset.from_dict({"hashvalues": list(signatures)})
+
+        for threshold in (0.3, 0.9):
+            lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+            for i, hashvalues in enumerate(signatures):
+                lsh.insert(i, LeanMinHash(seed=MINHASH_SEED, hashvalues=hashvalues))
+
+            with tempfile.TemporaryDirectory() as index_path:
+                build_band_index(dataset, threshold, num_perm, index_path, batch_size=16)
+                index = load_band_index(index_path)
+                self.assertEqual(len(index), len(signatures))
+
+                for hashvalues, candidates in zip(signatures, index.query(signatures)):
+                    expected = sorted(
+                        lsh.query(LeanMinHash(seed=MINHASH_SEED, hashvalues=hashvalues))
+                    )
+                    self.assertEqual(candidates.tolist(), expected)
+
+
+class TestSignatureMatrix(unittest.TestCase):
+
+    def test_band_index_key(self):
+        dataset = Dataset.from_dict({"hashvalues": random_signatures(8, 16)})
+        with tempfile.TemporaryDirectory() as index_path:
+            self.assertFalse(is_band_index_current(index_path, "key"))
+            build_band_index(dataset, 0.5, 16, index_path, batch_size=4, key="key")
+            self.assertTrue(is_band_index_current(index_path, "key"))
+            self.assertFalse(is_band_index_current(index_path, "other"))
+            self.assertFalse(is_band_index_current(index_path, None))
+
+    def test_take_across_chunks_and_indices(self):
+        signatures = random_signatures(30, 64)
+        dataset = concatenate_datasets(
+            [
+                Dataset.from_dict({"hashvalues": list(signatures[:10])}),
+                Dataset.from_dict({"hashvalues": list(signatures[10:])}),
+            ]
+        )
+        row_ids = [29, 0, 10, 9, 15]
+        np.testing.assert_array_equal(
+            SignatureMatrix(dataset).take(row_ids), signatures[row_ids]
+        )
+
+        selected = dataset.select([5, 25, 12])
+        np.testing.assert_array_equal(
+            SignatureMatrix(selected).take([2, 0]), signatures[[12, 5]]
+        )
+
+    def test_jaccard_scores_match_lean_minhash(self):
+        signatures = random_signatures(5, 128)
+        scores = jaccard_scores(signatures[[0, 0, 3]], signatures[[1, 2, 4]])
+        expected = [
+            LeanMinHash(seed=MINHASH_SEED, hashvalues=signatures[i]).jaccard(
+                LeanMinHash(seed=MINHASH_SEED, hashvalues=signatures[j])
+            )
+            for i, j in [(0, 1), (0, 2), (3, 4)]
+        ]
+        self.assertEqual(scores.tolist(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
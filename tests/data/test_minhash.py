@@ -0,0 +1,73 @@
+import os
+import unittest
+
+import numpy as np
+from datasets import Dataset
+from datasketch import MinHash
+from nlpo3 import load_dict, segment
+
+from data_processing.core.constants import MINHASH_SEED
+from data_processing.core.minhash import (
+    N_GRAM,
+    generate_minhash_signature,
+    generate_minhash_signature_hf,
+    generate_minhash_signatures_batch,
+)
+
+NEWMM_DICT = os.path.join(
+    os.path.dirname(__file__),
+    "../../src/data_processing/deduplication/words_th.txt",
+)
+
+texts = [
+    "สวัสดีจ๊ะ! วันนี้ขายส้มโอนะคะ ส้มโอสดป้ายแดง อร่อยมากค่า ดูมั่งมี้ทั้งภาพและวิดีโอลามกห้ามพลาดเด็ดขาดจร้า",
+    "ในยามเช้าที่สดใส พร้อมแสงอรุณอันงดงามของดวงอาทิตย์ ฉันรู้สึกได้ถึงพลังสดชื่นและความหวังใหม่ที่จะเติมเต็มวันนี้",
+    "",
+    "สวัสดี",
+    "I am doing fine, thank you.",
+]
+
+
+def reference_hashvalues(text, num_perm):
+    minhash = MinHash(seed=MINHASH_SEED, num_perm=num_perm)
+    tokens = segment(text, "newmm")
+    for i in range(len(tokens) - N_GRAM + 1):
+        minhash.update("".join(tokens[i : i + N_GRAM]).encode("utf-8"))
+    return minhash.hashvalues
+
+
+class TestMinhash(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        load_dict(NEWMM_DICT, "newmm")
+
+    def test_batch_matches_datasketch(self):
+        for num_perm in (64, 128):
+            signatures = generate_minhash_signatures_batch(texts, num_perm)
+            self.assertEqual(signatures.shape, (len(texts), num_perm))
+            for text, hashvalues in zip(texts, signatures):
+                np.testing.assert_array_equal(
+                    hashvalues, reference_hashvalues(text, num_perm)
+                )
+
+    def test_single_signature(self):
+        minhash = generate_minhash_signature(texts[0], 128)
+        np.testing.assert_array_equal(
+            minhash.hashvalues, reference_hashvalues(texts[0], 128)
+        )
+
+    def test_hf_batched_map(self):
+        dataset = Dataset.from_dict({"text": texts})
+        signatures = dataset.map(
+            lambda x: generate_minhash_signature_hf(x, 128), batched=True
+        )
+        for text, hashvalues in zip(texts, signatures["hashvalues"]):
+            np.testing.assert_array_equal(
+                np.array(hashvalues, dtype=np.uint64),
+                reference_hashvalues(text, 128),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,12 +4,28 @@ from testcases.mc4_testcases import (
     CLEAN_DATASET_TEST_CASES,
 )
 
+from data_processing.pattern_filtering import pattern
 from data_processing.pattern_filtering.pattern import (
     clean_with_remove_document,
+    check_remove_document,
+    clean_lines,
+    common_prefix_length,
     clean_text,
     clean_dataset,
+    CLEAN_TEXT_RULES,
+    CLEAN_TEXT_ENGINE,
 )
 
+from data_processing.pattern_filtering.words_pattern import (
+    WORD_MATCHER,
+    GAMBLE_RE,
+    PORN_RE,
+    FOOTBALL_RE,
+    SALE_RE,
+    SCRIPT_RE,
+)
+from data_processing.pattern_filtering.keyword_matcher import KeywordMatcher
+
 from utils_test import compare_dataset
 
 import copy
@@ -33,5 +49,74 @@ class TestPattern(unittest.TestCase):
             test_case = copy.deepcopy(test_case)
             compare_dataset(clean_dataset(test_case["dataset"]), test_case["new_dataset"])
 
+
+    def test_rule_engine_matches_sequential_sub(self):
+        # Skipping rules must never change the result of applying every rule in turn
+        for test_case in CLEAN_TEXT_TEST_CASES + DOCUMENT_REMOVE_TEST_CASES:
+            expected = test_case["doc"]
+            for rule in CLEAN_TEXT_RULES:
+                expected = rule.regex.sub(rule.repl, expected)
+            assert CLEAN_TEXT_ENGINE.sub(test_case["doc"]) == expected
+
+
+    def test_clean_lines(self):
+        assert common_prefix_length("menu | home | news", "menu | home | blog") == 14
+        assert common_prefix_length("abc", "xbc") == 0
+        text = "  Menu  | Home | First article title\n  Menu  | Home | Second article title\n\n \t \nshort\n"
+        assert clean_lines(text, 10) == "Menu | Home | First article title\nSecond article title"
+        assert clean_lines(text + "  \t  ", 3) == "Menu | Home | First article title\nSecond article title\nshort\n"
+        assert clean_lines("", 0) == ""
+
+
+    def test_keyword_matcher_matches_findall(self):
+        patterns = {
+            "GAMBLE": GAMBLE_RE,
+            "PORN": PORN_RE,
+            "FOOTBALL": FOOTBALL_RE,
+            "SALE": SALE_RE,
+            "SCRIPT": SCRIPT_RE,
+        }
+        for test_case in CLEAN_TEXT_TEST_CASES + DOCUMENT_REMOVE_TEST_CASES:
+            counts = WORD_MATCHER.count(test_case["doc"])
+            for key, regex in patterns.items():
+                assert counts[key] == len(regex.findall(test_case["doc"]))
+
+
+    def test_keyword_matcher_leftmost_first(self):
+        matcher = KeywordMatcher()
+        matcher.add_words("A", ["ab", "abc", "bcd", "c"])
+        # Like findall: "ab" wins at 0, then "c" at 2; "bcd" overlaps "ab"
+        assert matcher.count("abcd") == {"A": 2}
+        matcher.add("B", "var", boundary_start=True, boundary_end=True)
+        assert matcher.count("var x; avar; var_1; (var)") == {"A": 0, "B": 2}
+
+
+    def test_keyword_matcher_first_to_reach(self):
+        matcher = KeywordMatcher()
+        matcher.add_words("A", ["abcdef", "bc", "de"])
+        # "bc" and "de" lie inside the longer "abcdef", findall counts one match
+        assert matcher.count("abcdef") == {"A": 1}
+        assert matcher.first_to_reach("abcdef", {"A": 2}) is None
+        assert matcher.first_to_reach("abcdef bc", {"A": 2}) == ("A", 7, 9)
+        assert matcher.first_to_reach("abcdef", {}) is None
+
+
+    def test_remove_verdict(self):
+        for test_case in DOCUMENT_REMOVE_TEST_CASES:
+            verdict = check_remove_document(test_case["doc"])
+            assert (verdict is not None) == test_case["remove"]
+            if verdict is not None:
+                assert 0 <= verdict.offset < len(test_case["doc"])
+
+
+    def test_remove_debug_hook(self):
+        calls = []
+        pattern.REMOVE_DEBUG_HOOK = lambda text, verdict: calls.append((text, verdict))
+        try:
+            verdict = check_remove_document(DOCUMENT_REMOVE_TEST_CASES[0]["doc"])
+        finally:
+            pattern.REMOVE_DEBUG_HOOK = None
+        assert calls == [(DOCUMENT_REMOVE_TEST_CASES[0]["doc"], verdict)]
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
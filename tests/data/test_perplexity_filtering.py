@@ -1,6 +1,11 @@
 from data_processing.perplexity_filtering.perplexity import (
-    classify_spam
+    classify_spam,
+    classify_spam_batch,
+    get_classifier,
+    get_classifier_lookup,
+    get_language_model,
 )
+import numpy as np
 import pandas as pd
 from datasets import Dataset
 import unittest
@@ -57,6 +62,40 @@ class TestPerplexity(unittest.TestCase):
             print(prediction.item(), log_pp_score)
             assert prediction == text["is_spam"]
 
+    def test_score_batch(self):
+        lm = get_language_model()
+        documents = [text["doc"].split("\n") for text in sample]
+        scores = lm.score_batch(documents)
+        assert scores.tolist() == [lm.do(document) for document in documents]
+
+    def test_classify_spam_batch(self):
+        texts = [text["doc"] for text in sample]
+        predictions, log_pp_scores = classify_spam_batch(texts)
+        for i, text in enumerate(texts):
+            prediction, log_pp_score = classify_spam(text)
+            assert predictions[i] == prediction.item()
+            assert log_pp_scores[i] == log_pp_score
+
+    def test_classifier_lookup(self):
+        classifier = get_classifier()
+        # A grid of log scores, plus every split threshold and its neighbours in float32
+        thresholds = classifier.tree_.threshold[classifier.tree_.children_left != -1]
+        thresholds32 = thresholds.astype(np.float32)
+        scores = np.concatenate(
+            [
+                np.linspace(-5, 40, 10001),
+                thresholds,
+                np.nextafter(thresholds32, np.float32(np.inf)).astype(np.float64),
+                np.nextafter(thresholds32, np.float32(-np.inf)).astype(np.float64),
+            ]
+        )
+        expected = classifier.predict_proba(pd.DataFrame({"log_score": scores}))
+        assert (get_classifier_lookup().predict_proba(scores) == expected).all()
+
+    def test_models_are_loaded_once(self):
+        assert get_language_model() is get_language_model()
+        assert get_classifier_lookup() is get_classifier_lookup()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,348 @@
+import json
+import os
+import tempfile
+import unittest
+from functools import partial
+from types import SimpleNamespace
+
+import numpy as np
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard as zstd
+from datasets import Dataset, DatasetDict
+from nlpo3 import load_dict
+
+from data_processing.core.minhash import generate_minhash_signatures_batch
+from data_processing.decontamination.ngram_overlap import tokenize_with_offsets
+from data_processing.pipeline import (
+    MANIFEST_FILE,
+    ShardWriter,
+    add_row_ids,
+    chunk_keep_mask,
+    filter_fields,
+    iter_dataset_chunks,
+    process_chunk,
+    process_fused_chunk,
+    read_jsonl_zst_files,
+    run_pipeline,
+    stream_chunks,
+    write_shards,
+)
+
+NEWMM_DICT = os.path.join(
+    os.path.dirname(__file__),
+    "../../src/data_processing/deduplication/words_th.txt",
+)
+
+THAI_TEXTS = [
+    "ในสวนผลไม้แห่งนี้ มีต้นไม้นานาพันธุ์ที่ออกผลสุกงอมในทุกฤดูกาล เราสามารถเก็บเกี่ยวผลไม้สดใหม่จากธรรมชาติได้ตลอดทั้งปี",
+    "หนังสือเล่มนี้ได้พรรณนาเรื่องราวชีวิตของนักเดินทางผู้กล้าหาญที่ได้ผจญภัยข้ามพรมแดนไปยังดินแดนห่างไกล",
+    "ในยามเช้าที่สดใส พร้อมแสงอรุณอันงดงามของดวงอาทิตย์ ฉันรู้สึกได้ถึงพลังสดชื่นและความหวังใหม่ที่จะเติมเต็มวันนี้",
+]
+
+
+def clean_text(text):
+    # Blank out the texts marked as garbage, strip the others
+    return "" if text.startswith("garbage") else text.strip()
+
+
+def process_test_chunk(chunk):
+    return process_chunk(chunk, clean_text)
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_process_chunk(self):
+        chunk = pa.table(
+            {
+                "text": ["keep", "garbage 1", " strip ", "", "keep too"],
+                "source_id": [0, 1, 2, 3, 4],
+            }
+        )
+        result = process_chunk(chunk, clean_text)
+
+        self.assertIsInstance(result, pa.Table)
+        self.assertEqual(result.column("text").to_pylist(), ["keep", "strip", "keep too"])
+        self.assertEqual(result.column("source_id").to_pylist(), [0, 2, 4])
+        self.assertEqual(result.column("prediction").to_pylist(), [0, 0, 0])
+        updated_dates = result.column("updated_date").to_pylist()
+        self.assertEqual(updated_dates[0], "None")
+        self.assertNotEqual(updated_dates[1], "None")
+
+    def test_process_chunk_map(self):
+        dataset = Dataset.from_dict(
+            {"text": ["keep", "garbage", "keep too"], "source_id": [0, 1, 2]}
+        )
+        result = dataset.with_format("arrow").map(
+            lambda chunk: process_chunk(chunk, clean_text), batched=True, batch_size=2
+        ).with_format(None)
+
+        self.assertEqual(result["text"], ["keep", "keep too"])
+        self.assertEqual(result["source_id"], [0, 2])
+
+    def test_keep_mask_samples_spam_back(self):
+        predictions = np.array([0, 1, -1, 1, 1, 0, 1])
+        log_pp_scores = np.array([1.0, 5.0, 0.0, 6.0, 7.0, 2.0, 8.0])
+
+        keep_mask = chunk_keep_mask(predictions, log_pp_scores)
+        self.assertEqual(keep_mask.tolist(), [True, False, False, False, False, True, False])
+
+        # Half of the 4 spam rows are sampled back, blank rows never are
+        keep_mask = chunk_keep_mask(predictions, log_pp_scores, sampled_back_ratio=0.5)
+        self.assertEqual(int(keep_mask[[1, 3, 4, 6]].sum()), 2)
+        self.assertTrue(keep_mask[[0, 5]].all())
+        self.assertFalse(keep_mask[2])
+
+    def test_filter_fields(self):
+        table = pa.table(
+            {
+                "text": ["a", "b"],
+                "timestamp": ["2019-01-01", "2019-01-02"],
+                "url": ["http://a", "http://b"],
+                "prediction": [0, 1],
+                "log_pp_score": [1.0, 2.0],
+                "updated_date": ["None", "2024-01-01"],
+            }
+        )
+        rows = filter_fields(table, "mc4", "/input/1").to_pylist()
+
+        self.assertEqual(
+            rows[0],
+            {
+                "text": "a",
+                "updated_date": "2019-01-01",
+                "source": "mc4",
+                "created_date": "2019-01-01",
+                "meta": str({"filename": "/input/1", "url": "http://a"}),
+            },
+        )
+        self.assertEqual(rows[1]["updated_date"], "2024-01-01")
+
+    def test_write_shards(self):
+        num_rows = 103
+        dataset = Dataset.from_dict(
+            {
+                "text": [f"doc {i}" for i in range(num_rows)],
+                "source_id": list(range(num_rows)),
+                "prediction": [0] * num_rows,
+                "log_pp_score": [0.0] * num_rows,
+                "updated_date": ["None"] * num_rows,
+            }
+        )
+        transform = partial(filter_fields, source="cc100", filename="/input/1")
+
+        for output_format in ("jsonl.zst", "parquet"):
+            with tempfile.TemporaryDirectory() as output_dir:
+                manifest = write_shards(
+                    dataset, [output_dir], num_proc=2, num_shards=4, output_format=output_format, transform=transform
+                )
+                with open(os.path.join(output_dir, MANIFEST_FILE)) as file:
+                    self.assertEqual(json.load(file), manifest)
+                self.assertEqual(manifest["num_rows"], num_rows)
+                self.assertEqual(manifest["shards"][0]["file"], f"data-00000-of-00004.{output_format}")
+
+                # The shards are contiguous slices, in order
+                rows = []
+                for shard in manifest["shards"]:
+                    path = os.path.join(output_dir, shard["file"])
+                    if output_format == "parquet":
+                        shard_rows = pq.read_table(path).to_pylist()
+                    else:
+                        with zstd.open(path, "rt", encoding="utf-8") as file:
+                            shard_rows = [orjson.loads(line) for line in file]
+                    self.assertEqual(len(shard_rows), shard["num_rows"])
+                    rows.extend(shard_rows)
+                self.assertEqual([row["source_id"] for row in rows], list(range(num_rows)))
+                self.assertEqual(rows[0]["created_date"], "2020-10-23T23:31:11.000Z")
+
+    def test_read_jsonl_zst_files(self):
+        with tempfile.TemporaryDirectory() as root:
+            data_dir = os.path.join(root, "data")
+            for folder, num_rows in (("2301", 3), ("2302", 2)):
+                os.makedirs(os.path.join(data_dir, folder, "th_meta"))
+                path = os.path.join(data_dir, folder, "th_meta", "th_part_1.jsonl.zst")
+                with zstd.open(path, "wt", encoding="utf-8") as file:
+                    for i in range(num_rows):
+                        item = {
+                            "content": f"{folder} doc {i}",
+                            "warc_headers": {"warc-date": "2023-01-01", "warc-target-uri": f"http://x/{i}"},
+                            "metadata": {"quality_warnings": None},
+                        }
+                        file.write(json.dumps(item) + "\n")
+
+            cache_dir = os.path.join(root, "ingest")
+            dataset = read_jsonl_zst_files(data_dir, cache_dir, num_proc=2)
+
+            self.assertEqual(len(dataset), 5)
+            self.assertEqual(dataset[0]["source"], "oscar_colossal_2301")
+            self.assertEqual(dataset[4]["source_id"], "1")
+            self.assertEqual(dataset[0]["meta"], str({"url": "http://x/0", "quality_warnings": None}))
+
+            # A converted file is not read again, only the missing one is
+            converted = sorted(os.listdir(cache_dir))
+            os.remove(os.path.join(cache_dir, converted[1]))
+            mtime = os.path.getmtime(os.path.join(cache_dir, converted[0]))
+            dataset = read_jsonl_zst_files(data_dir, cache_dir, num_proc=2)
+
+            self.assertEqual(len(dataset), 5)
+            self.assertEqual(os.path.getmtime(os.path.join(cache_dir, converted[0])), mtime)
+
+    def test_add_row_ids(self):
+        dataset = Dataset.from_dict({"text": [f"doc {i}" for i in range(7)]})
+        chunks = list(add_row_ids(iter_dataset_chunks(dataset, batch_size=3)))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 1])
+        self.assertEqual(pa.concat_tables(chunks).column("source_id").to_pylist(), list(range(7)))
+
+    def test_stream_chunks(self):
+        num_rows = 25
+        texts = [f"garbage {i}" if i % 5 == 0 else f"doc {i}" for i in range(num_rows)]
+        dataset = Dataset.from_dict({"text": texts})
+
+        for output_format in ("jsonl.zst", "parquet"):
+            with tempfile.TemporaryDirectory() as root:
+                output_dirs = [os.path.join(root, "a"), os.path.join(root, "b")]
+                chunks = add_row_ids(iter_dataset_chunks(dataset, batch_size=4))
+                writer = ShardWriter(output_dirs, output_format, rows_per_shard=7)
+                manifest = stream_chunks(chunks, process_test_chunk, writer, num_proc=2, max_pending=3)
+
+                # 20 rows are kept, in shards of 7 rows copied to every output directory
+                self.assertEqual(manifest["num_rows"], 20)
+                self.assertEqual([shard["num_rows"] for shard in manifest["shards"]], [7, 7, 6])
+                self.assertEqual(manifest["shards"][0]["file"], f"data-00000.{output_format}")
+                for output_dir in output_dirs:
+                    with open(os.path.join(output_dir, MANIFEST_FILE)) as file:
+                        self.assertEqual(json.load(file), manifest)
+
+                # The results are written in input order
+                rows = []
+                for shard in manifest["shards"]:
+                    path = os.path.join(output_dirs[1], shard["file"])
+                    if output_format == "parquet":
+                        rows.extend(pq.read_table(path).to_pylist())
+                    else:
+                        with zstd.open(path, "rt", encoding="utf-8") as file:
+                            rows.extend(orjson.loads(line) for line in file)
+                self.assertEqual([row["source_id"] for row in rows], [i for i in range(num_rows) if i % 5])
+
+
+    def test_process_fused_chunk(self):
+        load_dict(NEWMM_DICT, "newmm")
+        chunk = pa.table(
+            {
+                "text": [THAI_TEXTS[0], "garbage", f" {THAI_TEXTS[1]} "],
+                "source_id": [0, 1, 2],
+            }
+        )
+        result = process_fused_chunk(chunk, clean_text, source="cc100", filename="input", num_perm=64)
+        expected = filter_fields(process_chunk(chunk, clean_text), source="cc100", filename="input")
+
+        # The output fields of the kept rows, with the signatures of the cleaned texts
+        self.assertEqual(result.drop(["hashvalues", "updated_date"]), expected.drop(["updated_date"]))
+        self.assertEqual(result.schema.field("hashvalues").type, pa.list_(pa.uint64()))
+        np.testing.assert_array_equal(
+            np.array(result.column("hashvalues").to_pylist(), dtype=np.uint64),
+            generate_minhash_signatures_batch(THAI_TEXTS[:2], 64),
+        )
+
+    def test_run_pipeline(self):
+        load_dict(NEWMM_DICT, "newmm")
+        texts = [THAI_TEXTS[0], THAI_TEXTS[1], "garbage", THAI_TEXTS[0], THAI_TEXTS[2], f" {THAI_TEXTS[1]}"]
+
+        with tempfile.TemporaryDirectory() as root:
+            input_path = os.path.join(root, "input")
+            DatasetDict({"train": Dataset.from_dict({"text": texts})}).save_to_disk(input_path)
+
+            manifest = run_pipeline(
+                clean_text,
+                SimpleNamespace(path_name=input_path, split="train", col_name="text"),
+                SimpleNamespace(source="cc100", batch_size=4, do_perplexity=False, sampled_back_ratio=0.0),
+                SimpleNamespace(newmm_dict=NEWMM_DICT),
+                SimpleNamespace(
+                    thresold=0.9,
+                    index_path=os.path.join(root, "index"),
+                    save_path_duplicated=os.path.join(root, "duplicated"),
+                    batch_size=4,
+                    mode="cluster",
+                    keep_rule="lowest_id",
+                ),
+                SimpleNamespace(path=os.path.join(root, "output"), num_shards=2, output_format="parquet"),
+                SimpleNamespace(num_process=1, num_perm=128, checkpoint_path=None),
+            )
+
+            # The garbage text is dropped by the fused map and the copies by deduplication
+            self.assertEqual(manifest["num_rows"], 3)
+            rows = []
+            for shard in manifest["shards"]:
+                rows.extend(pq.read_table(os.path.join(root, "output", shard["file"])).to_pylist())
+            self.assertEqual([row["source_id"] for row in rows], [0, 1, 4])
+            self.assertEqual([row["text"] for row in rows], THAI_TEXTS)
+            self.assertNotIn("hashvalues", rows[0])
+
+    def test_run_pipeline_anonymizes_after_decontamination(self):
+        load_dict(NEWMM_DICT, "newmm")
+        premise = "สมชาย ใจดี เดินทางไปเชียงใหม่เมื่อวานนี้"
+        hypothesis = "สมชาย ใจดี อยู่ที่เชียงใหม่"
+        item = f"{premise} {hypothesis}"
+        texts = [
+            f"{THAI_TEXTS[0]} โทรหาเราได้ที่ 0890340123",
+            f"{THAI_TEXTS[1]} {item} {THAI_TEXTS[2]}",
+        ]
+
+        with tempfile.TemporaryDirectory() as root:
+            input_path = os.path.join(root, "input")
+            DatasetDict({"train": Dataset.from_dict({"text": texts})}).save_to_disk(input_path)
+            benchmark_path = os.path.join(root, "benchmark")
+            DatasetDict(
+                {"test": Dataset.from_dict({"premise": [premise], "hypothesis": [hypothesis]})}
+            ).save_to_disk(benchmark_path)
+
+            # The decontamination reports are written to the working directory
+            cwd = os.getcwd()
+            os.chdir(root)
+            self.addCleanup(os.chdir, cwd)
+
+            signature_path = os.path.join(root, "signatures")
+            manifest = run_pipeline(
+                clean_text,
+                SimpleNamespace(path_name=input_path, split="train", col_name="text"),
+                SimpleNamespace(source="cc100", batch_size=4, do_perplexity=False, sampled_back_ratio=0.0),
+                SimpleNamespace(newmm_dict=NEWMM_DICT, signature_path=signature_path),
+                SimpleNamespace(
+                    thresold=0.9,
+                    index_path=os.path.join(root, "index"),
+                    save_path_duplicated=os.path.join(root, "duplicated"),
+                    batch_size=4,
+                    mode="cluster",
+                    keep_rule="lowest_id",
+                ),
+                SimpleNamespace(path=os.path.join(root, "output"), num_shards=1, output_format="parquet"),
+                SimpleNamespace(num_process=1, num_perm=128, checkpoint_path=None),
+                dataset_groups={
+                    "rte_thai": SimpleNamespace(
+                        name="rte_thai", available_on_hub=False, path_name=benchmark_path, subset=None, split="test")
+                },
+                decontaminate_args=SimpleNamespace(
+                    thresold=0.3,
+                    signature_path=signature_path,
+                    index_path=os.path.join(root, "benchmark_index"),
+                    batch_size=4,
+                    # A single n-gram spans the whole benchmark item, it only matches while the name is intact
+                    ngram_size=len(tokenize_with_offsets(item)[0]),
+                    min_ngram_overlap=1,
+                    ngram_index_path=os.path.join(root, "ngram_index"),
+                ),
+                blind_config=SimpleNamespace(ner_corpus="thainer", batch_size=4),
+            )
+
+            # The benchmark span is found before its name is anonymized, and the kept row is anonymized
+            self.assertEqual(manifest["num_rows"], 1)
+            rows = pq.read_table(os.path.join(root, "output", manifest["shards"][0]["file"])).to_pylist()
+            self.assertEqual(rows[0]["source_id"], 0)
+            self.assertIn("<phone_number>", rows[0]["text"])
+            self.assertNotIn("__ner__", rows[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from datasets import Dataset
+
+from data_processing.core.selection import build_keep_mask, read_id_column, select_rows
+
+
+class TestSelection(unittest.TestCase):
+
+    def test_keep_mask_matches_set_filter(self):
+        dataset = Dataset.from_dict({"text": [f"doc {i}" for i in range(10)]})
+        remove_ids = [7, 2, 2, 5]
+
+        expected = dataset.filter(lambda _, idx: idx not in set(remove_ids), with_indices=True)
+        result = select_rows(dataset, build_keep_mask(len(dataset), remove_ids))
+
+        self.assertEqual(result["text"], expected["text"])
+
+    def test_read_id_column(self):
+        dataset = Dataset.from_dict(
+            {"idx": ["3", "1", "4", "8"], "keep": [False, True, False, True]}
+        )
+
+        self.assertEqual(read_id_column(dataset, "idx", batch_size=3).tolist(), [3, 1, 4, 8])
+        self.assertEqual(
+            read_id_column(dataset, "idx", batch_size=3, where="keep").tolist(), [3, 4]
+        )
+
+    def test_read_id_column_empty(self):
+        # An empty map output has no columns
+        self.assertEqual(read_id_column(Dataset.from_dict({}), "idx", batch_size=3).tolist(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+from datasets import Dataset, DatasetDict
+from nlpo3 import load_dict
+
+from data_processing.core.token_cache import dictionary_version
+from data_processing.decontamination.generate_minhash import generate_benchmark_signatures
+from data_processing.decontamination.signature_store import (
+    get_store_path,
+    hash_texts,
+    is_store_current,
+    load_signature_store,
+    load_store_meta,
+    save_signature_store,
+)
+
+NEWMM_DICT = os.path.join(
+    os.path.dirname(__file__),
+    "../../src/data_processing/deduplication/words_th.txt",
+)
+
+
+class TestSignatureStore(unittest.TestCase):
+
+    def test_round_trip_and_reuse(self):
+        texts = ["ข้อความแรก", "ข้อความที่สอง"]
+        hashvalues = np.arange(2 * 16, dtype=np.uint64).reshape(2, 16)
+        source_hash = hash_texts(texts)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store_path = os.path.join(tmpdir, "bench_test_16")
+            self.assertFalse(is_store_current(store_path, 16, source_hash, "dict"))
+
+            save_signature_store(
+                Dataset.from_dict({"text": texts, "hashvalues": hashvalues}),
+                store_path,
+                16,
+                source_hash,
+                "dict",
+            )
+            self.assertTrue(is_store_current(store_path, 16, source_hash, "dict"))
+            self.assertFalse(is_store_current(store_path, 32, source_hash, "dict"))
+            self.assertFalse(is_store_current(store_path, 16, hash_texts(texts[:1]), "dict"))
+            self.assertFalse(is_store_current(store_path, 16, source_hash, "other dict"))
+
+            signatures = load_signature_store(store_path)
+            self.assertEqual(signatures["text"], texts)
+            np.testing.assert_array_equal(
+                np.asarray(signatures.with_format("numpy")["hashvalues"]), hashvalues
+            )
+
+    def test_new_dictionary_regenerates(self):
+        context = "นักเรียนต้องส่งการบ้านวิชาคณิตศาสตร์ภายในวันศุกร์นี้ และครูจะตรวจการบ้านในวันจันทร์"
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bench_path = os.path.join(tmpdir, "bench")
+            DatasetDict({"validation": Dataset.from_dict({"context": [context]})}).save_to_disk(bench_path)
+            dataset_groups = {
+                "xquad": SimpleNamespace(name="xquad", available_on_hub=False, path_name=bench_path, split="validation"),
+            }
+            global_config = SimpleNamespace(num_perm=16, num_process=1)
+            store_path = get_store_path(tmpdir, "xquad", "validation", 16)
+
+            # A copy of the dictionary with one more word
+            new_dict = os.path.join(tmpdir, "words_th.txt")
+            shutil.copyfile(NEWMM_DICT, new_dict)
+            with open(new_dict, "a", encoding="utf-8") as file:
+                file.write("\nการบ้านวิชาคณิตศาสตร์\n")
+
+            load_dict(NEWMM_DICT, "newmm")
+            generate_benchmark_signatures(
+                dataset_groups, SimpleNamespace(newmm_dict=NEWMM_DICT, signature_path=tmpdir), global_config)
+            source_hash = load_store_meta(store_path)["source_hash"]
+            self.assertTrue(is_store_current(store_path, 16, source_hash, dictionary_version(NEWMM_DICT)))
+
+            # The same benchmark with another dictionary is signed again, not reused
+            self.assertFalse(is_store_current(store_path, 16, source_hash, dictionary_version(new_dict)))
+            generate_benchmark_signatures(
+                dataset_groups, SimpleNamespace(newmm_dict=new_dict, signature_path=tmpdir), global_config)
+            self.assertEqual(load_store_meta(store_path)["dict_version"], dictionary_version(new_dict))
+            self.assertTrue(is_store_current(store_path, 16, source_hash, dictionary_version(new_dict)))
+
+    def test_missing_store(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(FileNotFoundError):
+                load_signature_store(os.path.join(tmpdir, "missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
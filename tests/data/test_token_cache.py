@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from datasets import Dataset
+from nlpo3 import load_dict, segment
+
+from data_processing.core.minhash import generate_minhash_signature_hf
+from data_processing.core.token_cache import (
+    build_token_cache,
+    is_token_cache_current,
+    load_token_cache,
+    segment_texts,
+)
+
+NEWMM_DICT = os.path.join(
+    os.path.dirname(__file__),
+    "../../src/data_processing/deduplication/words_th.txt",
+)
+
+texts = [
+    "สวัสดีจ๊ะ! วันนี้ขายส้มโอนะคะ ส้มโอสดป้ายแดง อร่อยมากค่า",
+    "ในยามเช้าที่สดใส พร้อมแสงอรุณอันงดงามของดวงอาทิตย์",
+    "",
+    "Hello world, ภาษาไทยปนภาษาอังกฤษ 123",
+]
+
+
+class TestTokenCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        load_dict(NEWMM_DICT, "newmm")
+
+    def test_cached_tokens_match_segment(self):
+        with tempfile.TemporaryDirectory() as cache_path:
+            build_token_cache(Dataset.from_dict({"text": texts}), "text", cache_path, "v1", num_proc=None)
+            self.assertTrue(is_token_cache_current(cache_path, "v1"))
+            self.assertFalse(is_token_cache_current(cache_path, "v2"))
+
+            # Reordered subset plus a text that was never cached
+            queries = [texts[3], "ข้อความใหม่ที่ไม่มีในแคช", texts[0], texts[2]]
+            self.assertEqual(len(load_token_cache(cache_path)), len(texts))
+            self.assertEqual(
+                load_token_cache(cache_path).lookup(np.zeros(1, dtype=np.uint64)).tolist(), [-1]
+            )
+            self.assertEqual(
+                segment_texts(queries, cache_path),
+                [segment(text, "newmm") for text in queries],
+            )
+
+            batch = {"text": queries}
+            np.testing.assert_array_equal(
+                np.asarray(generate_minhash_signature_hf(batch, 64, token_cache_path=cache_path)["hashvalues"]),
+                np.asarray(generate_minhash_signature_hf(batch, 64)["hashvalues"]),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()